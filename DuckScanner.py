@@ -4,20 +4,25 @@ DuckScanner - Advanced Network Scanner 🦆
 A comprehensive network scanning tool with modern GUI
 """
 
+from startup import STARTUP
 import tkinter as tk
 from tkinter import ttk, scrolledtext, messagebox, filedialog
 import socket
 import threading
 import time
-import json
-import csv
-import subprocess
-import platform
-import ipaddress
-from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
 import os
 import sys
+from exclusions import build_exclusions
+from scan_engine import (ConnectProber, ProbeScheduler, OPEN, CLOSED, ERROR, QUEUE_DEPTH,
+                         resolve_target, grab_banner)
+from transport import default_transport
+from result_cache import shared_cache
+from progress import ProgressTracker, format_duration, format_progress
+from result_set import ResultSet
+# Discovery, export, job, planning, history and metrics-endpoint modules are imported where they are first used
+
+STARTUP.mark('imports')
 
 class DuckScanner:
     def __init__(self, root):
@@ -33,9 +38,41 @@ class DuckScanner:
         self.threads_var = tk.IntVar(value=100)
         self.timeout_var = tk.DoubleVar(value=1.0)
         self.scan_type_var = tk.StringVar(value="TCP Connect")
+        self.exclude_var = tk.StringVar()
+        self.exclude_file_var = tk.StringVar()
+        self.use_cache_var = tk.BooleanVar(value=True)
+        self.cache_ttl_var = tk.IntVar(value=300)
+        self.seed_cache_var = tk.BooleanVar(value=True)
+        self.metrics_endpoint_var = tk.BooleanVar(value=False)
+        self.metrics_server = None
+        self.profile_scans_var = tk.BooleanVar(value=False)
+        self.profile_memory_var = tk.BooleanVar(value=False)
+        self.learn_network_var = tk.BooleanVar(value=False)
+        self.skip_dead_var = tk.BooleanVar(value=False)
+        self.skip_dead_ports_var = tk.IntVar(value=5)
+        self.retries_var = tk.IntVar(value=1)
+        self.run_checks_var = tk.BooleanVar(value=True)
+        self.job_budget_var = tk.IntVar(value=500)
+        self.profiler = None
+        # Scans, sweeps and detections all draw on one in-flight budget; see get_job_manager()
+        self.job_manager = None
+        self.scan_job = None
+        self.jobs_tree = None
+        # Live hosts per swept network, traced by Map Paths
+        self.swept_hosts = {}
+        self.trace_job = None
         self.is_scanning = False
-        self.scan_results = []
-        self.scan_history = []
+        self.prober = None
+        self.scan_family = socket.AF_INET
+        self.scan_address = None
+        self.scan_results = ResultSet()
+        self.scan_progress = None
+        # In memory from first paint until the file has been read; history_loaded() swaps in the file-backed store
+        self.scan_history = None
+        self.history_ready = False
+        self.history_listbox = None
+        self.history_frame = None
+        self.startup_report = False
         
         # Service database
         self.services = {
@@ -49,7 +86,9 @@ class DuckScanner:
         }
         
         self.setup_ui()
-        self.load_scan_history()
+        STARTUP.mark('window built')
+        # History is read after the window is on screen
+        self.root.after_idle(self.first_paint)
         
     def setup_ui(self):
         """Setup the modern user interface"""
@@ -116,21 +155,35 @@ class DuckScanner:
         # Port Scanner Tab
         self.create_port_scanner_tab()
         
-        # Network Discovery Tab
-        self.create_network_discovery_tab()
-        
-        # Service Detection Tab
-        self.create_service_detection_tab()
-        
-        # Scan History Tab
-        self.create_scan_history_tab()
-        
-        # Settings Tab
-        self.create_settings_tab()
+        # The other tabs are built the first time they are selected
+        self.tab_builders = {}
+        self.add_lazy_tab("🌐 Network Discovery", self.create_network_discovery_tab)
+        self.add_lazy_tab("🔧 Service Detection", self.create_service_detection_tab)
+        self.add_lazy_tab("📚 Scan History", self.create_scan_history_tab)
+        self.add_lazy_tab("📋 Jobs", self.create_jobs_tab)
+        self.add_lazy_tab("⚙️ Settings", self.create_settings_tab)
+        self.notebook.bind('<<NotebookTabChanged>>', self.on_tab_changed)
         
         # Status bar
         self.create_status_bar()
         
+    def add_lazy_tab(self, text, builder):
+        """Add an empty tab whose contents are built on first selection"""
+        frame = ttk.Frame(self.notebook)
+        self.notebook.add(frame, text=text)
+        self.tab_builders[str(frame)] = (builder, frame)
+    
+    def on_tab_changed(self, event):
+        """Build the selected tab if this is its first selection"""
+        self.build_tab(self.notebook.select())
+    
+    def build_tab(self, tab_id):
+        """Build a lazy tab's contents if they do not exist yet"""
+        entry = self.tab_builders.pop(str(tab_id), None)
+        if entry:
+            builder, frame = entry
+            builder(frame)
+    
     def create_port_scanner_tab(self):
         """Create the main port scanner tab"""
         port_frame = ttk.Frame(self.notebook)
@@ -202,6 +255,24 @@ class DuckScanner:
                                    highlightcolor=self.colors['accent'])
         timeout_spinbox.grid(row=1, column=1, padx=10, pady=8)
         
+        # Exclusions
+        tk.Label(advanced_frame, text="🚫 Exclude:", font=('Segoe UI', 9, 'bold'), 
+                bg=self.colors['bg_primary'], fg=self.colors['text_primary']).grid(row=2, column=0, sticky='w', padx=10, pady=8)
+        exclude_entry = tk.Entry(advanced_frame, textvariable=self.exclude_var, width=14,
+                               bg=self.colors['bg_secondary'], fg=self.colors['text_primary'],
+                               font=('Segoe UI', 9), insertbackground=self.colors['text_primary'],
+                               relief='solid', bd=1, highlightthickness=1,
+                               highlightcolor=self.colors['accent'])
+        exclude_entry.grid(row=2, column=1, padx=10, pady=8)
+        
+        exclude_file_button = tk.Button(advanced_frame, text="📂 Exclude File", 
+                                      command=self.choose_exclude_file, bg=self.colors['bg_secondary'],
+                                      fg=self.colors['text_primary'], font=('Segoe UI', 9),
+                                      relief='solid', bd=1, activebackground=self.colors['bg_tertiary'])
+        exclude_file_button.grid(row=3, column=0, sticky='w', padx=10, pady=8)
+        tk.Label(advanced_frame, textvariable=self.exclude_file_var, font=('Segoe UI', 8), width=14,
+                bg=self.colors['bg_primary'], fg=self.colors['text_secondary'], anchor='w').grid(row=3, column=1, padx=10, pady=8)
+        
         # Preset buttons
         presets_frame = tk.LabelFrame(left_panel, text="⚡ Quick Presets", 
                                     font=('Segoe UI', 10, 'bold'), bg=self.colors['bg_tertiary'], 
@@ -247,6 +318,12 @@ class DuckScanner:
                                 relief='raised', bd=2, activebackground=self.colors['accent_hover'])
         export_button.pack(side='left', padx=5)
         
+        estimate_button = tk.Button(control_frame, text="🧮 Estimate",
+                                  command=self.estimate_scan, bg=self.colors['accent'], fg='#ffffff',
+                                  font=('Segoe UI', 10, 'bold'), padx=20, pady=8,
+                                  relief='raised', bd=2, activebackground=self.colors['accent_hover'])
+        estimate_button.pack(side='left', padx=5)
+        
         # Right panel - Results
         right_panel = tk.Frame(port_frame, bg=self.colors['bg_primary'])
         right_panel.pack(side='right', fill='both', expand=True)
@@ -266,7 +343,7 @@ class DuckScanner:
                                 fg=self.colors['accent'])
         progress_label.pack(side='right', padx=15, pady=15)
         
-        self.progress_bar = ttk.Progressbar(right_panel, mode='indeterminate', 
+        self.progress_bar = ttk.Progressbar(right_panel, mode='determinate', maximum=100,
                                           style='TProgressbar')
         self.progress_bar.pack(fill='x', pady=(0, 10))
         
@@ -286,11 +363,8 @@ class DuckScanner:
         self.results_text.tag_configure("info", foreground=self.colors['accent'], font=('Consolas', 11))
         self.results_text.tag_configure("success", foreground=self.colors['success'], font=('Consolas', 11, 'bold'))
         
-    def create_network_discovery_tab(self):
+    def create_network_discovery_tab(self, discovery_frame):
         """Create network discovery tab"""
-        discovery_frame = ttk.Frame(self.notebook)
-        self.notebook.add(discovery_frame, text="🌐 Network Discovery")
-        
         # Network range input
         range_frame = tk.LabelFrame(discovery_frame, text="Network Range", 
                                   font=('Arial', 12, 'bold'), bg='#2d2d2d', fg='#ffffff')
@@ -304,6 +378,10 @@ class DuckScanner:
                                font=('Arial', 10), width=50, bg='#3d3d3d', fg='#ffffff')
         network_entry.pack(padx=5, pady=(0, 5))
         
+        self.ipv6_seed_file_var = tk.StringVar()
+        tk.Label(range_frame, textvariable=self.ipv6_seed_file_var, 
+                font=('Arial', 9), bg='#2d2d2d', fg='#8b949e').pack(anchor='w', padx=5, pady=(0, 5))
+        
         # Discovery buttons
         discovery_buttons = tk.Frame(discovery_frame, bg='#2d2d2d')
         discovery_buttons.pack(fill='x', padx=10, pady=5)
@@ -318,6 +396,21 @@ class DuckScanner:
                              font=('Arial', 10, 'bold'), padx=20, pady=5)
         arp_button.pack(side='left', padx=5)
         
+        map_button = tk.Button(discovery_buttons, text="🗺️ Map Paths", 
+                             command=self.map_paths, bg='#58a6ff', fg='#000000',
+                             font=('Arial', 10, 'bold'), padx=20, pady=5)
+        map_button.pack(side='left', padx=5)
+        
+        export_map_button = tk.Button(discovery_buttons, text="💾 Export Map", 
+                                    command=self.export_map, bg='#3d3d3d', fg='#ffffff',
+                                    font=('Arial', 10, 'bold'), padx=20, pady=5)
+        export_map_button.pack(side='left', padx=5)
+        
+        seeds_button = tk.Button(discovery_buttons, text="📂 IPv6 Seeds", 
+                               command=self.choose_ipv6_seed_file, bg='#3d3d3d', fg='#ffffff',
+                               font=('Arial', 10, 'bold'), padx=20, pady=5)
+        seeds_button.pack(side='left', padx=5)
+        
         # Discovery results
         discovery_results = scrolledtext.ScrolledText(
             discovery_frame, font=('Consolas', 10), bg='#0d1117', fg='#c9d1d9',
@@ -326,11 +419,8 @@ class DuckScanner:
         discovery_results.pack(fill='both', expand=True, padx=10, pady=10)
         self.discovery_results = discovery_results
         
-    def create_service_detection_tab(self):
+    def create_service_detection_tab(self, service_frame):
         """Create service detection tab"""
-        service_frame = ttk.Frame(self.notebook)
-        self.notebook.add(service_frame, text="🔧 Service Detection")
-        
         # Service detection controls
         service_controls = tk.LabelFrame(service_frame, text="Service Detection", 
                                        font=('Arial', 12, 'bold'), bg='#2d2d2d', fg='#ffffff')
@@ -357,11 +447,8 @@ class DuckScanner:
         service_results.pack(fill='both', expand=True, padx=10, pady=10)
         self.service_results = service_results
         
-    def create_scan_history_tab(self):
+    def create_scan_history_tab(self, history_frame):
         """Create scan history tab"""
-        history_frame = ttk.Frame(self.notebook)
-        self.notebook.add(history_frame, text="📚 Scan History")
-        
         # History controls
         history_controls = tk.Frame(history_frame, bg='#2d2d2d')
         history_controls.pack(fill='x', padx=10, pady=10)
@@ -376,17 +463,110 @@ class DuckScanner:
                                      font=('Arial', 10), padx=15, pady=5)
         export_history_btn.pack(side='left', padx=5)
         
+        trends_btn = tk.Button(history_controls, text="📈 Export Trends", 
+                             command=self.export_trends, bg='#4ecdc4', fg='#000000',
+                             font=('Arial', 10), padx=15, pady=5)
+        trends_btn.pack(side='left', padx=5)
+        
+        # Search across every past scan
+        search_btn = tk.Button(history_controls, text="🔎 Search", 
+                             command=self.search_history, bg='#00d4aa', fg='#000000',
+                             font=('Arial', 10), padx=15, pady=5)
+        search_btn.pack(side='right', padx=5)
+        
+        self.history_search_var = tk.StringVar()
+        search_entry = tk.Entry(history_controls, textvariable=self.history_search_var, width=40,
+                              font=('Arial', 10), bg='#3d3d3d', fg='#ffffff', insertbackground='#ffffff')
+        search_entry.pack(side='right', padx=5)
+        search_entry.bind('<Return>', lambda event: self.search_history())
+        
+        tk.Label(history_controls, text="Banner text, port:22 service:SSH host:10.0.*", 
+                bg='#2d2d2d', fg='#888888', font=('Arial', 9)).pack(side='right', padx=5)
+        
         # History list
         self.history_listbox = tk.Listbox(history_frame, font=('Arial', 10), 
                                         bg='#2d2d2d', fg='#ffffff', selectbackground='#00d4aa')
         self.history_listbox.pack(fill='both', expand=True, padx=10, pady=10)
         self.history_listbox.bind('<Double-Button-1>', self.load_history_item)
+        self.update_history_display()
         
-    def create_settings_tab(self):
-        """Create settings tab"""
-        settings_frame = ttk.Frame(self.notebook)
-        self.notebook.add(settings_frame, text="⚙️ Settings")
+        # Search results
+        self.history_search_results = scrolledtext.ScrolledText(
+            history_frame, font=('Consolas', 10), bg='#0d1117', fg='#c9d1d9',
+            height=10
+        )
+        self.history_search_results.pack(fill='both', expand=True, padx=10, pady=(0, 10))
+        
+    def create_jobs_tab(self, jobs_frame):
+        """Create jobs tab"""
+        from jobs import PRIORITIES
+        # New job form
+        job_controls = tk.LabelFrame(jobs_frame, text="New Job", 
+                                   font=('Arial', 12, 'bold'), bg='#2d2d2d', fg='#ffffff')
+        job_controls.pack(fill='x', padx=10, pady=10)
+        
+        self.job_kind_var = tk.StringVar(value="Port Scan")
+        ttk.Combobox(job_controls, textvariable=self.job_kind_var, width=16, state="readonly",
+                    values=["Port Scan", "Ping Sweep", "Service Detection"]).pack(side='left', padx=5, pady=5)
+        
+        tk.Label(job_controls, text="Target:", font=('Arial', 10), 
+                bg='#2d2d2d', fg='#ffffff').pack(side='left', padx=5)
+        self.job_target_var = tk.StringVar()
+        tk.Entry(job_controls, textvariable=self.job_target_var, font=('Arial', 10), width=30,
+                bg='#3d3d3d', fg='#ffffff', insertbackground='#ffffff').pack(side='left', padx=5)
+        
+        tk.Label(job_controls, text="Ports:", font=('Arial', 10), 
+                bg='#2d2d2d', fg='#ffffff').pack(side='left', padx=5)
+        self.job_ports_var = tk.StringVar(value="1-1000")
+        tk.Entry(job_controls, textvariable=self.job_ports_var, font=('Arial', 10), width=16,
+                bg='#3d3d3d', fg='#ffffff', insertbackground='#ffffff').pack(side='left', padx=5)
+        
+        tk.Label(job_controls, text="Priority:", font=('Arial', 10), 
+                bg='#2d2d2d', fg='#ffffff').pack(side='left', padx=5)
+        self.job_priority_var = tk.StringVar(value="normal")
+        ttk.Combobox(job_controls, textvariable=self.job_priority_var, width=8, state="readonly",
+                    values=list(PRIORITIES)).pack(side='left', padx=5)
+        
+        tk.Button(job_controls, text="➕ Add Job", command=self.add_job, bg='#00d4aa', fg='#000000',
+                 font=('Arial', 10, 'bold'), padx=15, pady=5).pack(side='left', padx=10, pady=5)
+        
+        # Job actions
+        job_buttons = tk.Frame(jobs_frame, bg='#2d2d2d')
+        job_buttons.pack(fill='x', padx=10, pady=5)
+        
+        tk.Button(job_buttons, text="⏸️ Pause", command=lambda: self.job_action('pause'), bg='#ffa657',
+                 fg='#000000', font=('Arial', 10), padx=15, pady=5).pack(side='left', padx=5)
+        tk.Button(job_buttons, text="▶️ Resume", command=lambda: self.job_action('resume'), bg='#4ecdc4',
+                 fg='#000000', font=('Arial', 10), padx=15, pady=5).pack(side='left', padx=5)
+        tk.Button(job_buttons, text="⏹️ Cancel", command=lambda: self.job_action('cancel'), bg='#ff6b6b',
+                 fg='#ffffff', font=('Arial', 10), padx=15, pady=5).pack(side='left', padx=5)
+        tk.Button(job_buttons, text="🧹 Clear Finished", command=self.clear_finished_jobs, bg='#3d3d3d',
+                 fg='#ffffff', font=('Arial', 10), padx=15, pady=5).pack(side='left', padx=5)
+        
+        self.job_budget_label = tk.StringVar()
+        tk.Label(job_buttons, textvariable=self.job_budget_label, font=('Arial', 10), 
+                bg='#2d2d2d', fg='#8b949e').pack(side='right', padx=5)
+        
+        # Job list
+        columns = ('kind', 'state', 'priority', 'progress', 'found', 'slots', 'target')
+        self.jobs_tree = ttk.Treeview(jobs_frame, columns=columns, height=10)
+        self.jobs_tree.heading('#0', text='ID')
+        self.jobs_tree.column('#0', width=50, stretch=False)
+        for column, width in zip(columns, (80, 90, 80, 140, 70, 70, 400)):
+            self.jobs_tree.heading(column, text=column.title())
+            self.jobs_tree.column(column, width=width, stretch=column == 'target')
+        self.jobs_tree.pack(fill='both', expand=True, padx=10, pady=10)
+        
+        # Findings of jobs started here
+        self.job_results = scrolledtext.ScrolledText(
+            jobs_frame, font=('Consolas', 10), bg='#0d1117', fg='#c9d1d9',
+            height=10
+        )
+        self.job_results.pack(fill='both', expand=True, padx=10, pady=(0, 10))
+        self.refresh_jobs()
         
+    def create_settings_tab(self, settings_frame):
+        """Create settings tab"""
         # Appearance settings
         appearance_frame = tk.LabelFrame(settings_frame, text="Appearance", 
                                        font=('Arial', 12, 'bold'), bg='#2d2d2d', fg='#ffffff')
@@ -402,6 +582,64 @@ class DuckScanner:
                                           font=('Arial', 12, 'bold'), bg='#2d2d2d', fg='#ffffff')
         scan_settings_frame.pack(fill='x', padx=10, pady=10)
         
+        tk.Checkbutton(scan_settings_frame, text="Reuse cached results for repeated targets", 
+                      variable=self.use_cache_var, font=('Arial', 10), bg='#2d2d2d', fg='#ffffff',
+                      selectcolor='#3d3d3d', activebackground='#2d2d2d').pack(anchor='w', padx=10, pady=5)
+        tk.Checkbutton(scan_settings_frame, text="Seed the cache from scan history on startup", 
+                      variable=self.seed_cache_var, font=('Arial', 10), bg='#2d2d2d', fg='#ffffff',
+                      selectcolor='#3d3d3d', activebackground='#2d2d2d').pack(anchor='w', padx=10, pady=5)
+        
+        tk.Checkbutton(scan_settings_frame, text="Serve Prometheus metrics on 127.0.0.1:9109", 
+                      variable=self.metrics_endpoint_var, command=self.toggle_metrics_endpoint,
+                      font=('Arial', 10), bg='#2d2d2d', fg='#ffffff',
+                      selectcolor='#3d3d3d', activebackground='#2d2d2d').pack(anchor='w', padx=10, pady=5)
+        
+        tk.Checkbutton(scan_settings_frame, text="Profile scans (stage timers and cProfile report)", 
+                      variable=self.profile_scans_var, font=('Arial', 10), bg='#2d2d2d', fg='#ffffff',
+                      selectcolor='#3d3d3d', activebackground='#2d2d2d').pack(anchor='w', padx=10, pady=5)
+        tk.Checkbutton(scan_settings_frame, text="Track memory allocations while profiling (tracemalloc)", 
+                      variable=self.profile_memory_var, font=('Arial', 10), bg='#2d2d2d', fg='#ffffff',
+                      selectcolor='#3d3d3d', activebackground='#2d2d2d').pack(anchor='w', padx=10, pady=5)
+        tk.Checkbutton(scan_settings_frame, text="Learn network timings for scan estimates (network_profile.json)", 
+                      variable=self.learn_network_var, font=('Arial', 10), bg='#2d2d2d', fg='#ffffff',
+                      selectcolor='#3d3d3d', activebackground='#2d2d2d').pack(anchor='w', padx=10, pady=5)
+        
+        tk.Checkbutton(scan_settings_frame, text="Run check scripts after service detection (anonymous FTP, open Redis, ...)", 
+                      variable=self.run_checks_var, font=('Arial', 10), bg='#2d2d2d', fg='#ffffff',
+                      selectcolor='#3d3d3d', activebackground='#2d2d2d').pack(anchor='w', padx=10, pady=5)
+        
+        skip_dead_frame = tk.Frame(scan_settings_frame, bg='#2d2d2d')
+        skip_dead_frame.pack(anchor='w', padx=10, pady=5)
+        tk.Checkbutton(skip_dead_frame, text="Stop scanning a host when none of its first", 
+                      variable=self.skip_dead_var, font=('Arial', 10), bg='#2d2d2d', fg='#ffffff',
+                      selectcolor='#3d3d3d', activebackground='#2d2d2d').pack(side='left')
+        tk.Spinbox(skip_dead_frame, from_=1, to=50, textvariable=self.skip_dead_ports_var,
+                  width=4, bg='#3d3d3d', fg='#ffffff', font=('Arial', 10)).pack(side='left', padx=5)
+        tk.Label(skip_dead_frame, text="most common ports answer", font=('Arial', 10), 
+                bg='#2d2d2d', fg='#ffffff').pack(side='left')
+        
+        retries_frame = tk.Frame(scan_settings_frame, bg='#2d2d2d')
+        retries_frame.pack(anchor='w', padx=10, pady=5)
+        tk.Label(retries_frame, text="Resend unanswered probes (times):", font=('Arial', 10), 
+                bg='#2d2d2d', fg='#ffffff').pack(side='left')
+        tk.Spinbox(retries_frame, from_=0, to=5, textvariable=self.retries_var,
+                  width=4, bg='#3d3d3d', fg='#ffffff', font=('Arial', 10)).pack(side='left', padx=5)
+        
+        budget_frame = tk.Frame(scan_settings_frame, bg='#2d2d2d')
+        budget_frame.pack(anchor='w', padx=10, pady=5)
+        tk.Label(budget_frame, text="Connections in flight across all jobs:", font=('Arial', 10), 
+                bg='#2d2d2d', fg='#ffffff').pack(side='left')
+        tk.Spinbox(budget_frame, from_=10, to=5000, increment=50, textvariable=self.job_budget_var,
+                  command=self.set_job_budget, width=6, bg='#3d3d3d', fg='#ffffff',
+                  font=('Arial', 10)).pack(side='left', padx=5)
+        
+        ttl_frame = tk.Frame(scan_settings_frame, bg='#2d2d2d')
+        ttl_frame.pack(anchor='w', padx=10, pady=5)
+        tk.Label(ttl_frame, text="Cache TTL (seconds):", font=('Arial', 10), 
+                bg='#2d2d2d', fg='#ffffff').pack(side='left')
+        tk.Spinbox(ttl_frame, from_=0, to=86400, increment=60, textvariable=self.cache_ttl_var,
+                  width=8, bg='#3d3d3d', fg='#ffffff', font=('Arial', 10)).pack(side='left', padx=5)
+        
         # About section
         about_frame = tk.LabelFrame(settings_frame, text="About DuckScanner", 
                                   font=('Arial', 12, 'bold'), bg='#2d2d2d', fg='#ffffff')
@@ -437,10 +675,130 @@ Developed with Python & Tkinter
                             font=('Segoe UI', 9, 'bold'), bd=2)
         status_bar.pack(side='bottom', fill='x')
         
+    def toggle_metrics_endpoint(self):
+        """Start or stop the local metrics endpoint"""
+        if self.metrics_endpoint_var.get() and self.metrics_server is None:
+            try:
+                from metrics import serve_metrics
+                self.metrics_server = serve_metrics(9109)
+            except OSError as e:
+                self.metrics_endpoint_var.set(False)
+                messagebox.showerror("Error", f"Could not start metrics endpoint: {e}")
+        elif not self.metrics_endpoint_var.get() and self.metrics_server is not None:
+            self.metrics_server.shutdown()
+            self.metrics_server.server_close()
+            self.metrics_server = None
+        
+    def get_job_manager(self):
+        """The job manager, created on first use"""
+        if self.job_manager is None:
+            from jobs import JobManager
+            self.job_manager = JobManager(self.job_budget_var.get())
+        return self.job_manager
+    
+    def set_job_budget(self):
+        """Apply the in-flight budget setting to running and future jobs"""
+        try:
+            self.get_job_manager().budget.concurrency = max(1, self.job_budget_var.get())
+        except tk.TclError:
+            pass
+    
+    def add_job(self):
+        """Start a job from the jobs tab form"""
+        kind = self.job_kind_var.get()
+        target = self.job_target_var.get().strip()
+        if not target:
+            messagebox.showerror("Error", "Please enter a target")
+            return
+        options = dict(priority=self.job_priority_var.get(), on_found=self.job_found)
+        from jobs import DetectJob, ScanJob, SweepJob
+        try:
+            ports = self.parse_ports(self.job_ports_var.get()) if self.job_ports_var.get().strip() else None
+            if kind == "Port Scan":
+                job = ScanJob(target, ports or self.parse_ports("1-1000"), self.timeout_var.get(),
+                              self.retries_var.get(), self.threads_var.get(), self.get_exclusions(), **options)
+            elif kind == "Ping Sweep":
+                job = SweepJob(target, timeout=self.timeout_var.get(), exclusions=self.get_exclusions(),
+                               **options)
+            else:
+                job = DetectJob(target, ports, self.timeout_var.get(), **options)
+        except Exception as e:
+            messagebox.showerror("Error", f"Could not create the job: {e}")
+            return
+        self.get_job_manager().submit(job)
+        self.job_results.insert(tk.END, f"➕ Job {job.id}: {kind.lower()} of {target}\n")
+        self.refresh_jobs(reschedule=False)
+    
+    def job_found(self, job, finding):
+        """Called from a job thread for each open port or live host"""
+        from jobs import format_finding
+        self.root.after(0, self.job_results.insert, tk.END, format_finding(job, finding) + "\n")
+    
+    def job_action(self, action):
+        """Pause, resume or cancel the selected jobs"""
+        if self.jobs_tree is None:
+            return
+        for item in self.jobs_tree.selection():
+            try:
+                getattr(self.get_job_manager(), action)(int(item))
+            except KeyError:
+                pass
+        self.refresh_jobs(reschedule=False)
+    
+    def clear_finished_jobs(self):
+        """Drop finished jobs from the list"""
+        self.get_job_manager().prune()
+        self.refresh_jobs(reschedule=False)
+    
+    def refresh_jobs(self, reschedule=True):
+        """Redraw the job list from the manager; repeats every 500 ms"""
+        from jobs import FINISHED
+        manager = self.get_job_manager()
+        summaries = manager.list()
+        shown = set(self.jobs_tree.get_children())
+        for job in summaries:
+            item = str(job['id'])
+            progress = f"{job['done']}/{job['total']} ({job['fraction']:.0%})" if job['total'] else '-'
+            state = job['state'] + (f": {job['error']}" if job['error'] else '')
+            values = (job['kind'], state, job['priority'], progress, job['findings'], job['in_flight'], job['name'])
+            if item in shown:
+                self.jobs_tree.item(item, values=values)
+                shown.discard(item)
+            else:
+                self.jobs_tree.insert('', tk.END, iid=item, text=item, values=values)
+        for item in shown:
+            self.jobs_tree.delete(item)
+        budget = manager.budget.snapshot()
+        running = sum(1 for job in summaries if job['state'] not in FINISHED)
+        self.job_budget_label.set(f"{running} jobs running - {budget['in_flight']}/{budget['concurrency']} "
+                                  f"connections in flight")
+        if reschedule:
+            self.root.after(500, self.refresh_jobs)
+    
     def set_ports(self, ports):
         """Set ports from preset"""
         self.ports_var.set(ports)
         
+    def choose_exclude_file(self):
+        """Pick a file with exclusion entries"""
+        filename = filedialog.askopenfilename(
+            filetypes=[("Text files", "*.txt"), ("All files", "*.*")]
+        )
+        if filename:
+            self.exclude_file_var.set(filename)
+        
+    def choose_ipv6_seed_file(self):
+        """Pick a file of known IPv6 addresses to seed discovery"""
+        filename = filedialog.askopenfilename(
+            filetypes=[("Text files", "*.txt"), ("All files", "*.*")]
+        )
+        if filename:
+            self.ipv6_seed_file_var.set(filename)
+        
+    def get_exclusions(self):
+        """Build the exclusion list from the current settings"""
+        return build_exclusions(self.exclude_var.get(), self.exclude_file_var.get())
+        
     def parse_ports(self, port_string):
         """Parse port string"""
         ports = []
@@ -456,38 +814,55 @@ Developed with Python & Tkinter
         """Get service name for port"""
         return self.services.get(port, 'Unknown')
     
-    def scan_port(self, port):
-        """Scan a single port"""
-        try:
-            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            sock.settimeout(self.timeout_var.get())
-            result = sock.connect_ex((self.target_var.get(), port))
-            sock.close()
-            
-            if result == 0:
-                return port, True, self.get_service_name(port)
-            else:
+    def cached_port(self, port):
+        """Return (port, is_open, service) from the result cache, or None"""
+        if self.use_cache_var.get():
+            cached = shared_cache.get(self.scan_address, port)
+            if cached and cached['state'] in (OPEN, CLOSED):
+                if cached['state'] == OPEN:
+                    return port, True, cached['service'] or self.get_service_name(port)
                 return port, False, None
-        except Exception as e:
-            return port, False, f"Error: {str(e)}"
+        return None
+    
+    def process_probe_result(self, result):
+        """Turn a scheduler ProbeResult into (port, is_open, service)"""
+        port, state, error = result.port, result.state, result.error
+        if state in (OPEN, CLOSED):
+            shared_cache.put(self.scan_address, port, state, service=self.get_service_name(port))
+        
+        if state == OPEN:
+            return port, True, self.get_service_name(port)
+        elif state == ERROR:
+            return port, False, f"Error: {os.strerror(error) if error and error > 0 else error}"
+        else:
+            return port, False, None
     
     def banner_grab(self, host, port):
         """Grab banner from open port"""
         try:
-            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            sock.settimeout(2)
-            sock.connect((host, port))
-            sock.send(b'\r\n')
-            banner = sock.recv(1024).decode('utf-8', errors='ignore').strip()
-            sock.close()
-            return banner[:100] if banner else "No banner"
+            family, address = resolve_target(host)
+            if self.use_cache_var.get():
+                cached = shared_cache.get(address, port)
+                if cached and cached['state'] == OPEN and cached['banner']:
+                    return cached['banner']
+            
+            banner = grab_banner(address, port, family) or "No banner"
+            shared_cache.put(address, port, OPEN, banner=banner)
+            return banner
         except:
             return "No banner"
     
     def update_results(self, port, is_open, service):
         """Update results display"""
+        QUEUE_DEPTH.dec('ui')
+        with self.profiler.stage('ui_update'):
+            self.show_result(port, is_open, service)
+    
+    def show_result(self, port, is_open, service):
+        """Insert one result into the results display"""
         if is_open:
-            banner = self.banner_grab(self.target_var.get(), port)
+            with self.profiler.stage('banner'):
+                banner = self.banner_grab(self.target_var.get(), port)
             result_text = f"✅ Port {port}/tcp open - {service}\n"
             if banner != "No banner":
                 result_text += f"   Banner: {banner}\n"
@@ -495,65 +870,163 @@ Developed with Python & Tkinter
             
             self.results_text.insert(tk.END, result_text, "open")
             self.results_text.see(tk.END)
-            self.scan_results.append({
-                'port': port,
-                'state': 'open',
-                'service': service,
-                'banner': banner
-            })
+            self.scan_results.add(self.scan_address, port, OPEN, service, banner)
+    
+    def compile_scan_plan(self, target, ports, first_k=0):
+        """The scan plan for the current settings"""
+        from liveness import LivenessPolicy
+        from scan_plan import compile_plan
+        return compile_plan(target, ports, self.get_exclusions(), concurrency=self.threads_var.get(),
+                            timeout=self.timeout_var.get(), retries=self.retries_var.get(),
+                            liveness=LivenessPolicy(first_k), strict=True)
     
     def scan_worker(self):
         """Worker thread for scanning"""
+        from liveness import HostGate, LivenessPolicy
+        from scan_plan import NetworkProfile
+        profiler = self.profiler
+        profiler.start()
+        target = self.target_var.get()
+        job = self.scan_job = self.get_job_manager().attach('scan', target)
+        error = None
         try:
-            target = self.target_var.get()
             ports = self.parse_ports(self.ports_var.get())
+            first_k = self.skip_dead_ports_var.get() if self.skip_dead_var.get() else 0
+            learn = self.learn_network_var.get()
+            with profiler.stage('resolve'):
+                plan = self.compile_scan_plan(target, ports, first_k)
+            if plan.excluded:
+                raise ValueError(f"Target {target} is excluded")
+            if len(plan.hosts) != 1:
+                raise ValueError(f"{target} is {len(plan.hosts)} hosts; scan ranges with port_scanner.py")
+            (self.scan_address, self.scan_family), = plan.hosts
+            ports = list(plan.ports)
+            network = NetworkProfile().load()
+            estimate = plan.estimate(network)
             
             self.results_text.insert(tk.END, f"🦆 DuckScanner - Starting scan...\n", "info")
-            self.results_text.insert(tk.END, f"Target: {target}\n", "info")
+            self.results_text.insert(tk.END, f"Target: {target} ({self.scan_address})\n", "info")
             self.results_text.insert(tk.END, f"Ports: {len(ports)}\n", "info")
+            self.results_text.insert(tk.END, f"Estimate: about {format_duration(estimate.duration)}, "
+                                     f"{estimate.expected_probes} probes\n", "info")
             self.results_text.insert(tk.END, f"Threads: {self.threads_var.get()}\n", "info")
             self.results_text.insert(tk.END, f"Scan Type: {self.scan_type_var.get()}\n", "info")
             self.results_text.insert(tk.END, "-" * 50 + "\n\n", "info")
             
             start_time = time.time()
             open_count = 0
+            progress = self.scan_progress = job.progress = ProgressTracker(len(ports))
+            self.prober = ConnectProber(self.timeout_var.get())
+            shared_cache.ttl = self.cache_ttl_var.get()
             
-            with ThreadPoolExecutor(max_workers=self.threads_var.get()) as executor:
-                futures = {executor.submit(self.scan_port, port): port for port in ports}
-                
-                for future in as_completed(futures):
+            gate = HostGate(LivenessPolicy(first_k), on_skip=lambda host, count: progress.advance(count))
+            
+            uncached = []
+            with profiler.stage('cache_lookup'):
+                for port in ports:
+                    cached = self.cached_port(port)
+                    if cached is None:
+                        uncached.append(port)
+                        continue
+                    progress.advance()
+                    gate.observe(self.scan_address, port, OPEN if cached[1] else CLOSED)
+                    if cached[1]:
+                        open_count += 1
+                        QUEUE_DEPTH.inc('ui')
+                        self.root.after(0, self.update_results, *cached)
+            
+            transport = default_transport(self.prober, self.threads_var.get())
+            scheduler = ProbeScheduler(transport, self.threads_var.get(), self.timeout_var.get(),
+                                       retries=self.retries_var.get(), lease=job.lease)
+            try:
+                probes = gate.probes([(self.scan_address, self.scan_family, uncached)])
+                for result in profiler.iterate('probe', scheduler.run(probes)):
                     if not self.is_scanning:
                         break
-                        
-                    port, is_open, service = future.result()
+                    
+                    progress.advance()
+                    with profiler.stage('process'):
+                        gate.observe(result.host, result.port, result.state)
+                        if learn:
+                            network.observe(result)
+                        port, is_open, service = self.process_probe_result(result)
                     if is_open:
                         open_count += 1
+                        job.found((result.host, port))
+                        QUEUE_DEPTH.inc('ui')
                         self.root.after(0, self.update_results, port, is_open, service)
+            finally:
+                transport.close()
+                if learn:
+                    network.save()
+            
+            if gate.down_hosts():
+                self.root.after(0, self.results_text.insert, tk.END,
+                                f"💤 No answer on the {first_k} most common ports - host looks down, "
+                                f"skipped {gate.skipped} ports\n", "info")
+            if scheduler.recovered:
+                self.root.after(0, self.results_text.insert, tk.END,
+                                f"🔁 {scheduler.recovered} ports answered only on a resent probe "
+                                f"(measured loss {scheduler.loss:.1%})\n", "info")
             
             end_time = time.time()
             duration = end_time - start_time
-            
-            self.root.after(0, self.scan_completed, open_count, duration)
+            done = (self.scan_completed, open_count, duration, progress.snapshot())
             
         except Exception as e:
-            self.root.after(0, self.scan_error, str(e))
+            error = str(e)
+            done = (self.scan_error, error)
+        finally:
+            job.finish(error)
+            # cProfile has to be disabled from the thread that enabled it, and before the report is built
+            profiler.stop()
+        self.root.after(0, *done)
     
-    def scan_completed(self, open_count, duration):
-        """Called when scan is completed"""
+    def scan_completed(self, open_count, duration, progress):
+        """Called when scan is completed or stopped"""
         self.is_scanning = False
         self.scan_button.config(text="🚀 Start Scan", bg=self.colors['success'],
                                activebackground='#6dd47e')
-        self.progress_bar.stop()
+        coverage = progress['fraction']
+        self.progress_bar['value'] = coverage * 100
         
         self.results_text.insert(tk.END, "-" * 50 + "\n", "info")
-        self.results_text.insert(tk.END, f"✅ Scan completed in {duration:.2f} seconds\n", "success")
+        if coverage < 1:
+            self.results_text.insert(tk.END, f"⏹️ Scan stopped after {duration:.2f} seconds - "
+                                     f"{progress['done']}/{progress['total']} ports covered ({coverage * 100:.1f}%)\n", "error")
+            self.progress_var.set(f"Scan stopped - {coverage * 100:.1f}% covered, {open_count} open ports found")
+        else:
+            self.results_text.insert(tk.END, f"✅ Scan completed in {duration:.2f} seconds\n", "success")
+            self.progress_var.set(f"Scan completed - {open_count} open ports found")
         self.results_text.insert(tk.END, f"🔓 Open ports found: {open_count}\n\n", "success")
         
-        self.progress_var.set(f"Scan completed - {open_count} open ports found")
         self.status_var.set(f"🦆 Scan completed in {duration:.2f}s - {open_count} open ports - DuckScanner by Kirill Tikhomirov")
         
         # Save to history
-        self.save_scan_to_history(open_count, duration)
+        with self.profiler.stage('history_save'):
+            self.save_scan_to_history(open_count, duration, coverage)
+        self.write_profile_report()
+    
+    def write_profile_report(self):
+        """Write the profile of the finished scan next to the scan history"""
+        if self.profiler is None or not self.profiler.enabled:
+            return
+        path = f"scan_profile_{datetime.now().strftime('%Y%m%d_%H%M%S')}.txt"
+        try:
+            self.profiler.write_report(path, f"Scan profile: {self.target_var.get()} ports {self.ports_var.get()}")
+            self.results_text.insert(tk.END, f"📈 Profile report written to {path}\n\n", "info")
+        except Exception as e:
+            self.results_text.insert(tk.END, f"❌ Could not write profile report: {e}\n", "error")
+    
+    def update_progress(self):
+        """Refresh the progress bar and ETA from the tracker at a fixed tick"""
+        if not self.is_scanning:
+            return
+        if self.scan_progress is not None:
+            snapshot = self.scan_progress.tick()
+            self.progress_bar['value'] = snapshot['fraction'] * 100
+            self.progress_var.set(format_progress(snapshot))
+        self.root.after(500, self.update_progress)
     
     def scan_error(self, error_msg):
         """Called when scan encounters an error"""
@@ -584,67 +1057,104 @@ Developed with Python & Tkinter
             return
         
         self.is_scanning = True
-        self.scan_results = []
+        self.scan_results = ResultSet()
+        mode = None
+        if self.profile_scans_var.get():
+            mode = 'all' if self.profile_memory_var.get() else 'cprofile'
+        from profiling import Profiler
+        self.profiler = Profiler(mode)
         self.scan_button.config(text="⏹️ Stop Scan", bg=self.colors['error'], 
                                activebackground='#ff4757')
-        self.progress_bar.start()
+        self.scan_progress = None
+        self.progress_bar['value'] = 0
         self.progress_var.set("Scanning in progress...")
         self.status_var.set("🦆 Scanning... - DuckScanner by Kirill Tikhomirov")
         
         # Start scan in separate thread
         scan_thread = threading.Thread(target=self.scan_worker, daemon=True)
         scan_thread.start()
+        self.root.after(500, self.update_progress)
+    
+    def estimate_scan(self):
+        """Show the probe count, duration and memory of the configured scan without running it"""
+        target = self.target_var.get().strip()
+        if not target:
+            messagebox.showerror("Error", "Please enter a target IP address or hostname")
+            return
+        try:
+            ports = self.parse_ports(self.ports_var.get())
+        except ValueError:
+            messagebox.showerror("Error", "Invalid port format. Use comma-separated ports or ranges (e.g., 80,443 or 1-1000)")
+            return
+        first_k = self.skip_dead_ports_var.get() if self.skip_dead_var.get() else 0
+        self.status_var.set("🦆 Estimating scan... - DuckScanner by Kirill Tikhomirov")
+        # Resolving the target can block, so the plan is compiled off the UI thread
+        threading.Thread(target=self.estimate_worker, args=(target, ports, first_k), daemon=True).start()
+    
+    def estimate_worker(self, target, ports, first_k):
+        """Compile the plan and estimate it in the background"""
+        from scan_plan import NetworkProfile, format_estimate
+        try:
+            plan = self.compile_scan_plan(target, ports, first_k)
+            report = format_estimate(plan, plan.estimate(NetworkProfile().load()))
+        except Exception as e:
+            self.root.after(0, messagebox.showerror, "Estimate", f"Could not plan the scan: {e}")
+        else:
+            self.root.after(0, messagebox.showinfo, "Scan Estimate", report)
+        self.root.after(0, self.status_var.set, "🦆 Ready - DuckScanner by Kirill Tikhomirov")
     
     def stop_scan(self):
         """Stop the current scan"""
         self.is_scanning = False
+        if self.scan_job is not None:
+            # Also wakes a scan that is paused or waiting on other jobs' slots
+            self.scan_job.cancel()
         self.scan_button.config(text="🚀 Start Scan", bg=self.colors['success'],
                                activebackground='#6dd47e')
-        self.progress_bar.stop()
-        self.progress_var.set("Scan stopped")
+        self.progress_var.set("Stopping scan...")
         self.status_var.set("🦆 Scan stopped - DuckScanner by Kirill Tikhomirov")
     
     def clear_results(self):
         """Clear the results display"""
         self.results_text.delete(1.0, tk.END)
-        self.scan_results = []
+        self.scan_results = ResultSet()
         self.progress_var.set("Ready to scan")
         self.status_var.set("🦆 Ready - DuckScanner by Kirill Tikhomirov")
     
     def export_results(self):
         """Export scan results"""
+        from exporters import FILETYPES
         if not self.scan_results:
             messagebox.showwarning("Warning", "No scan results to export")
             return
         
         filename = filedialog.asksaveasfilename(
             defaultextension=".json",
-            filetypes=[("JSON files", "*.json"), ("CSV files", "*.csv"), ("Text files", "*.txt")]
+            filetypes=FILETYPES
         )
         
         if filename:
             try:
-                if filename.endswith('.json'):
-                    with open(filename, 'w') as f:
-                        json.dump(self.scan_results, f, indent=2)
-                elif filename.endswith('.csv'):
-                    with open(filename, 'w', newline='') as f:
-                        writer = csv.writer(f)
-                        writer.writerow(['Port', 'State', 'Service', 'Banner'])
-                        for result in self.scan_results:
-                            writer.writerow([result['port'], result['state'], result['service'], result['banner']])
-                else:
-                    with open(filename, 'w') as f:
-                        for result in self.scan_results:
-                            f.write(f"Port {result['port']}/tcp open - {result['service']}\n")
-                            if result['banner'] != "No banner":
-                                f.write(f"Banner: {result['banner']}\n")
-                            f.write("\n")
+                from exporters import open_writer
+                with open_writer(filename) as writer:
+                    count = writer.write_all(self.results_for_export())
                 
-                messagebox.showinfo("Success", f"Results exported to {filename}")
+                messagebox.showinfo("Success", f"{count} results exported to {filename}")
             except Exception as e:
                 messagebox.showerror("Error", f"Failed to export results: {e}")
     
+    def results_for_export(self):
+        """Yield export rows for the current results, with banners picked up later by other tabs"""
+        from exporters import make_row
+        for result in self.scan_results:
+            host = result['host'] or self.target_var.get()
+            banner = result['banner']
+            cached = shared_cache.get(host, result['port'])
+            if cached and cached['banner'] and banner == "No banner":
+                banner = cached['banner']
+            yield make_row(host, result['port'], result['state'], result['service'], banner,
+                           timestamp=cached['timestamp'] if cached else None)
+    
     def ping_sweep(self):
         """Perform ping sweep"""
         network = self.network_var.get()
@@ -654,39 +1164,161 @@ Developed with Python & Tkinter
         
         self.discovery_results.delete(1.0, tk.END)
         self.discovery_results.insert(tk.END, f"🏓 Starting ping sweep for {network}...\n")
+        from jobs import Job
+        self.get_job_manager().submit(Job(network, work=self.sweep_worker, kind='sweep'))
+    
+    def sweep_worker(self, job):
+        """Job thread for a ping sweep; each ping holds a slot of the job budget"""
+        import ipaddress
+        from concurrent.futures import ThreadPoolExecutor, as_completed
+        from host_discovery import ping_host
+        from ipv6_discovery import generate_candidates, load_seeds
+        from arp_discovery import arp_cache
+        from jobs import Cancelled
+        
+        def show(text):
+            self.root.after(0, self.discovery_results.insert, tk.END, text)
+        
+        def ping(host):
+            with job.lease.slot():
+                return ping_host(host)
         
         try:
-            network_obj = ipaddress.ip_network(network, strict=False)
-            hosts = list(network_obj.hosts())
-            
-            def ping_host(host):
-                try:
-                    if platform.system().lower() == "windows":
-                        result = subprocess.run(['ping', '-n', '1', '-w', '1000', str(host)], 
-                                              capture_output=True, text=True, timeout=3)
-                    else:
-                        result = subprocess.run(['ping', '-c', '1', '-W', '1', str(host)], 
-                                              capture_output=True, text=True, timeout=3)
-                    return str(host), result.returncode == 0
-                except:
-                    return str(host), False
+            network_obj = ipaddress.ip_network(job.name, strict=False)
+            exclusions = self.get_exclusions()
+            if network_obj.version == 6:
+                seed_file = self.ipv6_seed_file_var.get()
+                seeds = load_seeds(seed_file) if seed_file else None
+                candidates = generate_candidates(network_obj, seeds=seeds, macs=arp_cache().values())
+            else:
+                candidates = network_obj.hosts()
+            hosts = list(exclusions.filter_hosts(candidates))
+            job.set_total(len(hosts))
+            if network_obj.version == 6 and len(hosts) < network_obj.num_addresses - 1:
+                show(f"🧭 Probing {len(hosts)} likely IPv6 candidates\n")
             
             with ThreadPoolExecutor(max_workers=50) as executor:
-                futures = {executor.submit(ping_host, host): host for host in hosts}
+                futures = {executor.submit(ping, host): host for host in hosts}
                 
                 for future in as_completed(futures):
-                    host, is_alive = future.result()
+                    try:
+                        host, is_alive = future.result()
+                    except Cancelled:
+                        continue
+                    job.progress.advance()
                     if is_alive:
-                        self.discovery_results.insert(tk.END, f"✅ {host} is alive\n")
+                        job.found(host)
+                        show(f"✅ {host} is alive\n")
                     else:
-                        self.discovery_results.insert(tk.END, f"❌ {host} is not responding\n")
+                        show(f"❌ {host} is not responding\n")
+            if job.cancelled:
+                show("⏹️ Ping sweep cancelled\n")
+            else:
+                self.swept_hosts[job.name] = list(job.findings)
         
         except Exception as e:
-            self.discovery_results.insert(tk.END, f"❌ Error: {e}\n")
+            show(f"❌ Error: {e}\n")
+            raise
     
     def arp_scan(self):
         """Perform ARP scan"""
-        self.discovery_results.insert(tk.END, "🔍 ARP scan not implemented yet\n")
+        network = self.network_var.get()
+        if not network:
+            messagebox.showerror("Error", "Please enter a network range")
+            return
+        
+        self.discovery_results.delete(1.0, tk.END)
+        self.discovery_results.insert(tk.END, f"🔍 Starting ARP scan for {network}...\n")
+        from jobs import Job
+        self.get_job_manager().submit(Job(network, work=self.arp_worker, kind='arp'))
+    
+    def arp_worker(self, job):
+        """Job thread for an ARP scan, so the raw-socket wait and neighbor lookup stay off the Tk thread"""
+        import ipaddress
+        from arp_discovery import arp_scan
+        
+        def show(text):
+            self.root.after(0, self.discovery_results.insert, tk.END, text)
+        
+        try:
+            start_time = time.time()
+            hosts, method = arp_scan(job.name)
+            duration = time.time() - start_time
+            exclusions = self.get_exclusions()
+            
+            if method == 'passive':
+                show("ℹ️ Raw ARP unavailable - showing hosts from the neighbor table\n")
+            
+            for ip in sorted(hosts, key=ipaddress.ip_address):
+                if not exclusions.excludes_host(ip):
+                    job.found(ip)
+                    show(f"✅ {ip} is alive ({hosts[ip]})\n")
+            
+            show(f"🏁 {len(job.findings)} hosts found in {duration:.2f} seconds\n")
+        except Exception as e:
+            show(f"❌ Error: {e}\n")
+            raise
+    
+    def map_paths(self):
+        """Trace the paths to the hosts the last ping sweep found, or to the whole range"""
+        network = self.network_var.get()
+        if not network:
+            messagebox.showerror("Error", "Please enter a network range")
+            return
+        
+        from jobs import TraceJob
+        from topology import HopCache
+        hosts = self.swept_hosts.get(network)
+        self.discovery_results.delete(1.0, tk.END)
+        if hosts:
+            self.discovery_results.insert(tk.END, f"🗺️ Mapping paths to {len(hosts)} live hosts in {network}...\n")
+        else:
+            self.discovery_results.insert(tk.END, f"🗺️ Mapping paths to every address in {network} "
+                                          f"(ping sweep first to trace only live hosts)...\n")
+        self.trace_job = TraceJob(network, timeout=self.timeout_var.get(), cache=HopCache().load(),
+                                  exclusions=self.get_exclusions(), hosts=hosts, on_found=self.show_trace)
+        self.get_job_manager().submit(self.trace_job)
+        self.root.after(500, self.trace_finished, self.trace_job)
+    
+    def show_trace(self, job, path):
+        """Called from the trace job for each traced host"""
+        from topology import format_path
+        self.root.after(0, self.discovery_results.insert, tk.END, format_path(path) + "\n")
+    
+    def trace_finished(self, job):
+        """Report the merged map once the trace job ends"""
+        from jobs import FINISHED
+        if job.state not in FINISHED:
+            self.root.after(500, self.trace_finished, job)
+            return
+        if job.error:
+            self.discovery_results.insert(tk.END, f"❌ Error: {job.error}\n")
+        elif job.topology is None or job.cancelled:
+            self.discovery_results.insert(tk.END, "⏹️ Path mapping cancelled\n")
+        else:
+            summary = job.topology.summary()
+            self.discovery_results.insert(tk.END, f"🏁 {summary['reached']}/{summary['destinations']} hosts reached "
+                                          f"through {summary['routers']} routers in "
+                                          f"{job.finished - job.started:.2f} seconds ({summary['probes']} probes)\n")
+    
+    def export_map(self):
+        """Save the last path map as JSON, Graphviz DOT or text"""
+        job = self.trace_job
+        if job is None or job.topology is None:
+            messagebox.showwarning("Warning", "No path map to export - run Map Paths first")
+            return
+        filename = filedialog.asksaveasfilename(
+            defaultextension=".json",
+            filetypes=[("JSON paths and graph", "*.json"), ("Graphviz graph", "*.dot"), ("Text paths", "*.txt")]
+        )
+        if not filename:
+            return
+        from topology import export_topology
+        try:
+            export_topology(job.topology, filename)
+            messagebox.showinfo("Success", f"Path map exported to {filename}")
+        except Exception as e:
+            messagebox.showerror("Error", f"Failed to export path map: {e}")
     
     def detect_services(self):
         """Detect services on target"""
@@ -697,57 +1329,139 @@ Developed with Python & Tkinter
         
         self.service_results.delete(1.0, tk.END)
         self.service_results.insert(tk.END, f"🔧 Detecting services on {target}...\n")
+        from jobs import Job
+        self.get_job_manager().submit(Job(target, work=self.detect_worker, kind='detect'))
+    
+    def detect_worker(self, job):
+        """Job thread for service detection; each port's connection and banner grab holds a budget slot"""
+        from jobs import DetectJob
+        target = job.name
+        
+        def show(text):
+            self.root.after(0, self.service_results.insert, tk.END, text)
+        
+        try:
+            family, address = resolve_target(target)
+            exclusions = self.get_exclusions()
+            if exclusions.excludes_host(address):
+                show(f"🚫 {target} is excluded\n")
+                return
+        except Exception as e:
+            show(f"❌ Error: {e}\n")
+            raise
         
         # Scan common ports
-        common_ports = [21, 22, 23, 25, 53, 80, 110, 135, 139, 143, 443, 993, 995, 1723, 3306, 3389, 5432, 5900, 8080]
+        common_ports = exclusions.filter_ports(DetectJob.COMMON_PORTS)
+        job.set_total(len(common_ports))
+        
+        prober = ConnectProber(1)
+        use_cache = self.use_cache_var.get()
+        shared_cache.ttl = self.cache_ttl_var.get()
+        from http_probe import HTTPProber, is_http_port
+        http_prober = HTTPProber(timeout=3, budget=10)
+        server_name = None if target == address else target
         
         def check_service(port):
             try:
-                sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-                sock.settimeout(1)
-                result = sock.connect_ex((target, port))
-                sock.close()
-                
-                if result == 0:
-                    service = self.get_service_name(port)
-                    banner = self.banner_grab(target, port)
-                    return port, service, banner
-                return None
+                with job.lease.slot():
+                    cached = shared_cache.get(address, port) if use_cache else None
+                    if cached and cached['state'] in (OPEN, CLOSED):
+                        state = cached['state']
+                    else:
+                        state, _ = prober.probe(address, port, family)
+                        if state in (OPEN, CLOSED):
+                            shared_cache.put(address, port, state, service=self.get_service_name(port))
+                    
+                    if state == OPEN:
+                        service = self.get_service_name(port)
+                        if is_http_port(port):
+                            # A bare CRLF gets nothing useful from a web server; ask it properly
+                            return port, service, http_prober.probe(address, port, server_name=server_name)
+                        banner = self.banner_grab(target, port)
+                        return port, service, banner
+                    return None
             except:
                 return None
         
+        from concurrent.futures import ThreadPoolExecutor, as_completed
+        found = []
         with ThreadPoolExecutor(max_workers=20) as executor:
             futures = {executor.submit(check_service, port): port for port in common_ports}
             
             for future in as_completed(futures):
                 result = future.result()
+                if job.cancelled:
+                    continue
+                job.progress.advance()
                 if result:
                     port, service, banner = result
-                    self.service_results.insert(tk.END, f"✅ Port {port}/tcp - {service}\n")
-                    if banner != "No banner":
-                        self.service_results.insert(tk.END, f"   Banner: {banner}\n")
-                    self.service_results.insert(tk.END, "\n")
+                    found.append((address, port, service, banner if isinstance(banner, str) and banner != "No banner" else None))
+                    job.found((port, found[-1][3]))
+                    show(f"✅ Port {port}/tcp - {service}\n")
+                    if isinstance(banner, dict):
+                        self.root.after(0, self.show_http_details, banner)
+                    elif banner != "No banner":
+                        show(f"   Banner: {banner}\n")
+                    show("\n")
+        http_prober.close()
+        
+        if job.cancelled:
+            show("⏹️ Service detection cancelled\n")
+        elif self.run_checks_var.get() and found:
+            # Every applicable check script in one pass, sharing a connection per port
+            from checks import CheckRunner, format_result
+            runner = CheckRunner(concurrency=20)
+            if any(runner.select(port, service, banner) for _, port, service, banner in found):
+                show("Checks:\n")
+                runner.run_sync(found, lambda result: show(f"   {format_result(result)}\n"))
     
-    def save_scan_to_history(self, open_count, duration):
+    def show_http_details(self, result):
+        """Insert an HTTP probe result into the service results"""
+        out = self.service_results
+        if result['status'] is None:
+            out.insert(tk.END, f"   HTTP: {result['error']}\n")
+            return
+        server = f" - {result['server']}" if result['server'] else ""
+        out.insert(tk.END, f"   HTTP {result['status']}{server}\n")
+        if result['title']:
+            out.insert(tk.END, f"   Title: {result['title']}\n")
+        for hop in result['redirects']:
+            out.insert(tk.END, f"   Redirect ({hop['status']}): {hop['location']}\n")
+        robots = result['robots']
+        if robots and robots['status'] == 200:
+            disallowed = ', '.join(robots['disallow'][:5]) or 'nothing'
+            out.insert(tk.END, f"   robots.txt disallows: {disallowed}\n")
+        if result['favicon']:
+            out.insert(tk.END, f"   Favicon hash: {result['favicon']['mmh3']} (md5 {result['favicon']['md5']})\n")
+    
+    def save_scan_to_history(self, open_count, duration, coverage=1.0):
         """Save scan to history"""
         scan_info = {
             'timestamp': datetime.now().isoformat(),
             'target': self.target_var.get(),
+            'address': self.scan_address,
             'ports': self.ports_var.get(),
             'open_ports': open_count,
             'duration': duration,
-            'results': self.scan_results
+            'coverage': round(coverage, 4),
+            'results': self.scan_results.to_dicts()
         }
-        self.scan_history.append(scan_info)
+        try:
+            self.scan_history.append(scan_info)
+        except Exception as e:
+            self.results_text.insert(tk.END, f"❌ Could not save scan history: {e}\n", "error")
         self.update_history_display()
-        self.save_scan_history()
     
     def update_history_display(self):
         """Update history display"""
+        if self.history_listbox is None:
+            return
         self.history_listbox.delete(0, tk.END)
-        for i, scan in enumerate(self.scan_history):
+        for i, scan in enumerate(self.scan_history.entries()):
             timestamp = datetime.fromisoformat(scan['timestamp']).strftime("%Y-%m-%d %H:%M:%S")
-            self.history_listbox.insert(tk.END, f"{timestamp} - {scan['target']} ({scan['open_ports']} open ports)")
+            coverage = scan.get('coverage', 1.0)
+            partial = f", stopped at {coverage * 100:.0f}%" if coverage < 1 else ""
+            self.history_listbox.insert(tk.END, f"{timestamp} - {scan['target']} ({scan['open_ports']} open ports{partial})")
     
     def load_history_item(self, event):
         """Load selected history item"""
@@ -756,46 +1470,97 @@ Developed with Python & Tkinter
             scan = self.scan_history[selection[0]]
             self.target_var.set(scan['target'])
             self.ports_var.set(scan['ports'])
-            self.scan_results = scan['results']
             
             # Switch to port scanner tab
             self.notebook.select(0)
             self.clear_results()
+            self.scan_results = ResultSet.from_dicts(scan['results'], scan.get('address') or scan['target'])
             
             # Display results
             for result in scan['results']:
-                self.results_text.insert(tk.END, f"✅ Port {result['port']}/tcp open - {result['service']}\n")
-                if result['banner'] != "No banner":
+                service = result.get('service') or self.get_service_name(result['port'])
+                self.results_text.insert(tk.END, f"✅ Port {result['port']}/tcp open - {service}\n")
+                if result.get('banner') not in (None, "No banner"):
                     self.results_text.insert(tk.END, f"   Banner: {result['banner']}\n")
                 self.results_text.insert(tk.END, "\n")
     
+    def search_history(self):
+        """Search every past scan through the history index"""
+        query = self.history_search_var.get().strip()
+        if not query:
+            return
+        self.history_search_results.delete(1.0, tk.END)
+        self.history_search_results.insert(tk.END, f"Searching for {query}...\n")
+        threading.Thread(target=self.history_search_worker, args=(query,), daemon=True).start()
+    
+    def history_search_worker(self, query):
+        """Bring the index up to date and run the query, off the Tk thread"""
+        from history_index import HistoryIndex, parse_query
+        from history_store import STORE_FILE
+        try:
+            filters = parse_query(query)
+            # Each search opens its own connection: SQLite connections stay on their thread
+            with HistoryIndex() as index:
+                index.sync(STORE_FILE)
+                start = time.perf_counter()
+                rows = index.search(limit=500, **filters)
+                elapsed = (time.perf_counter() - start) * 1000
+        except Exception as e:
+            self.root.after(0, self.show_history_search, query, [], 0, str(e))
+            return
+        self.root.after(0, self.show_history_search, query, rows, elapsed, None)
+    
+    def show_history_search(self, query, rows, elapsed, error):
+        """Show search results on the Tk thread"""
+        from history_index import format_finding
+        out = self.history_search_results
+        out.delete(1.0, tk.END)
+        if error:
+            out.insert(tk.END, f"Search failed: {error}\n")
+            return
+        out.insert(tk.END, f"{len(rows)} findings for {query} ({elapsed:.1f} ms)\n\n")
+        for row in rows:
+            out.insert(tk.END, format_finding(row) + "\n")
+    
     def clear_history(self):
         """Clear scan history"""
-        self.scan_history = []
+        # Anything still loading from disk is cleared too
+        self.history_ready = True
+        try:
+            self.scan_history.clear()
+        except Exception:
+            pass
         self.update_history_display()
-        self.save_scan_history()
     
     def export_history(self):
         """Export scan history"""
+        import csv
+        from exporters import FILETYPES, JSONWriter, format_for, open_writer, history_rows
         if not self.scan_history:
             messagebox.showwarning("Warning", "No scan history to export")
             return
         
         filename = filedialog.asksaveasfilename(
             defaultextension=".json",
-            filetypes=[("JSON files", "*.json"), ("CSV files", "*.csv")]
+            filetypes=FILETYPES
         )
         
         if filename:
             try:
-                if filename.endswith('.json'):
-                    with open(filename, 'w') as f:
-                        json.dump(self.scan_history, f, indent=2)
+                fmt = format_for(filename)
+                if fmt == 'json':
+                    # Whole scans, one at a time
+                    with JSONWriter(filename) as writer:
+                        writer.write_all(self.scan_history)
+                elif fmt != 'csv':
+                    # Per-port rows for the streaming formats
+                    with open_writer(filename, fmt) as writer:
+                        writer.write_all(history_rows(self.scan_history))
                 else:
                     with open(filename, 'w', newline='') as f:
                         writer = csv.writer(f)
                         writer.writerow(['Timestamp', 'Target', 'Ports', 'Open Ports', 'Duration'])
-                        for scan in self.scan_history:
+                        for scan in self.scan_history.entries():
                             writer.writerow([
                                 scan['timestamp'],
                                 scan['target'],
@@ -808,27 +1573,82 @@ Developed with Python & Tkinter
             except Exception as e:
                 messagebox.showerror("Error", f"Failed to export history: {e}")
     
-    def save_scan_history(self):
-        """Save scan history to file"""
+    def export_trends(self):
+        """Export weekly open ports per service and the hosts whose exposure grew"""
+        if not self.scan_history:
+            messagebox.showwarning("Warning", "No scan history to analyse")
+            return
+        filename = filedialog.asksaveasfilename(
+            defaultextension=".csv",
+            filetypes=[("CSV files", "*.csv"), ("JSON files", "*.json"), ("Text files", "*.txt")]
+        )
+        if filename:
+            threading.Thread(target=self.trends_worker, args=(filename,), daemon=True).start()
+    
+    def trends_worker(self, filename):
+        """Build the trend tables off the Tk thread; the frame is kept and topped up next time"""
+        from analytics import HistoryFrame, export_table, run_report
+        from history_index import HistoryIndex
+        from history_store import STORE_FILE
         try:
-            with open('scan_history.json', 'w') as f:
-                json.dump(self.scan_history, f, indent=2)
-        except Exception:
-            pass
+            if self.history_frame is None:
+                self.history_frame = HistoryFrame()
+            with HistoryIndex() as index:
+                index.sync(STORE_FILE)
+                self.history_frame.load(index)
+            base, ext = os.path.splitext(filename)
+            export_table(run_report(self.history_frame, 'services', 'week'), filename)
+            growth_file = f"{base}_growth{ext}"
+            export_table(run_report(self.history_frame, 'growth'), growth_file)
+        except Exception as e:
+            self.root.after(0, messagebox.showerror, "Error", f"Failed to export trends: {e}")
+            return
+        self.root.after(0, messagebox.showinfo, "Success", f"Trends exported to {filename} and {growth_file}")
+    
+    def first_paint(self):
+        """Runs once the window has been drawn; starts the background history load"""
+        STARTUP.mark('first paint')
+        from history_store import HistoryStore
+        self.scan_history = HistoryStore(None)
+        self.load_scan_history()
     
     def load_scan_history(self):
-        """Load scan history from file"""
+        """Load scan history from file on a background thread"""
+        seed_ttl = self.cache_ttl_var.get() if self.seed_cache_var.get() else None
+        threading.Thread(target=self.read_scan_history, args=(seed_ttl,), daemon=True).start()
+    
+    def read_scan_history(self, seed_ttl):
+        """Read the history store (converting an old scan_history.json) and seed the cache, off the Tk thread"""
+        from history_store import HistoryStore, LEGACY_FILE, STORE_FILE
         try:
-            if os.path.exists('scan_history.json'):
-                with open('scan_history.json', 'r') as f:
-                    self.scan_history = json.load(f)
-                self.update_history_display()
+            history = HistoryStore(STORE_FILE).load(legacy_path=LEGACY_FILE)
+            if seed_ttl is not None:
+                shared_cache.ttl = seed_ttl
+                fresh = datetime.fromtimestamp(time.time() - seed_ttl)
+                shared_cache.seed_from_history(history.scans(since=fresh))
         except Exception:
-            pass
+            # Keep a damaged file as it is; this session's scans stay in memory
+            history = HistoryStore(None)
+        self.root.after(0, self.history_loaded, history)
+    
+    def history_loaded(self, history):
+        """Merge loaded history with scans finished while it was loading"""
+        if self.history_ready:
+            # Cleared while loading
+            history.clear()
+        pending = self.scan_history
+        history.extend(pending.scans())
+        self.scan_history = history
+        self.history_ready = True
+        self.update_history_display()
+        STARTUP.mark(f'history loaded ({len(self.scan_history)})')
+        if self.startup_report:
+            STARTUP.print_report()
 
 def main():
     root = tk.Tk()
     app = DuckScanner(root)
+    app.startup_report = '--startup-report' in sys.argv[1:]
     root.mainloop()
 
 if __name__ == "__main__":
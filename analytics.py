@@ -0,0 +1,505 @@
+#!/usr/bin/env python3
+"""
+History Analytics
+Columnar open-port history with group-by and time-bucket aggregations for trend reports
+"""
+
+import json
+import sys
+from array import array
+from datetime import datetime, timedelta
+
+from result_set import StringTable, load_numpy
+
+PERIODS = ('day', 'week', 'month', 'year')
+GROUPS = ('period', 'service', 'port', 'host', 'target')
+
+# Scan timestamps are naive local times; they are bucketed on the scanner's own clock
+EPOCH = datetime(1970, 1, 1)
+
+_DTYPES = {'H': 'uint16', 'I': 'uint32', 'd': 'float64'}
+
+
+def parse_time(value):
+    """A naive datetime from an ISO timestamp or date"""
+    moment = value if isinstance(value, datetime) else datetime.fromisoformat(value)
+    return moment.replace(tzinfo=None)
+
+
+def period_key(moment, every):
+    """Integer bucket of a datetime; consecutive periods have consecutive keys"""
+    if every == 'year':
+        return moment.year
+    if every == 'month':
+        return moment.year * 12 + moment.month - 1
+    days = (moment - EPOCH).days
+    if every == 'week':
+        # Day 0 was a Thursday; weeks start on Monday
+        return (days + 3) // 7
+    return days
+
+
+def period_label(key, every):
+    """Readable name of a bucket: its first day, month or year"""
+    if every == 'year':
+        return str(key)
+    if every == 'month':
+        return f"{key // 12:04d}-{key % 12 + 1:02d}"
+    if every == 'week':
+        return (EPOCH + timedelta(days=key * 7 - 3)).date().isoformat()
+    return (EPOCH + timedelta(days=key)).date().isoformat()
+
+
+def _sort_key(value):
+    """Sort key for a group label; findings without a service, host or target come first"""
+    return (value is not None, '' if value is None else value)
+
+
+def _unique(values):
+    """Sorted distinct values of a NumPy array"""
+    numpy = load_numpy()
+    values = numpy.sort(values)
+    if not len(values):
+        return values
+    return values[numpy.r_[True, values[1:] != values[:-1]]]
+
+
+def _codes(values):
+    """Small non-negative codes for an int64 array, and how many codes there can be"""
+    numpy = load_numpy()
+    low = int(values.min())
+    span = int(values.max()) - low + 1
+    if span <= 4 * len(values) + 1024:
+        return values - low, span
+    distinct = _unique(values)
+    return numpy.searchsorted(distinct, values), len(distinct)
+
+
+class HistoryFrame:
+    """Open findings from every indexed scan as parallel typed arrays
+
+    Rows are loaded from the history index once and later loads append only
+    findings indexed since, so a long-lived frame stays current cheaply.
+    Per-finding columns hold a scan number, host id, port and service id;
+    scan times and targets live once per scan. Aggregations use NumPy when
+    it is installed and plain loops otherwise.
+    """
+
+    def __init__(self):
+        self.tables = {'host': StringTable(), 'service': StringTable(), 'target': StringTable()}
+        # Per scan
+        self.scan_moments = []
+        self.scan_times = array('d')
+        self.scan_targets = array('I')
+        self.scan_numbers = {}
+        # Per finding
+        self.scans = array('I')
+        self.hosts = array('I')
+        self.ports = array('H')
+        self.services = array('I')
+        self.last_scan_id = 0
+        self.last_id = 0
+        self.generation = None
+
+    def __len__(self):
+        return len(self.ports)
+
+    @property
+    def scan_count(self):
+        return len(self.scan_moments)
+
+    def clear(self):
+        self.__init__()
+
+    # Loading
+
+    def load(self, index):
+        """Append open findings indexed since the last load; returns how many were added"""
+        db = index.db
+        generation = index.generation()
+        if generation != self.generation:
+            # The index was rebuilt since the last load
+            self.clear()
+            self.generation = generation
+        for scan_id, timestamp, target in db.execute(
+                'SELECT id, timestamp, target FROM scans WHERE id > ? ORDER BY id', (self.last_scan_id,)):
+            try:
+                moment = parse_time(timestamp)
+            except (TypeError, ValueError):
+                moment = EPOCH
+            self.scan_numbers[scan_id] = len(self.scan_moments)
+            self.scan_moments.append(moment)
+            self.scan_times.append((moment - EPOCH).total_seconds())
+            self.scan_targets.append(self.tables['target'].intern(target))
+            self.last_scan_id = scan_id
+
+        before = len(self)
+        numbers = self.scan_numbers
+        host_ids = self.tables['host'].intern
+        service_ids = self.tables['service'].intern
+        scans, hosts, ports, services = self.scans, self.hosts, self.ports, self.services
+        last_id = self.last_id
+        for finding_id, scan_id, host, port, service in db.execute(
+                "SELECT id, scan_id, host, port, service FROM findings WHERE id > ? AND state = 'open' "
+                'ORDER BY id', (self.last_id,)):
+            scans.append(numbers[scan_id])
+            hosts.append(host_ids(host))
+            ports.append(port)
+            services.append(service_ids(service))
+            last_id = finding_id
+        self.last_id = last_id
+        return len(self) - before
+
+    # Columns
+
+    def column(self, name):
+        """A per-finding column as a zero-copy NumPy array, or the raw array without NumPy"""
+        numpy = load_numpy()
+        values = getattr(self, name)
+        if numpy is None:
+            return values
+        if not len(values):
+            return numpy.zeros(0, dtype=_DTYPES[values.typecode])
+        return numpy.frombuffer(values, dtype=_DTYPES[values.typecode])
+
+    def _per_scan(self, values):
+        """Spread one value per scan out to one per finding"""
+        numpy = load_numpy()
+        if numpy is not None:
+            return numpy.asarray(values)[self.column('scans')] if len(self) else numpy.zeros(0, dtype='int64')
+        return [values[scan] for scan in self.scans]
+
+    def _group_column(self, name, every):
+        if name == 'period':
+            return self._per_scan([period_key(moment, every) for moment in self.scan_moments])
+        if name == 'target':
+            return self._per_scan(self.scan_targets)
+        return self.column({'service': 'services', 'port': 'ports', 'host': 'hosts'}[name])
+
+    def _label(self, name, key, every):
+        if name == 'period':
+            return period_label(int(key), every)
+        if name == 'port':
+            return int(key)
+        return self.tables[name][int(key)]
+
+    def _mask(self, since=None, until=None, port=None, service=None, host=None, target=None):
+        """Indices of findings passing every filter, or None for all of them"""
+        numpy = load_numpy()
+        wanted_scans = None
+        if since or until or target:
+            since = parse_time(since) if since else None
+            until = parse_time(until) if until else None
+            target_id = self.tables['target'].lookup(target) if target else None
+            wanted_scans = [(since is None or moment >= since) and (until is None or moment < until)
+                            and (target is None or self.scan_targets[number] == target_id)
+                            for number, moment in enumerate(self.scan_moments)]
+        # Each criterion is a column and the set of values it may hold
+        criteria = []
+        if port is not None:
+            criteria.append(('ports', {int(port)}))
+        if service is not None:
+            # Service names match case-insensitively, as in history search
+            criteria.append(('services', {string_id for string_id, name in enumerate(self.tables['service'].strings)
+                                          if name is not None and name.lower() == service.lower()}))
+        if host is not None:
+            host_id = self.tables['host'].lookup(host)
+            criteria.append(('hosts', {host_id} if host_id is not None else set()))
+        if wanted_scans is None and not criteria:
+            return None
+        if numpy is not None:
+            mask = numpy.ones(len(self), dtype=bool)
+            if wanted_scans is not None:
+                mask &= self._per_scan(wanted_scans)
+            for name, values in criteria:
+                mask &= numpy.isin(self.column(name), list(values))
+            return numpy.flatnonzero(mask)
+        indices = []
+        for index in range(len(self)):
+            if wanted_scans is not None and not wanted_scans[self.scans[index]]:
+                continue
+            if all(getattr(self, name)[index] in values for name, values in criteria):
+                indices.append(index)
+        return indices
+
+    # Aggregations
+
+    def aggregate(self, by=('period', 'service'), every='week', **filters):
+        """Group findings and count them: one row per group, sorted by group
+
+        Each row has the group columns plus findings (open results, counting
+        repeats across scans), open_ports (distinct host and port pairs) and
+        hosts (distinct hosts). Group by any of period, service, port, host
+        and target; every sets the period to day, week, month or year.
+        Filters: since, until, port, service, host, target.
+        """
+        numpy = load_numpy()
+        by = tuple(by)
+        for name in by:
+            if name not in GROUPS:
+                raise ValueError(f"Cannot group by {name}: choose from {', '.join(GROUPS)}")
+        if every not in PERIODS:
+            raise ValueError(f"Unknown period {every}: choose from {', '.join(PERIODS)}")
+        selected = self._mask(**filters)
+        columns = [self._group_column(name, every) for name in by]
+        if numpy is not None:
+            groups = self._aggregate_numpy(columns, selected)
+        else:
+            groups = self._aggregate_python(columns, selected)
+        rows = []
+        for keys, findings, open_ports, hosts in groups:
+            row = {name: self._label(name, key, every) for name, key in zip(by, keys)}
+            row.update(open_ports=open_ports, hosts=hosts, findings=findings)
+            rows.append(row)
+        rows.sort(key=lambda row: tuple(_sort_key(row[name]) for name in by))
+        return rows
+
+    def _aggregate_numpy(self, columns, selected):
+        numpy = load_numpy()
+        hosts = self.column('hosts').astype('int64')
+        ports = self.column('ports').astype('int64')
+        columns = [numpy.asarray(column, dtype='int64') for column in columns]
+        if selected is not None:
+            hosts, ports = hosts[selected], ports[selected]
+            columns = [column[selected] for column in columns]
+        if not len(hosts):
+            return []
+        # Fold the group columns into one group number per finding, mixed-radix
+        group = numpy.zeros(len(hosts), dtype='int64')
+        size = 1
+        for column in columns:
+            codes, span = _codes(column)
+            group, size = group * span + codes, size * span
+            if size > 1 << 31:
+                group, size = _codes(group)
+        if size > 4 * len(group) + 1024:
+            # Sparse combinations: renumber so per-group arrays stay small
+            group, size = _codes(group)
+        findings = numpy.bincount(group, minlength=size)
+        present = numpy.flatnonzero(findings)
+        first = numpy.full(size, len(group), dtype='int64')
+        numpy.minimum.at(first, group, numpy.arange(len(group)))
+        first = first[present]
+        host_span = len(self.tables['host']) + 1
+        distinct_hosts = numpy.bincount(_unique(group * host_span + hosts) // host_span, minlength=size)
+        triples = _unique(((group * host_span + hosts) << 16) | ports)
+        open_ports = numpy.bincount((triples >> 16) // host_span, minlength=size)
+        findings, distinct_hosts, open_ports = findings[present], distinct_hosts[present], open_ports[present]
+        count = len(present)
+        keys = [column[first] for column in columns]
+        return [(tuple(key[i] for key in keys), int(findings[i]), int(open_ports[i]), int(distinct_hosts[i]))
+                for i in range(count)]
+
+    def _aggregate_python(self, columns, selected):
+        indices = range(len(self)) if selected is None else selected
+        groups = {}
+        for index in indices:
+            key = tuple(column[index] for column in columns)
+            group = groups.get(key)
+            if group is None:
+                group = groups[key] = [0, set(), set()]
+            host = self.hosts[index]
+            group[0] += 1
+            group[1].add((host, self.ports[index]))
+            group[2].add(host)
+        return [(key, findings, len(pairs), len(hosts)) for key, (findings, pairs, hosts) in groups.items()]
+
+    def surface_growth(self, top=50, **filters):
+        """Hosts with ports open in their latest scan that were not open in their first
+
+        Compares each host's first and latest scan within the filters; a
+        host shows up in a scan only when something on it was open. Rows are
+        ranked by ports opened, then by net growth, and carry before, after,
+        growth, opened and closed.
+        """
+        numpy = load_numpy()
+        selected = self._mask(**filters)
+        if numpy is not None:
+            changes = self._growth_numpy(selected, top)
+        else:
+            changes = self._growth_python(selected)
+        rows = []
+        for host, first, last, before, after, opened, closed in changes:
+            if not opened:
+                continue
+            rows.append({
+                'host': self.tables['host'][host],
+                'first_scan': self.scan_moments[first].isoformat(timespec='seconds'),
+                'last_scan': self.scan_moments[last].isoformat(timespec='seconds'),
+                'before': before, 'after': after, 'growth': after - before,
+                'opened': opened, 'closed': closed
+            })
+        rows.sort(key=lambda row: (-len(row['opened']), -row['growth'], _sort_key(row['host'])))
+        return rows[:top] if top else rows
+
+    def _growth_numpy(self, selected, top=None):
+        numpy = load_numpy()
+        hosts = self.column('hosts').astype('int64')
+        scans = self.column('scans').astype('int64')
+        ports = self.column('ports').astype('int64')
+        if selected is not None:
+            hosts, scans, ports = hosts[selected], scans[selected], ports[selected]
+        if not len(hosts):
+            return []
+        times = numpy.frombuffer(self.scan_times, dtype='float64')[scans]
+        order = numpy.lexsort((scans, times, hosts))
+        hosts, scans, ports = hosts[order], scans[order], ports[order]
+        starts = numpy.flatnonzero(numpy.r_[True, hosts[1:] != hosts[:-1]])
+        ends = numpy.r_[starts[1:], len(hosts)] - 1
+        slot = numpy.cumsum(numpy.r_[True, hosts[1:] != hosts[:-1]]) - 1
+        first_scan, last_scan = scans[starts], scans[ends]
+        pairs = (slot << 16) | ports
+        before_pairs = _unique(pairs[scans == first_scan[slot]])
+        after_pairs = _unique(pairs[scans == last_scan[slot]])
+        opened = numpy.setdiff1d(after_pairs, before_pairs, assume_unique=True)
+        closed = numpy.setdiff1d(before_pairs, after_pairs, assume_unique=True)
+        slots = len(starts)
+        before = numpy.bincount(before_pairs >> 16, minlength=slots)
+        after = numpy.bincount(after_pairs >> 16, minlength=slots)
+        grew = _unique(opened >> 16)
+        opened_bounds = numpy.searchsorted(opened >> 16, numpy.r_[grew, grew + 1].reshape(2, -1))
+        closed_bounds = numpy.searchsorted(closed >> 16, numpy.r_[grew, grew + 1].reshape(2, -1))
+        if top and len(grew) > top:
+            # Keep only hosts that can rank in the top: those tied with or ahead of the top-th
+            opened_count = opened_bounds[1] - opened_bounds[0]
+            growth = after[grew] - before[grew]
+            rank = opened_count * (int(growth.max() - growth.min()) + 1) + (growth - growth.min())
+            cutoff = numpy.partition(rank, len(rank) - top)[len(rank) - top]
+            ahead = numpy.flatnonzero(rank > cutoff)
+            tied = numpy.flatnonzero(rank == cutoff)
+            # Ties rank by host name, as in surface_growth()
+            names = self.tables['host'].strings
+            tied = sorted(tied.tolist(), key=lambda i: names[hosts[starts[grew[i]]]])[:top - len(ahead)]
+            keep = numpy.r_[ahead, numpy.asarray(tied, dtype=ahead.dtype)]
+            grew, opened_bounds, closed_bounds = grew[keep], opened_bounds[:, keep], closed_bounds[:, keep]
+        changes = []
+        for i, s in enumerate(grew):
+            opened_ports = (opened[opened_bounds[0, i]:opened_bounds[1, i]] & 0xFFFF).tolist()
+            closed_ports = (closed[closed_bounds[0, i]:closed_bounds[1, i]] & 0xFFFF).tolist()
+            changes.append((int(hosts[starts[s]]), int(first_scan[s]), int(last_scan[s]),
+                            int(before[s]), int(after[s]), opened_ports, closed_ports))
+        return changes
+
+    def _growth_python(self, selected):
+        indices = range(len(self)) if selected is None else selected
+        by_host = {}
+        for index in indices:
+            scans = by_host.setdefault(self.hosts[index], {})
+            scans.setdefault(self.scans[index], set()).add(self.ports[index])
+        changes = []
+        for host, scans in by_host.items():
+            first = min(scans, key=lambda scan: (self.scan_times[scan], scan))
+            last = max(scans, key=lambda scan: (self.scan_times[scan], scan))
+            before, after = scans[first], scans[last]
+            changes.append((host, first, last, len(before), len(after),
+                            sorted(after - before), sorted(before - after)))
+        return changes
+
+
+def _cell(value):
+    if isinstance(value, list):
+        return ' '.join(str(item) for item in value)
+    return value
+
+
+def format_table(rows):
+    """Rows as aligned text columns"""
+    if not rows:
+        return '(no rows)'
+    columns = list(rows[0])
+    cells = [[str(_cell(row.get(column, ''))) for column in columns] for row in rows]
+    widths = [max(len(column), *(len(line[i]) for line in cells)) for i, column in enumerate(columns)]
+    lines = ['  '.join(column.ljust(width) for column, width in zip(columns, widths))]
+    lines.extend('  '.join(cell.ljust(width) for cell, width in zip(line, widths)) for line in cells)
+    return '\n'.join(lines)
+
+
+def export_table(rows, path, fmt=None):
+    """Write a summary table as CSV, JSON, JSON Lines or text, chosen by extension"""
+    import csv
+    from exporters import format_for
+    fmt = fmt or format_for(path)
+    with open(path, 'w', newline='') as f:
+        if fmt == 'csv':
+            writer = csv.writer(f)
+            if rows:
+                writer.writerow(list(rows[0]))
+            for row in rows:
+                writer.writerow([_cell(value) for value in row.values()])
+        elif fmt == 'json':
+            json.dump(rows, f, indent=2)
+        elif fmt == 'jsonl':
+            for row in rows:
+                f.write(json.dumps(row) + '\n')
+        else:
+            f.write(format_table(rows) + '\n')
+    return len(rows)
+
+
+# Named reports: (group columns, description)
+REPORTS = {
+    'services': (('period', 'service'), 'open ports per service per period'),
+    'ports': (('period', 'port'), 'open ports and hosts per port number per period'),
+    'hosts': (('period',), 'hosts and open ports per period'),
+    'targets': (('period', 'target'), 'open ports per scan target per period'),
+    'growth': (None, 'hosts whose open ports grew between their first and latest scan'),
+}
+
+
+def run_report(frame, report, every='week', top=50, **filters):
+    """Rows of a named report"""
+    by, _ = REPORTS[report]
+    if by is None:
+        return frame.surface_growth(top=top, **filters)
+    return frame.aggregate(by, every, **filters)
+
+
+def main(argv=None):
+    import argparse
+    import time
+    from history_index import HistoryIndex, HISTORY_FILE, INDEX_FILE
+
+    parser = argparse.ArgumentParser(
+        prog='port_scanner.py trends', description='Exposure trends over scan history',
+        epilog='Reports: ' + '; '.join(f"{name}: {text}" for name, (_, text) in REPORTS.items()))
+    parser.add_argument('report', choices=list(REPORTS), nargs='?', default='services',
+                       help='Report to run (default: services)')
+    parser.add_argument('--every', choices=PERIODS, default='week', help='Time bucket (default: week)')
+    parser.add_argument('--since', help='Only scans at or after this ISO date')
+    parser.add_argument('--until', help='Only scans before this ISO date')
+    parser.add_argument('--port', type=int, help='Only this port')
+    parser.add_argument('--service', help='Only this service name')
+    parser.add_argument('--host', help='Only this host')
+    parser.add_argument('--target', help='Only scans of this target')
+    parser.add_argument('--top', type=int, default=50, help='Rows for the growth report (default: 50, 0 for all)')
+    parser.add_argument('-o', '--output', help='Write the table to a .csv, .json, .jsonl or .txt file')
+    parser.add_argument('--history', default=HISTORY_FILE,
+                       help=f'History file to index (default: {HISTORY_FILE})')
+    parser.add_argument('--index', default=INDEX_FILE, help=f'Index database (default: {INDEX_FILE})')
+    args = parser.parse_args(argv)
+
+    filters = {key: getattr(args, key) for key in ('since', 'until', 'port', 'service', 'host', 'target')
+               if getattr(args, key) is not None}
+    start = time.perf_counter()
+    frame = HistoryFrame()
+    with HistoryIndex(args.index) as index:
+        index.sync(args.history)
+        frame.load(index)
+    loaded = time.perf_counter()
+    try:
+        rows = run_report(frame, args.report, args.every, args.top, **filters)
+    except ValueError as e:
+        parser.error(str(e))
+    done = time.perf_counter()
+
+    if args.output:
+        export_table(rows, args.output)
+        print(f"Wrote {len(rows)} rows to {args.output}")
+    else:
+        print(format_table(rows))
+    print(f"{len(frame)} findings from {frame.scan_count} scans loaded in {loaded - start:.2f}s, "
+          f"report in {done - loaded:.2f}s", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
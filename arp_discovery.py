@@ -0,0 +1,231 @@
+#!/usr/bin/env python3
+"""
+ARP Discovery
+Local-segment host discovery with raw ARP requests or the kernel neighbor table
+"""
+
+import errno
+import ipaddress
+import os
+import platform
+import re
+import select
+import socket
+import struct
+import subprocess
+import time
+
+ETH_P_ARP = 0x0806
+ARP_REQUEST = 1
+ARP_REPLY = 2
+BROADCAST_MAC = b'\xff' * 6
+
+# ioctl requests for interface details (Linux)
+SIOCGIFADDR = 0x8915
+SIOCGIFNETMASK = 0x891b
+SIOCGIFHWADDR = 0x8927
+
+# Largest network blasted with raw requests (a /16)
+MAX_RAW_HOSTS = 65536
+
+MAC_PATTERN = re.compile(r'([0-9a-fA-F]{1,2}[:-]){5}[0-9a-fA-F]{1,2}')
+
+
+class NotAttached(ValueError):
+    """No local interface is on the network, so raw requests cannot reach it"""
+
+
+def format_mac(raw):
+    """Format 6 raw bytes as aa:bb:cc:dd:ee:ff"""
+    return ':'.join(f'{b:02x}' for b in raw)
+
+
+def arp_cache(path='/proc/net/arp'):
+    """Return {ip: mac} for complete entries in /proc/net/arp"""
+    entries = {}
+    try:
+        with open(path, 'r') as f:
+            next(f, None)
+            for line in f:
+                fields = line.split()
+                if len(fields) < 6:
+                    continue
+                ip, flags, mac = fields[0], int(fields[2], 16), fields[3]
+                if flags & 0x2 and mac != '00:00:00:00:00:00':
+                    entries[ip] = mac.lower()
+    except OSError:
+        pass
+    return entries
+
+
+def neighbor_table():
+    """Return {ip: mac} from the system neighbor table"""
+    system = platform.system().lower()
+    try:
+        if system == 'linux':
+            command = ['ip', '-4', 'neigh', 'show']
+        else:
+            command = ['arp', '-a'] if system == 'windows' else ['arp', '-an']
+        output = subprocess.run(command, capture_output=True, text=True, timeout=5).stdout
+    except Exception:
+        return {}
+
+    entries = {}
+    for line in output.splitlines():
+        if 'FAILED' in line or 'INCOMPLETE' in line or 'incomplete' in line:
+            continue
+        ip = re.search(r'\d{1,3}(?:\.\d{1,3}){3}', line)
+        mac = MAC_PATTERN.search(line)
+        if ip and mac:
+            entries[ip.group(0)] = mac.group(0).replace('-', ':').lower()
+    return entries
+
+
+def passive_scan(network):
+    """Known hosts in the network from the ARP cache and neighbor table"""
+    network = ipaddress.ip_network(network, strict=False)
+    entries = neighbor_table()
+    entries.update(arp_cache())
+    return {ip: mac for ip, mac in entries.items() if ipaddress.ip_address(ip) in network}
+
+
+def _ioctl(sock, request, ifname):
+    """Run an interface ioctl and return the raw ifreq buffer"""
+    import fcntl
+    return fcntl.ioctl(sock.fileno(), request, struct.pack('256s', ifname.encode()[:15]))
+
+
+def interface_info(ifname):
+    """Return (mac bytes, IPv4Network of the interface) or None"""
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        try:
+            mac = _ioctl(sock, SIOCGIFHWADDR, ifname)[18:24]
+            address = socket.inet_ntoa(_ioctl(sock, SIOCGIFADDR, ifname)[20:24])
+            netmask = socket.inet_ntoa(_ioctl(sock, SIOCGIFNETMASK, ifname)[20:24])
+        except OSError:
+            return None
+    return mac, ipaddress.IPv4Interface(f'{address}/{netmask}')
+
+
+def find_interface(network):
+    """Find the local interface attached to a network"""
+    for _, ifname in socket.if_nameindex():
+        if ifname == 'lo':
+            continue
+        info = interface_info(ifname)
+        if info and info[1].network.overlaps(network):
+            return ifname, info[0], info[1]
+    return None
+
+
+def build_request(src_mac, src_ip, dst_ip):
+    """Build a broadcast Ethernet frame carrying an ARP request"""
+    ethernet = BROADCAST_MAC + src_mac + struct.pack('!H', ETH_P_ARP)
+    arp = struct.pack('!HHBBH6s4s6s4s', 1, 0x0800, 6, 4, ARP_REQUEST,
+                      src_mac, src_ip, b'\x00' * 6, dst_ip)
+    return ethernet + arp
+
+
+def parse_reply(frame):
+    """Return (sender ip, sender mac) for an ARP reply frame, else None"""
+    if len(frame) < 42 or frame[12:14] != b'\x08\x06':
+        return None
+    opcode = struct.unpack('!H', frame[20:22])[0]
+    if opcode != ARP_REPLY:
+        return None
+    return socket.inet_ntoa(frame[28:32]), format_mac(frame[22:28])
+
+
+def raw_scan(network, timeout=0.25, retries=1, interface=None):
+    """Blast ARP requests for the whole network and collect replies"""
+    network = ipaddress.ip_network(network, strict=False)
+    if network.version != 4:
+        raise ValueError("ARP only works for IPv4 networks")
+    if network.num_addresses > MAX_RAW_HOSTS:
+        raise ValueError(f"Network too large for ARP scan (max /{32 - MAX_RAW_HOSTS.bit_length() + 1})")
+
+    if interface:
+        info = interface_info(interface)
+        if not info:
+            raise ValueError(f"Interface {interface} has no IPv4 address")
+        ifname, src_mac, local = interface, info[0], info[1]
+    else:
+        found = find_interface(network)
+        if not found:
+            raise NotAttached(f"No local interface is attached to {network}")
+        ifname, src_mac, local = found
+    src_ip = local.ip.packed
+
+    sock = socket.socket(socket.AF_PACKET, socket.SOCK_RAW, socket.htons(ETH_P_ARP))
+    try:
+        sock.bind((ifname, ETH_P_ARP))
+        sock.setblocking(False)
+        found = {}
+        pending = [host for host in network.hosts() if host != local.ip]
+
+        for _ in range(retries + 1):
+            for host in pending:
+                frame = build_request(src_mac, src_ip, host.packed)
+                while True:
+                    try:
+                        sock.send(frame)
+                        break
+                    except BlockingIOError:
+                        select.select([], [sock], [], 0.01)
+                    except OSError as e:
+                        if e.errno != errno.ENOBUFS:
+                            raise
+                        time.sleep(0.001)
+                _drain(sock, network, found)
+
+            # One receive loop for all outstanding requests
+            deadline = time.monotonic() + timeout
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                readable, _, _ = select.select([sock], [], [], remaining)
+                if readable:
+                    _drain(sock, network, found)
+
+            pending = [host for host in pending if str(host) not in found]
+            if not pending:
+                break
+        return found
+    finally:
+        sock.close()
+
+
+def _drain(sock, network, found):
+    """Read every queued frame and record ARP replies from the network"""
+    while True:
+        try:
+            frame = sock.recv(65535)
+        except (BlockingIOError, InterruptedError):
+            return
+        reply = parse_reply(frame)
+        if reply and ipaddress.ip_address(reply[0]) in network:
+            found.setdefault(reply[0], reply[1])
+
+
+def can_raw_scan():
+    """Check whether raw AF_PACKET sockets are usable here"""
+    if not hasattr(socket, 'AF_PACKET'):
+        return False
+    if hasattr(os, 'geteuid') and os.geteuid() == 0:
+        return True
+    try:
+        socket.socket(socket.AF_PACKET, socket.SOCK_RAW, socket.htons(ETH_P_ARP)).close()
+        return True
+    except OSError:
+        return False
+
+
+def arp_scan(network, timeout=0.25, retries=1, interface=None):
+    """Discover hosts on a local network, returning ({ip: mac}, method)"""
+    if can_raw_scan():
+        try:
+            return raw_scan(network, timeout, retries, interface), 'raw'
+        except (PermissionError, NotAttached):
+            pass
+    return passive_scan(network), 'passive'
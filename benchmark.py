@@ -0,0 +1,308 @@
+#!/usr/bin/env python3
+"""
+DuckScanner Benchmark Suite
+Runs the scan paths against a local loopback target farm and records performance
+"""
+
+import argparse
+import json
+import multiprocessing
+import platform
+import selectors
+import socket
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from port_scanner import parse_ports
+from scan_engine import ConnectProber, ProbeScheduler, OPEN, CLOSED, TIMEOUT, ERROR, grab_banner
+from transport import default_transport
+from host_discovery import ping_host
+
+FARM_BANNER = b"SSH-2.0-DuckFarm_1.0\r\n"
+
+
+def peak_rss_kb():
+    """Peak resident set size of this process in KiB"""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOS reports bytes, Linux reports KiB
+    return peak // 1024 if sys.platform == 'darwin' else peak
+
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of a list of numbers"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(fraction * len(ordered))) - 1))
+    return ordered[index]
+
+
+def _run_farm(hosts, open_ports, blackhole_ports, ready, stop):
+    """Farm process body: serve open ports and keep blackholed ports saturated"""
+    selector = selectors.DefaultSelector()
+    keep = []
+    for host in hosts:
+        for port in open_ports:
+            listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            listener.bind((host, port))
+            listener.listen(1024)
+            listener.setblocking(False)
+            selector.register(listener, selectors.EVENT_READ)
+            keep.append(listener)
+        for port in blackhole_ports:
+            # A listener that never accepts and has a full accept queue drops
+            # further SYNs, which looks like a filtered port to the scanner
+            listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            listener.bind((host, port))
+            listener.listen(0)
+            keep.append(listener)
+            for _ in range(2):
+                filler = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+                filler.settimeout(0.2)
+                filler.connect_ex((host, port))
+                keep.append(filler)
+    ready.set()
+
+    while not stop.is_set():
+        for key, _ in selector.select(timeout=0.1):
+            try:
+                conn, _ = key.fileobj.accept()
+            except OSError:
+                continue
+            try:
+                conn.sendall(FARM_BANNER)
+            except OSError:
+                pass
+            conn.close()
+
+    for sock in keep:
+        sock.close()
+
+
+class TargetFarm:
+    """Loopback hosts with open, closed (RST) and blackholed ports"""
+
+    def __init__(self, host_count=4, open_ports=None, closed_ports=None, blackhole_ports=None,
+                 base='127.77.0.'):
+        self.hosts = [f'{base}{i + 1}' for i in range(host_count)]
+        self.open_ports = open_ports or list(range(20001, 20011))
+        self.closed_ports = closed_ports or list(range(21001, 21091))
+        self.blackhole_ports = blackhole_ports or [22001, 22002]
+        self.process = None
+        self._stop = None
+
+    @property
+    def ports(self):
+        return sorted(self.open_ports + self.closed_ports + self.blackhole_ports)
+
+    def expected_state(self, port):
+        """State a correct scanner reports for a farm port"""
+        if port in self.open_ports:
+            return OPEN
+        if port in self.blackhole_ports:
+            return TIMEOUT
+        return CLOSED
+
+    def start(self):
+        """Start the farm in a child process so it does not skew RSS or the GIL"""
+        ready = multiprocessing.Event()
+        self._stop = multiprocessing.Event()
+        self.process = multiprocessing.Process(
+            target=_run_farm,
+            args=(self.hosts, self.open_ports, self.blackhole_ports, ready, self._stop),
+            daemon=True
+        )
+        self.process.start()
+        if not ready.wait(30):
+            self.stop()
+            raise RuntimeError("Target farm failed to start")
+
+    def stop(self):
+        """Shut the farm down"""
+        if self.process:
+            self._stop.set()
+            self.process.join(5)
+            if self.process.is_alive():
+                self.process.terminate()
+            self.process = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def _timed(func, *args):
+    """Run func and return (result, seconds)"""
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+
+def _summarize(latencies, duration, correct, total):
+    return {
+        'probes': total,
+        'duration_s': round(duration, 4),
+        'probes_per_s': round(total / duration, 1) if duration else None,
+        'latency_p50_ms': round(percentile(latencies, 0.50) * 1000, 3) if latencies else None,
+        'latency_p99_ms': round(percentile(latencies, 0.99) * 1000, 3) if latencies else None,
+        'accuracy': round(correct / total, 4) if total else None,
+        'peak_rss_kb': peak_rss_kb()
+    }
+
+
+def bench_port_scan(farm, threads, timeout):
+    """Connect scan of every farm port on every farm host through the probe scheduler"""
+    prober = ConnectProber(timeout)
+    transport = default_transport(prober, threads)
+    scheduler = ProbeScheduler(transport, threads, timeout)
+    probes = [(host, port) for host in farm.hosts for port in farm.ports]
+
+    start = time.perf_counter()
+    try:
+        results = list(scheduler.run(probes))
+    finally:
+        transport.close()
+    duration = time.perf_counter() - start
+
+    correct = sum(1 for result in results if result.state == farm.expected_state(result.port))
+    summary = _summarize([result.rtt for result in results], duration, correct, len(results))
+    summary['errors'] = sum(1 for result in results if result.state == ERROR)
+    return summary
+
+
+def bench_discovery(farm, threads, timeout):
+    """Ping sweep over the farm hosts"""
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        results = list(executor.map(lambda host: _timed(ping_host, host, max(1, timeout)), farm.hosts))
+    duration = time.perf_counter() - start
+    correct = sum(1 for (_, alive), _ in results if alive)
+    return _summarize([latency for _, latency in results], duration, correct, len(results))
+
+
+def bench_banner(farm, threads, timeout):
+    """Banner grabs from every open farm port"""
+    jobs = [(host, port) for host in farm.hosts for port in farm.open_ports]
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        results = list(executor.map(lambda job: _timed(grab_banner, job[0], job[1], None, timeout), jobs))
+    duration = time.perf_counter() - start
+    expected = FARM_BANNER.decode().strip()
+    correct = sum(1 for banner, _ in results if banner == expected)
+    return _summarize([latency for _, latency in results], duration, correct, len(results))
+
+
+def bench_service_detection(farm, threads, timeout):
+    """Probe every farm port and grab banners from the open ones, like detect_services"""
+    prober = ConnectProber(timeout)
+    expected = FARM_BANNER.decode().strip()
+
+    def check(job):
+        host, port = job
+        start = time.perf_counter()
+        state, _ = prober.probe(host, port)
+        banner = grab_banner(host, port, None, timeout) if state == OPEN else None
+        ok = state == farm.expected_state(port) and (state != OPEN or banner == expected)
+        return ok, time.perf_counter() - start
+
+    jobs = [(host, port) for host in farm.hosts for port in farm.ports]
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        results = list(executor.map(check, jobs))
+    duration = time.perf_counter() - start
+    correct = sum(1 for ok, _ in results if ok)
+    return _summarize([latency for _, latency in results], duration, correct, len(results))
+
+
+STAGES = {
+    'port_scan': bench_port_scan,
+    'discovery': bench_discovery,
+    'banner': bench_banner,
+    'service_detection': bench_service_detection
+}
+
+
+def run_benchmarks(farm, stages, threads, timeout, repeat=1):
+    """Run the selected stages against a started farm"""
+    results = {}
+    for name in stages:
+        runs = [STAGES[name](farm, threads, timeout) for _ in range(repeat)]
+        # Keep the fastest run; slower ones mostly measure noise on the host
+        results[name] = max(runs, key=lambda run: run['probes_per_s'] or 0)
+        results[name]['runs'] = repeat
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='DuckScanner benchmark suite')
+    parser.add_argument('--hosts', type=int, default=4,
+                       help='Number of loopback farm hosts (default: 4)')
+    parser.add_argument('--open-ports', default='20001-20010',
+                       help='Ports with listeners (default: 20001-20010)')
+    parser.add_argument('--closed-ports', default='21001-21090',
+                       help='Ports answered with RST (default: 21001-21090)')
+    parser.add_argument('--blackhole-ports', default='22001-22002',
+                       help='Ports that silently drop SYNs (default: 22001-22002)')
+    parser.add_argument('-t', '--threads', type=int, default=100,
+                       help='Worker threads (default: 100)')
+    parser.add_argument('--timeout', type=float, default=0.5,
+                       help='Probe timeout in seconds (default: 0.5)')
+    parser.add_argument('--stages', default=','.join(STAGES),
+                       help=f'Comma-separated stages to run (default: {",".join(STAGES)})')
+    parser.add_argument('--repeat', type=int, default=1,
+                       help='Runs per stage, best run is reported (default: 1)')
+    parser.add_argument('-o', '--output', default='benchmark_results.json',
+                       help='JSON results file (default: benchmark_results.json)')
+
+    args = parser.parse_args()
+    stages = [stage.strip() for stage in args.stages.split(',') if stage.strip()]
+    unknown = [stage for stage in stages if stage not in STAGES]
+    if unknown:
+        parser.error(f"Unknown stages: {', '.join(unknown)}")
+
+    farm = TargetFarm(args.hosts, parse_ports(args.open_ports), parse_ports(args.closed_ports),
+                      parse_ports(args.blackhole_ports))
+
+    print(f"Starting target farm: {len(farm.hosts)} hosts x {len(farm.ports)} ports")
+    with farm:
+        results = run_benchmarks(farm, stages, args.threads, args.timeout, args.repeat)
+
+    report = {
+        'timestamp': datetime.now().isoformat(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'config': {
+            'hosts': len(farm.hosts),
+            'open_ports': len(farm.open_ports),
+            'closed_ports': len(farm.closed_ports),
+            'blackhole_ports': len(farm.blackhole_ports),
+            'threads': args.threads,
+            'timeout': args.timeout
+        },
+        'results': results
+    }
+
+    print("-" * 72)
+    print(f"{'Stage':<20}{'Probes/s':>12}{'p50 ms':>10}{'p99 ms':>10}{'Accuracy':>10}{'RSS KiB':>10}")
+    for name, result in results.items():
+        print(f"{name:<20}{result['probes_per_s'] or 0:>12}{result['latency_p50_ms'] or 0:>10}"
+              f"{result['latency_p99_ms'] or 0:>10}{result['accuracy'] or 0:>10}{result['peak_rss_kb'] or 0:>10}")
+
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"\nResults written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,322 @@
+#!/usr/bin/env python3
+"""
+Service Checks
+Post-discovery check scripts sharing one connection per open port, run on a bounded async worker pool
+"""
+
+import asyncio
+import importlib.util
+import os
+import re
+import time
+from collections import namedtuple
+
+from metrics import REGISTRY as METRICS
+from scan_engine import TIMEOUT, ERROR
+
+FOUND = 'found'
+CLEAN = 'clean'
+
+CHECK_RESULTS = METRICS.counter('duckscanner_check_results_total', 'Finished check scripts by outcome',
+                                ['check', 'status'])
+CHECK_SECONDS = METRICS.histogram('duckscanner_check_seconds', 'Time spent in a check script')
+
+CheckResult = namedtuple('CheckResult', ['host', 'port', 'check', 'status', 'detail', 'elapsed'])
+
+# Registered checks by name, in registration order
+REGISTRY = {}
+
+_UNREAD = object()
+
+
+class Check:
+    """Base class for check scripts
+
+    A check names the ports and service names it applies to, or a banner
+    pattern, and implements run(conn). run returns a short description of
+    what it found, or None when the target is clean. Checks that leave the
+    session in a different state (logged in, switched protocol) set
+    stateful so later checks get a fresh connection. Each run is cut off
+    after timeout seconds.
+    """
+
+    name = None
+    description = ''
+    ports = ()
+    services = ()
+    banner = None
+    timeout = 5.0
+    stateful = False
+
+    def applies(self, port, service=None, banner=None):
+        if port in self.ports:
+            return True
+        if service and service.lower() in (name.lower() for name in self.services):
+            return True
+        return bool(self.banner and banner and re.search(self.banner, banner, re.IGNORECASE))
+
+    async def run(self, conn):
+        raise NotImplementedError
+
+
+def register(check):
+    """Class decorator adding a check to the registry; a later check with the same name replaces it"""
+    if not check.name:
+        raise ValueError(f"{check.__name__} has no name")
+    REGISTRY[check.name] = check()
+    return check
+
+
+def load_plugins(path):
+    """Import every .py file in a directory so its checks register themselves; returns the count"""
+    loaded = 0
+    for filename in sorted(os.listdir(path)):
+        if not filename.endswith('.py') or filename.startswith('_'):
+            continue
+        name = f"duckscanner_check_{filename[:-3]}"
+        spec = importlib.util.spec_from_file_location(name, os.path.join(path, filename))
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        loaded += 1
+    return loaded
+
+
+def select_checks(names=None):
+    """Registered checks by comma-separated names, or all of them"""
+    if not names or names == 'all':
+        return list(REGISTRY.values())
+    selected = []
+    for name in names.split(','):
+        name = name.strip()
+        if name not in REGISTRY:
+            raise ValueError(f"Unknown check {name}: choose from {', '.join(REGISTRY)}")
+        selected.append(REGISTRY[name])
+    return selected
+
+
+class Connection:
+    """The connection a target's checks share, opened on first use
+
+    banner is the cached banner when the caller had one, else the first
+    line the server volunteers. A failed connect is remembered so the
+    remaining checks fail fast instead of reconnecting.
+    """
+
+    def __init__(self, host, port, banner=None, connect_timeout=3.0):
+        self.host = host
+        self.port = port
+        self.banner = banner
+        self.connect_timeout = connect_timeout
+        self.reader = None
+        self.writer = None
+        self.failure = None
+        self.connects = 0
+        self._greeting = _UNREAD
+
+    async def open(self):
+        if self.failure is not None:
+            raise self.failure
+        if self.writer is None:
+            try:
+                self.reader, self.writer = await asyncio.wait_for(
+                    asyncio.open_connection(self.host, self.port), self.connect_timeout)
+            except (OSError, asyncio.TimeoutError) as e:
+                self.failure = ConnectionError(f"connect failed: {e or 'timed out'}")
+                raise self.failure
+            self.connects += 1
+            self._greeting = _UNREAD
+        return self
+
+    async def greeting(self, timeout=1.0):
+        """What the server sent before being spoken to on this connection, '' if nothing"""
+        await self.open()
+        if self._greeting is _UNREAD:
+            try:
+                data = await asyncio.wait_for(self.reader.read(4096), timeout)
+            except asyncio.TimeoutError:
+                data = b''
+            self._greeting = data.decode('utf-8', errors='replace')
+            if self.banner is None and self._greeting.strip():
+                self.banner = self._greeting.strip().splitlines()[0][:100]
+        return self._greeting
+
+    async def send(self, data):
+        await self.open()
+        self.writer.write(data.encode() if isinstance(data, str) else data)
+        await self.writer.drain()
+
+    async def read(self, size=4096):
+        """Up to size bytes as text, '' once the server has closed"""
+        await self.open()
+        return (await self.reader.read(size)).decode('utf-8', errors='replace')
+
+    async def readline(self):
+        await self.open()
+        return (await self.reader.readline()).decode('utf-8', errors='replace').rstrip('\r\n')
+
+    async def request(self, data, line=False):
+        """Send data and return the reply: one line, or whatever the first read brings"""
+        await self.send(data)
+        return await (self.readline() if line else self.read())
+
+    async def close(self):
+        """Drop the connection; the next use opens a new one"""
+        writer, self.reader, self.writer = self.writer, None, None
+        if writer is not None:
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except Exception:
+                pass
+
+
+class CheckRunner:
+    """Runs the applicable checks for many open ports in one pass
+
+    A fixed pool of concurrency workers takes targets from a shared queue,
+    so at most that many connections are open at once however large the
+    estate. A target's checks run one after another on its connection.
+    Every check runs under its own timeout (or timeout, when given, for
+    all of them). A check that times out, raises or is stateful leaves the
+    next check a fresh connection.
+    """
+
+    def __init__(self, checks=None, concurrency=100, connect_timeout=3.0, timeout=None):
+        self.checks = list(REGISTRY.values()) if checks is None else list(checks)
+        self.concurrency = max(1, concurrency)
+        self.connect_timeout = connect_timeout
+        self.timeout = timeout
+        self.connects = 0
+
+    def select(self, port, service=None, banner=None):
+        return [check for check in self.checks if check.applies(port, service, banner)]
+
+    async def run(self, targets, callback=None):
+        """Check (host, port, service, banner) targets; returns every CheckResult"""
+        queue = asyncio.Queue()
+        for host, port, service, banner in targets:
+            checks = self.select(port, service, banner)
+            if checks:
+                queue.put_nowait((host, port, banner, checks))
+        results = []
+
+        async def worker():
+            while True:
+                try:
+                    target = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                await self.check_target(*target, results=results, callback=callback)
+
+        await asyncio.gather(*(worker() for _ in range(min(self.concurrency, queue.qsize()))))
+        return results
+
+    async def check_target(self, host, port, banner, checks, results=None, callback=None):
+        conn = Connection(host, port, banner, self.connect_timeout)
+        try:
+            for check in checks:
+                timeout = self.timeout or check.timeout
+                start = time.perf_counter()
+                fresh = check.stateful
+                try:
+                    detail = await asyncio.wait_for(check.run(conn), timeout)
+                    status = FOUND if detail else CLEAN
+                except asyncio.TimeoutError:
+                    status, detail, fresh = TIMEOUT, f"no answer within {timeout:g}s", True
+                except Exception as e:
+                    status, detail, fresh = ERROR, str(e) or e.__class__.__name__, True
+                elapsed = time.perf_counter() - start
+                CHECK_RESULTS.inc(check.name, status)
+                CHECK_SECONDS.observe(elapsed)
+                result = CheckResult(host, port, check.name, status, detail, elapsed)
+                if results is not None:
+                    results.append(result)
+                if callback is not None:
+                    callback(result)
+                if fresh:
+                    await conn.close()
+        finally:
+            await conn.close()
+            self.connects += conn.connects
+
+    def run_sync(self, targets, callback=None):
+        """run() from synchronous code, on a private event loop"""
+        return asyncio.run(self.run(targets, callback))
+
+
+def format_result(result):
+    marker = {FOUND: '!', CLEAN: '-', TIMEOUT: '?', ERROR: '?'}[result.status]
+    detail = f": {result.detail}" if result.detail else ''
+    return f"[{marker}] {result.host}:{result.port} {result.check} {result.status}{detail}"
+
+
+# Built-in checks
+
+@register
+class FTPAnonymous(Check):
+    name = 'ftp-anon'
+    description = 'FTP server accepts anonymous logins'
+    ports = (21,)
+    services = ('FTP',)
+    stateful = True
+
+    async def run(self, conn):
+        greeting = await conn.greeting(timeout=3)
+        if not greeting.startswith('220'):
+            return None
+        reply = await conn.request('USER anonymous\r\n', line=True)
+        if reply.startswith('331'):
+            reply = await conn.request('PASS anonymous@example.com\r\n', line=True)
+        if reply.startswith('230'):
+            await conn.send('QUIT\r\n')
+            return 'anonymous login allowed'
+        return None
+
+
+@register
+class RedisNoAuth(Check):
+    name = 'redis-noauth'
+    description = 'Redis answers commands without authentication'
+    ports = (6379,)
+    services = ('Redis',)
+
+    async def run(self, conn):
+        reply = await conn.request('INFO server\r\n')
+        if reply.startswith('-'):
+            # -NOAUTH or -ERR: a password is required or the command is refused
+            return None
+        if reply.startswith('$'):
+            version = re.search(r'redis_version:(\S+)', reply)
+            return f"no authentication (version {version.group(1)})" if version else 'no authentication'
+        return None
+
+
+@register
+class MemcachedOpen(Check):
+    name = 'memcached-open'
+    description = 'memcached serves stats to anyone'
+    ports = (11211,)
+    services = ('Memcached',)
+
+    async def run(self, conn):
+        reply = await conn.request('stats\r\n')
+        if reply.startswith('STAT '):
+            version = re.search(r'STAT version (\S+)', reply)
+            return f"stats readable (version {version.group(1)})" if version else 'stats readable'
+        return None
+
+
+@register
+class SSHProtocol1(Check):
+    name = 'ssh-v1'
+    description = 'SSH server still offers protocol 1'
+    ports = (22,)
+    services = ('SSH',)
+    banner = r'^SSH-'
+
+    async def run(self, conn):
+        banner = conn.banner if conn.banner and conn.banner.startswith('SSH-') else await conn.greeting(timeout=3)
+        match = re.match(r'SSH-(1\.\d+)', banner)
+        if match:
+            return f"protocol {match.group(1)} offered"
+        return None
@@ -53,5 +53,25 @@ def run_example():
         except Exception as e:
             print(f"❌ Error: {e}")
 
+def run_library_example():
+    """Scan in-process through the scan API"""
+    import asyncio
+    import scan_api
+    
+    print("\nLibrary usage")
+    print("=" * 30)
+    
+    # Synchronous: findings arrive as the scan runs
+    for finding in scan_api.scan_iter("127.0.0.1", "22,80,443,8080", timeout=0.5):
+        print(f"sync:  {finding.host}:{finding.port} {finding.state}")
+    
+    # Asynchronous: the scan runs off the event loop, with backpressure
+    async def scan_async():
+        async for finding in scan_api.scan("127.0.0.1", range(1, 1025), concurrency=200):
+            print(f"async: {finding.host}:{finding.port} {finding.state}")
+    
+    asyncio.run(scan_async())
+
 if __name__ == "__main__":
     run_example()
+    run_library_example()
@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+"""
+Exclusion Lists
+Addresses and ports that must never be probed, kept as sorted intervals
+"""
+
+import bisect
+import ipaddress
+import threading
+
+
+class IntervalSet:
+    """Sorted set of merged, closed integer intervals with bisect lookups"""
+
+    def __init__(self):
+        self._starts = []
+        self._ends = []
+        self._pending = []
+        self._lock = threading.Lock()
+
+    def add(self, start, end=None):
+        """Add the closed interval [start, end]"""
+        if end is None:
+            end = start
+        if end < start:
+            start, end = end, start
+        with self._lock:
+            self._pending.append((start, end))
+
+    def _merge(self):
+        """Fold pending intervals into the sorted start/end lists"""
+        with self._lock:
+            if not self._pending:
+                return
+            intervals = sorted(list(zip(self._starts, self._ends)) + self._pending)
+            starts, ends = [], []
+            for start, end in intervals:
+                if ends and start <= ends[-1] + 1:
+                    if end > ends[-1]:
+                        ends[-1] = end
+                else:
+                    starts.append(start)
+                    ends.append(end)
+            self._starts, self._ends = starts, ends
+            self._pending = []
+
+    def __contains__(self, value):
+        if self._pending:
+            self._merge()
+        i = bisect.bisect_right(self._starts, value) - 1
+        return i >= 0 and value <= self._ends[i]
+
+    def __len__(self):
+        if self._pending:
+            self._merge()
+        return len(self._starts)
+
+    def __iter__(self):
+        if self._pending:
+            self._merge()
+        return iter(list(zip(self._starts, self._ends)))
+
+
+class ExclusionList:
+    """Excluded addresses (CIDRs, ranges, single IPs) and ports"""
+
+    def __init__(self):
+        self.addresses = {4: IntervalSet(), 6: IntervalSet()}
+        self.ports = IntervalSet()
+
+    def __bool__(self):
+        return bool(len(self.ports) or len(self.addresses[4]) or len(self.addresses[6]))
+
+    def add(self, entry):
+        """Add a single entry: port, port range, IP, IP range or CIDR"""
+        entry = entry.strip()
+        if not entry:
+            return
+
+        # Ports: "22" or "8000-8100"
+        if entry.replace('-', '').isdigit():
+            if '-' in entry:
+                start, end = map(int, entry.split('-', 1))
+            else:
+                start = end = int(entry)
+            if not (0 <= start <= 65535 and 0 <= end <= 65535):
+                raise ValueError(f"Port out of range: {entry}")
+            self.ports.add(start, end)
+            return
+
+        # Address ranges: "10.0.0.1-10.0.0.50"
+        if '-' in entry and '/' not in entry:
+            first, last = entry.split('-', 1)
+            first = ipaddress.ip_address(first.strip())
+            last = ipaddress.ip_address(last.strip())
+            if first.version != last.version:
+                raise ValueError(f"Mixed address families in range: {entry}")
+            self.addresses[first.version].add(int(first), int(last))
+            return
+
+        # CIDR blocks and single addresses
+        network = ipaddress.ip_network(entry, strict=False)
+        self.addresses[network.version].add(int(network.network_address),
+                                            int(network.broadcast_address))
+
+    def add_spec(self, spec):
+        """Add comma or whitespace separated entries"""
+        for entry in spec.replace(',', ' ').split():
+            self.add(entry)
+
+    def load_file(self, path):
+        """Load entries from a file, one or more per line, '#' starts a comment"""
+        with open(path, 'r') as f:
+            for line in f:
+                line = line.split('#', 1)[0]
+                if line.strip():
+                    self.add_spec(line)
+
+    def excludes_host(self, host):
+        """Check whether an IP address is excluded"""
+        try:
+            address = ipaddress.ip_address(host)
+        except ValueError:
+            return False
+        return int(address) in self.addresses[address.version]
+
+    def excludes_port(self, port):
+        """Check whether a port is excluded"""
+        return port in self.ports
+
+    def filter_ports(self, ports):
+        """Return ports that are not excluded"""
+        if not len(self.ports):
+            return list(ports)
+        return [port for port in ports if port not in self.ports]
+
+    def filter_hosts(self, hosts):
+        """Yield hosts that are not excluded"""
+        for host in hosts:
+            if not self.excludes_host(host):
+                yield host
+
+
+def build_exclusions(exclude=None, exclude_file=None):
+    """Build an ExclusionList from a spec string and/or a file path"""
+    exclusions = ExclusionList()
+    if exclude:
+        exclusions.add_spec(exclude)
+    if exclude_file:
+        exclusions.load_file(exclude_file)
+    return exclusions
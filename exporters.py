@@ -0,0 +1,435 @@
+#!/usr/bin/env python3
+"""
+Result Exporters
+Streaming writers for JSON, JSON Lines, CSV, nmap XML, grepable and binary result files
+"""
+
+import csv
+import json
+import mmap
+import os
+import re
+import shutil
+import struct
+import tempfile
+import time
+from datetime import datetime
+
+from scan_engine import STATE_CODES, UNKNOWN_CODE
+
+PROTO_CODES = {'tcp': 0, 'udp': 1}
+
+# Binary layout: header, fixed-size records, then the string table
+BINARY_MAGIC = b'DSR1'
+BINARY_VERSION = 1
+HEADER = struct.Struct('<4sHHQQI')     # magic, version, flags, records, table offset, strings
+RECORD = struct.Struct('<IHBBIId')     # host id, port, proto, state, service id, banner id, timestamp
+OFFSET = struct.Struct('<Q')
+NO_STRING = 0xFFFFFFFF
+NO_TIMESTAMP = float('nan')
+INTERN_LIMIT = 65536
+
+# Characters XML 1.0 forbids even as references; banners are written with them as \xNN
+XML_INVALID = re.compile('[^\t\n\r\x20-\ud7ff\ue000-\ufffd\U00010000-\U0010ffff]')
+
+
+def make_row(host, port, state='open', service=None, banner=None, proto='tcp', timestamp=None):
+    """Build an export row"""
+    return {'host': host, 'port': port, 'proto': proto, 'state': state,
+            'service': service, 'banner': banner, 'timestamp': timestamp}
+
+
+def history_rows(history):
+    """Flatten scan history entries into export rows, one scan at a time"""
+    for scan in history:
+        try:
+            timestamp = datetime.fromisoformat(scan['timestamp']).timestamp()
+        except (KeyError, ValueError):
+            timestamp = None
+        host = scan.get('address') or scan.get('target')
+        for result in scan.get('results', []):
+            yield make_row(host, result['port'], result.get('state', 'open'), result.get('service'),
+                           result.get('banner'), result.get('proto', 'tcp'), timestamp)
+
+
+def _banner(row):
+    banner = row.get('banner')
+    return None if banner in (None, '', 'No banner') else banner
+
+
+def _xml_attr(value):
+    """Quoted XML attribute value (xml.sax.saxutils drags in urllib at import time)"""
+    value = XML_INVALID.sub(lambda match: f'\\x{ord(match.group()):02x}', str(value))
+    value = value.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;').replace('"', '&quot;')
+    return '"' + value.replace('\n', '&#10;').replace('\r', '&#13;').replace('\t', '&#9;') + '"'
+
+
+def _address_type(host):
+    return 'ipv6' if host and ':' in host else 'ipv4'
+
+
+class ResultWriter:
+    """Base class: write rows one at a time, close() finishes the file"""
+
+    def __init__(self, path):
+        self.path = path
+        self.count = 0
+
+    def write(self, row):
+        raise NotImplementedError
+
+    def write_all(self, rows):
+        for row in rows:
+            self.write(row)
+        return self.count
+
+    def close(self):
+        """Finish and close the output file"""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class JSONWriter(ResultWriter):
+    """A JSON array written element by element"""
+
+    def __init__(self, path):
+        super().__init__(path)
+        self.file = open(path, 'w')
+        self.file.write('[')
+
+    def write(self, row):
+        self.file.write(',\n  ' if self.count else '\n  ')
+        self.file.write(json.dumps(row))
+        self.count += 1
+
+    def close(self):
+        self.file.write('\n]\n' if self.count else ']\n')
+        self.file.close()
+
+
+class JSONLinesWriter(ResultWriter):
+    """One JSON object per line"""
+
+    def __init__(self, path):
+        super().__init__(path)
+        self.file = open(path, 'w')
+
+    def write(self, row):
+        self.file.write(json.dumps(row) + '\n')
+        self.count += 1
+
+    def close(self):
+        self.file.close()
+
+
+class CSVWriter(ResultWriter):
+    """CSV with a header row"""
+
+    def __init__(self, path):
+        super().__init__(path)
+        self.file = open(path, 'w', newline='')
+        self.writer = csv.writer(self.file)
+        self.writer.writerow(['Host', 'Port', 'Protocol', 'State', 'Service', 'Banner', 'Timestamp'])
+
+    def write(self, row):
+        timestamp = row.get('timestamp')
+        self.writer.writerow([row.get('host'), row['port'], row.get('proto', 'tcp'), row.get('state'),
+                              row.get('service'), _banner(row) or '',
+                              datetime.fromtimestamp(timestamp).isoformat() if timestamp else ''])
+        self.count += 1
+
+    def close(self):
+        self.file.close()
+
+
+class TextWriter(ResultWriter):
+    """Human-readable listing"""
+
+    def __init__(self, path):
+        super().__init__(path)
+        self.file = open(path, 'w')
+
+    def write(self, row):
+        host = f"{row['host']} " if row.get('host') else ''
+        self.file.write(f"{host}Port {row['port']}/{row.get('proto', 'tcp')} {row.get('state', 'open')} - {row.get('service')}\n")
+        banner = _banner(row)
+        if banner:
+            self.file.write(f"Banner: {banner}\n")
+        self.file.write("\n")
+        self.count += 1
+
+    def close(self):
+        self.file.close()
+
+
+class NmapXMLWriter(ResultWriter):
+    """nmap -oX compatible XML; consecutive rows of a host share one <host> element"""
+
+    def __init__(self, path, args='duckscanner'):
+        super().__init__(path)
+        self.file = open(path, 'w', encoding='utf-8')
+        self.host = None
+        self.started = int(time.time())
+        self.hosts = 0
+        self.file.write('<?xml version="1.0" encoding="UTF-8"?>\n')
+        self.file.write(f'<nmaprun scanner="duckscanner" args={_xml_attr(args)} start="{self.started}" '
+                        f'version="1.0" xmloutputversion="1.05">\n')
+
+    def _close_host(self):
+        if self.host is not None:
+            self.file.write('</ports>\n</host>\n')
+            self.host = None
+
+    def write(self, row):
+        host = row.get('host')
+        if host != self.host:
+            self._close_host()
+            self.host = host
+            self.hosts += 1
+            self.file.write(f'<host><status state="up" reason="user-set"/>\n'
+                            f'<address addr={_xml_attr(str(host))} addrtype="{_address_type(host)}"/>\n<ports>\n')
+        state = row.get('state', 'open')
+        state = 'filtered' if state == 'timeout' else state
+        self.file.write(f'<port protocol="{row.get("proto", "tcp")}" portid="{row["port"]}">'
+                        f'<state state={_xml_attr(state)} reason="{"syn-ack" if state == "open" else "reset"}"/>')
+        if row.get('service'):
+            self.file.write(f'<service name={_xml_attr(str(row["service"]).lower())} method="table" conf="3"/>')
+        banner = _banner(row)
+        if banner:
+            self.file.write(f'<script id="banner" output={_xml_attr(banner)}/>')
+        self.file.write('</port>\n')
+        self.count += 1
+
+    def close(self):
+        self._close_host()
+        finished = int(time.time())
+        self.file.write(f'<runstats><finished time="{finished}" elapsed="{finished - self.started}"/>'
+                        f'<hosts up="{self.hosts}" down="0" total="{self.hosts}"/></runstats>\n</nmaprun>\n')
+        self.file.close()
+
+
+class GrepableWriter(ResultWriter):
+    """nmap -oG style: one line per host, buffering only the current host's ports"""
+
+    def __init__(self, path):
+        super().__init__(path)
+        self.file = open(path, 'w')
+        self.host = None
+        self.ports = []
+        self.file.write(f"# DuckScanner scan initiated {datetime.now().strftime('%a %b %d %H:%M:%S %Y')}\n")
+
+    def _flush_host(self):
+        if self.host is not None:
+            self.file.write(f"Host: {self.host} ()\tPorts: {', '.join(self.ports)}\n")
+        self.host = None
+        self.ports = []
+
+    def write(self, row):
+        if row.get('host') != self.host:
+            self._flush_host()
+            self.host = row.get('host')
+        service = (row.get('service') or '').lower().replace('/', '|')
+        banner = (_banner(row) or '').replace('/', '|').replace(',', ' ')
+        state = 'filtered' if row.get('state') == 'timeout' else row.get('state', 'open')
+        self.ports.append(f"{row['port']}/{state}/{row.get('proto', 'tcp')}//{service}//{banner}/")
+        self.count += 1
+
+    def close(self):
+        self._flush_host()
+        self.file.write(f"# DuckScanner done at {datetime.now().strftime('%a %b %d %H:%M:%S %Y')}\n")
+        self.file.close()
+
+
+class BinaryWriter(ResultWriter):
+    """Fixed-size struct records plus a deduplicated string table
+
+    Records are written straight to the output; strings and their offsets
+    go to spool files and are appended as a table on close(). The intern map is capped so
+    memory stays bounded on exports with millions of distinct banners;
+    past the cap a repeated string may be stored twice.
+    """
+
+    def __init__(self, path):
+        super().__init__(path)
+        self.file = open(path, 'wb')
+        self.file.write(HEADER.pack(BINARY_MAGIC, BINARY_VERSION, 0, 0, 0, 0))
+        self.spool = tempfile.TemporaryFile()
+        self.offset_spool = tempfile.TemporaryFile()
+        self.offset_spool.write(OFFSET.pack(0))
+        self.strings = 0
+        self.end = 0
+        self.interned = {}
+
+    def _string_id(self, value):
+        if value is None:
+            return NO_STRING
+        string_id = self.interned.get(value)
+        if string_id is None:
+            if len(self.interned) >= INTERN_LIMIT:
+                self.interned.clear()
+            data = value.encode('utf-8', 'replace')
+            self.spool.write(data)
+            string_id = self.strings
+            self.strings += 1
+            self.end += len(data)
+            self.offset_spool.write(OFFSET.pack(self.end))
+            self.interned[value] = string_id
+        return string_id
+
+    def write(self, row):
+        timestamp = row.get('timestamp')
+        self.file.write(RECORD.pack(
+            self._string_id(row.get('host')),
+            row['port'],
+            PROTO_CODES.get(row.get('proto', 'tcp'), UNKNOWN_CODE),
+            STATE_CODES.get(row.get('state', 'open'), UNKNOWN_CODE),
+            self._string_id(row.get('service')),
+            self._string_id(_banner(row)),
+            NO_TIMESTAMP if timestamp is None else timestamp
+        ))
+        self.count += 1
+
+    def close(self):
+        table_offset = self.file.tell()
+        for spool in (self.offset_spool, self.spool):
+            spool.seek(0)
+            shutil.copyfileobj(spool, self.file)
+            spool.close()
+        self.file.seek(0)
+        self.file.write(HEADER.pack(BINARY_MAGIC, BINARY_VERSION, 0, self.count, table_offset, self.strings))
+        self.file.close()
+
+
+class BinaryResultFile:
+    """Memory-mapped reader for files written by BinaryWriter"""
+
+    def __init__(self, path):
+        self.file = open(path, 'rb')
+        size = os.fstat(self.file.fileno()).st_size
+        if size < HEADER.size:
+            self.file.close()
+            raise ValueError(f"{path} is not a DuckScanner binary result file")
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, _, self.records, table_offset, strings = HEADER.unpack_from(self.map, 0)
+        if magic != BINARY_MAGIC or version != BINARY_VERSION:
+            self.close()
+            raise ValueError(f"{path} is not a DuckScanner binary result file")
+        self.string_count = strings
+        self.table_offset = table_offset
+        self.blob_start = table_offset + OFFSET.size * (strings + 1)
+        self.states = {code: name for name, code in STATE_CODES.items()}
+        self.protos = {code: name for name, code in PROTO_CODES.items()}
+        self._strings = {}
+
+    def string(self, string_id):
+        """Decode one string table entry"""
+        if string_id == NO_STRING:
+            return None
+        value = self._strings.get(string_id)
+        if value is None:
+            start, end = struct.unpack_from('<QQ', self.map, self.table_offset + OFFSET.size * string_id)
+            value = self.map[self.blob_start + start:self.blob_start + end].decode('utf-8')
+            if len(self._strings) < INTERN_LIMIT:
+                self._strings[string_id] = value
+        return value
+
+    def _row(self, fields):
+        host, port, proto, state, service, banner, timestamp = fields
+        return {
+            'host': self.string(host),
+            'port': port,
+            'proto': self.protos.get(proto, 'unknown'),
+            'state': self.states.get(state, 'unknown'),
+            'service': self.string(service),
+            'banner': self.string(banner),
+            'timestamp': None if timestamp != timestamp else timestamp
+        }
+
+    def __len__(self):
+        return self.records
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += self.records
+        if not 0 <= index < self.records:
+            raise IndexError(index)
+        return self._row(RECORD.unpack_from(self.map, HEADER.size + index * RECORD.size))
+
+    def __iter__(self):
+        end = HEADER.size + self.records * RECORD.size
+        for fields in RECORD.iter_unpack(memoryview(self.map)[HEADER.size:end]):
+            yield self._row(fields)
+
+    def close(self):
+        self.map.close()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+WRITERS = {
+    'json': JSONWriter,
+    'jsonl': JSONLinesWriter,
+    'csv': CSVWriter,
+    'txt': TextWriter,
+    'xml': NmapXMLWriter,
+    'gnmap': GrepableWriter,
+    'dsr': BinaryWriter
+}
+
+EXTENSIONS = {
+    '.json': 'json', '.jsonl': 'jsonl', '.ndjson': 'jsonl', '.csv': 'csv', '.txt': 'txt',
+    '.xml': 'xml', '.gnmap': 'gnmap', '.dsr': 'dsr'
+}
+
+# For file dialogs
+FILETYPES = [
+    ("JSON files", "*.json"), ("JSON Lines", "*.jsonl"), ("CSV files", "*.csv"),
+    ("nmap XML", "*.xml"), ("Grepable (nmap -oG)", "*.gnmap"),
+    ("DuckScanner binary", "*.dsr"), ("Text files", "*.txt")
+]
+
+
+def format_for(path, default='txt'):
+    """Pick an export format from a file extension"""
+    return EXTENSIONS.get(os.path.splitext(path)[1].lower(), default)
+
+
+def open_writer(path, fmt=None):
+    """Open a streaming writer for path, choosing the format from its extension"""
+    fmt = fmt or format_for(path)
+    if fmt not in WRITERS:
+        raise ValueError(f"Unknown export format: {fmt}")
+    return WRITERS[fmt](path)
+
+
+def export(rows, path, fmt=None):
+    """Stream rows to path and return how many were written"""
+    with open_writer(path, fmt) as writer:
+        return writer.write_all(rows)
+
+
+def read_results(path):
+    """Iterate over the rows of a JSON Lines, JSON or binary export"""
+    fmt = format_for(path)
+    if fmt == 'dsr':
+        with BinaryResultFile(path) as results:
+            yield from results
+    elif fmt == 'jsonl':
+        with open(path, 'r') as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+    elif fmt == 'json':
+        with open(path, 'r') as f:
+            yield from json.load(f)
+    else:
+        raise ValueError(f"Cannot read results back from {fmt} files")
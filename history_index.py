@@ -0,0 +1,347 @@
+#!/usr/bin/env python3
+"""
+History Index
+SQLite index over scan history for fast searches by banner text, port, service and host
+"""
+
+import json
+import os
+import sqlite3
+import sys
+import time
+
+from history_store import LEGACY_FILE, STORE_FILE as HISTORY_FILE, HistoryStore
+INDEX_FILE = 'scan_history.db'
+
+# Query keys accepted in search strings such as "port:6379 host:10.0.* redis"
+QUERY_KEYS = ('port', 'service', 'host', 'target', 'state', 'since', 'until')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE IF NOT EXISTS scans (
+    id INTEGER PRIMARY KEY,
+    fingerprint TEXT UNIQUE,
+    timestamp TEXT,
+    target TEXT,
+    address TEXT,
+    ports TEXT,
+    open_ports INTEGER,
+    duration REAL
+);
+CREATE TABLE IF NOT EXISTS findings (
+    id INTEGER PRIMARY KEY,
+    scan_id INTEGER REFERENCES scans(id),
+    host TEXT,
+    port INTEGER,
+    state TEXT,
+    service TEXT COLLATE NOCASE,
+    banner TEXT,
+    timestamp TEXT
+);
+CREATE INDEX IF NOT EXISTS findings_port ON findings(port);
+CREATE INDEX IF NOT EXISTS findings_service ON findings(service);
+CREATE INDEX IF NOT EXISTS findings_host ON findings(host);
+CREATE INDEX IF NOT EXISTS findings_timestamp ON findings(timestamp);
+"""
+
+
+def scan_fingerprint(scan):
+    """Stable identity of a history entry"""
+    return f"{scan.get('timestamp')}|{scan.get('target')}|{scan.get('address')}"
+
+
+def parse_query(text):
+    """Split a search string into key:value filters and free banner text"""
+    filters = {}
+    words = []
+    for word in text.split():
+        key, sep, value = word.partition(':')
+        if sep and key.lower() in QUERY_KEYS and value:
+            filters[key.lower()] = value
+        else:
+            words.append(word)
+    if 'port' in filters:
+        filters['port'] = int(filters['port'])
+    if words:
+        filters['text'] = ' '.join(words)
+    return filters
+
+
+class HistoryIndex:
+    """Scan history mirrored into SQLite with B-tree indexes and a full-text banner index
+
+    The history store stays the source of truth; sync() brings the index up
+    to date and is a no-op when the file has not changed. Banner text is
+    indexed with an FTS5 trigram table (any substring of 3+ characters),
+    falling back to word-level FTS5 or plain LIKE scans on SQLite builds
+    without them.
+    """
+
+    def __init__(self, path=INDEX_FILE):
+        self.path = path
+        self.db = sqlite3.connect(path)
+        self.db.row_factory = sqlite3.Row
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('PRAGMA synchronous=NORMAL')
+        self.db.executescript(SCHEMA)
+        self.fts = self._create_fts()
+
+    def _create_fts(self):
+        existing = self.db.execute("SELECT sql FROM sqlite_master WHERE name = 'banner_fts'").fetchone()
+        if existing:
+            return 'trigram' if 'trigram' in existing[0] else 'words'
+        for kind, tokenizer in (('trigram', 'trigram'), ('words', 'unicode61')):
+            try:
+                self.db.execute(f"CREATE VIRTUAL TABLE banner_fts USING fts5(banner, content='findings', "
+                                f"content_rowid='id', tokenize='{tokenizer}')")
+                return kind
+            except sqlite3.OperationalError:
+                continue
+        return None
+
+    def close(self):
+        try:
+            # Refreshes planner statistics when they have drifted; cheap otherwise
+            self.db.execute('PRAGMA optimize')
+        except sqlite3.Error:
+            pass
+        self.db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+    # Loading
+
+    def _meta(self, key):
+        row = self.db.execute('SELECT value FROM meta WHERE key = ?', (key,)).fetchone()
+        return row[0] if row else None
+
+    def _set_meta(self, key, value):
+        self.db.execute('INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)', (key, str(value)))
+
+    def sync(self, history_path=HISTORY_FILE):
+        """Index new scans from the history file; returns the number of scans added"""
+        if not os.path.exists(history_path) and history_path == HISTORY_FILE and os.path.exists(LEGACY_FILE):
+            # History not converted yet: read the old JSON file as it is
+            history_path = LEGACY_FILE
+        if not os.path.exists(history_path):
+            return self.sync_history([])
+        stat = os.stat(history_path)
+        signature = f"{stat.st_mtime_ns}:{stat.st_size}"
+        if self._meta('source') == signature:
+            return 0
+        added = self.sync_history(HistoryStore(history_path).load())
+        with self.db:
+            self._set_meta('source', signature)
+        return added
+
+    def sync_history(self, history):
+        """Make the index match a list of history entries or a HistoryStore; returns the number of scans added
+
+        From a store only the entries missing from the index are rebuilt.
+        """
+        entries = history.entries() if isinstance(history, HistoryStore) else history
+        wanted = {}
+        for position, scan in enumerate(entries):
+            wanted.setdefault(scan_fingerprint(scan), position)
+        indexed = {row[0] for row in self.db.execute('SELECT fingerprint FROM scans')}
+        if indexed - wanted.keys():
+            # Entries were removed from history: start over
+            self.clear()
+            indexed = set()
+        new = sorted(position for fingerprint, position in wanted.items() if fingerprint not in indexed)
+        if isinstance(history, HistoryStore):
+            self._add(list(history.scans(new)))
+        else:
+            self._add([history[position] for position in new])
+        return len(new)
+
+    def add_scan(self, scan):
+        """Index a single history entry"""
+        self._add([scan])
+
+    def _add(self, scans):
+        if not scans:
+            return
+        with self.db:
+            last_id = self.db.execute('SELECT IFNULL(MAX(id), 0) FROM findings').fetchone()[0]
+            for scan in scans:
+                self._insert(scan)
+            if self.fts:
+                # One full-text insert for the batch: its findings are the rowids past last_id
+                self.db.execute('INSERT INTO banner_fts (rowid, banner) SELECT id, banner FROM findings '
+                                'WHERE id > ? AND banner IS NOT NULL', (last_id,))
+
+    def _insert(self, scan):
+        cursor = self.db.execute(
+            'INSERT OR IGNORE INTO scans (fingerprint, timestamp, target, address, ports, open_ports, duration) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?)',
+            (scan_fingerprint(scan), scan.get('timestamp'), scan.get('target'), scan.get('address'),
+             scan.get('ports'), scan.get('open_ports'), scan.get('duration')))
+        if not cursor.rowcount:
+            return
+        scan_id = cursor.lastrowid
+        host = scan.get('address') or scan.get('target')
+        rows = []
+        for result in scan.get('results', []):
+            banner = result.get('banner')
+            if banner == 'No banner':
+                banner = None
+            rows.append((scan_id, result.get('host') or host, result['port'], result.get('state', 'open'),
+                         result.get('service'), banner, scan.get('timestamp')))
+        self.db.executemany('INSERT INTO findings (scan_id, host, port, state, service, banner, timestamp) '
+                            'VALUES (?, ?, ?, ?, ?, ?, ?)', rows)
+
+    def clear(self):
+        with self.db:
+            if self.fts:
+                self.db.execute("INSERT INTO banner_fts (banner_fts) VALUES ('delete-all')")
+            self.db.execute('DELETE FROM findings')
+            self.db.execute('DELETE FROM scans')
+            self.db.execute('DELETE FROM meta')
+            self._set_meta('generation', time.time_ns())
+
+    def generation(self):
+        """Changes whenever the index is cleared, so readers holding row ids know to reload"""
+        return self._meta('generation')
+
+    # Searching
+
+    def _match(self, text):
+        """FTS5 query for banner text, or None when the text needs a LIKE scan"""
+        if self.fts == 'trigram' and len(text) >= 3:
+            return '"' + text.replace('"', '""') + '"'
+        if self.fts == 'words':
+            return '"' + text.replace('"', '""') + '"*'
+        return None
+
+    def _where(self, text=None, port=None, service=None, host=None, target=None, state=None,
+               since=None, until=None):
+        """FROM source, WHERE clause, parameters and ordering column for a set of filters"""
+        source = 'findings'
+        order = 'findings.id'
+        clauses = []
+        params = []
+        if text:
+            match = self._match(text)
+            if match:
+                # CROSS JOIN keeps the full-text index as the outer loop: probing it per
+                # row is far slower, and walking it in rowid order lets LIMIT stop early
+                source = 'banner_fts CROSS JOIN findings ON findings.id = banner_fts.rowid'
+                order = 'banner_fts.rowid'
+                clauses.append('banner_fts MATCH ?')
+                params.append(match)
+            else:
+                clauses.append("findings.banner LIKE ? ESCAPE '\\'")
+                params.append('%' + text.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%')
+        if port is not None:
+            clauses.append('findings.port = ?')
+            params.append(int(port))
+        if service:
+            clauses.append('findings.service = ?')
+            params.append(service)
+        if host:
+            if '*' in host or '?' in host:
+                clauses.append('findings.host GLOB ?')
+            else:
+                clauses.append('findings.host = ?')
+            params.append(host)
+        if target:
+            clauses.append('findings.scan_id IN (SELECT id FROM scans WHERE target = ?)')
+            params.append(target)
+        if state:
+            clauses.append('findings.state = ?')
+            params.append(state)
+        if since:
+            clauses.append('findings.timestamp >= ?')
+            params.append(since)
+        if until:
+            clauses.append('findings.timestamp < ?')
+            params.append(until)
+        where = (' WHERE ' + ' AND '.join(clauses)) if clauses else ''
+        return source, where, params, order
+
+    def search(self, limit=100, **filters):
+        """Findings matching every filter, most recently indexed first, as dicts"""
+        source, where, params, order = self._where(**filters)
+        rows = self.db.execute(
+            'SELECT findings.host, findings.port, findings.state, findings.service, findings.banner, '
+            f'findings.timestamp, scans.target FROM {source} JOIN scans ON scans.id = findings.scan_id'
+            f'{where} ORDER BY {order} DESC LIMIT ?', params + [limit])
+        return [dict(row) for row in rows]
+
+    def hosts(self, limit=1000, **filters):
+        """Distinct hosts with matching findings: (host, findings, first seen, last seen)"""
+        source, where, params, _ = self._where(**filters)
+        rows = self.db.execute(
+            'SELECT findings.host AS host, COUNT(*) AS findings, MIN(findings.timestamp) AS first_seen, '
+            f'MAX(findings.timestamp) AS last_seen FROM {source}{where} '
+            'GROUP BY findings.host ORDER BY last_seen DESC LIMIT ?', params + [limit])
+        return [dict(row) for row in rows]
+
+    def count(self, **filters):
+        source, where, params, _ = self._where(**filters)
+        return self.db.execute(f'SELECT COUNT(*) FROM {source}{where}', params).fetchone()[0]
+
+    def stats(self):
+        scans = self.db.execute('SELECT COUNT(*) FROM scans').fetchone()[0]
+        findings = self.db.execute('SELECT COUNT(*) FROM findings').fetchone()[0]
+        return {'scans': scans, 'findings': findings, 'banner_index': self.fts or 'none'}
+
+
+def format_finding(row):
+    """One line per finding for text output"""
+    banner = f"  {row['banner']}" if row.get('banner') else ''
+    return f"{row['timestamp'][:19]}  {row['host']}:{row['port']}  {row.get('service') or '-'}{banner}"
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(prog='port_scanner.py query',
+                                     description='Search scan history by banner text, port, service or host')
+    parser.add_argument('query', nargs='*',
+                       help='Banner text and/or filters such as port:6379 service:SSH host:10.0.*')
+    parser.add_argument('--port', type=int, help='Only this port')
+    parser.add_argument('--service', help='Only this service name (case-insensitive)')
+    parser.add_argument('--host', help='Only this host; * and ? wildcards allowed')
+    parser.add_argument('--since', help='Only findings at or after this ISO timestamp')
+    parser.add_argument('--hosts', action='store_true', help='List matching hosts instead of findings')
+    parser.add_argument('--limit', type=int, default=100, help='Maximum rows (default: 100)')
+    parser.add_argument('--json', action='store_true', help='Print rows as JSON lines')
+    parser.add_argument('--history', default=HISTORY_FILE,
+                       help=f'History file to index (default: {HISTORY_FILE})')
+    parser.add_argument('--index', default=INDEX_FILE, help=f'Index database (default: {INDEX_FILE})')
+    args = parser.parse_args(argv)
+
+    try:
+        filters = parse_query(' '.join(args.query))
+    except ValueError:
+        parser.error('port: takes a number')
+    for key in ('port', 'service', 'host', 'since'):
+        if getattr(args, key) is not None:
+            filters[key] = getattr(args, key)
+
+    with HistoryIndex(args.index) as index:
+        added = index.sync(args.history)
+        if added:
+            print(f"Indexed {added} new scans", file=sys.stderr)
+        start = time.perf_counter()
+        rows = index.hosts(args.limit, **filters) if args.hosts else index.search(args.limit, **filters)
+        elapsed = (time.perf_counter() - start) * 1000
+    for row in rows:
+        if args.json:
+            print(json.dumps(row))
+        elif args.hosts:
+            print(f"{row['host']:<40} {row['findings']:>6} findings  {row['first_seen'][:19]} .. {row['last_seen'][:19]}")
+        else:
+            print(format_finding(row))
+    print(f"{len(rows)} rows in {elapsed:.1f} ms", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
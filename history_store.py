@@ -0,0 +1,366 @@
+#!/usr/bin/env python3
+"""
+History Store
+Scan history as per-target snapshots and deltas in an append-only file, with shared strings
+"""
+
+import bisect
+import json
+import os
+from contextlib import contextmanager
+from datetime import datetime
+
+try:
+    import fcntl
+except ImportError:
+    # Windows: writers are not serialised across processes
+    fcntl = None
+
+STORE_FILE = 'scan_history.jsonl'
+LEGACY_FILE = 'scan_history.json'
+
+# A target's history restarts from a full snapshot every this many scans, so rebuilding
+# any one scan applies at most this many deltas
+SNAPSHOT_EVERY = 32
+
+# Result fields kept per port; anything else in a result dict is not stored
+FIELDS = ('port', 'state', 'service', 'banner', 'host')
+
+_UNSET = object()
+
+
+def scan_key(scan):
+    """The series a scan belongs to: its address, or its target when it has none"""
+    return scan.get('address') or scan.get('target')
+
+
+def _timestamp(value):
+    if isinstance(value, datetime):
+        return value.timestamp()
+    try:
+        return datetime.fromisoformat(value).timestamp()
+    except (TypeError, ValueError):
+        return None
+
+
+class HistoryStore:
+    """Scan history entries stored as deltas against the previous scan of the same target
+
+    Each line of the file is one record: a new string ({"s": text}), a full
+    snapshot of a scan's results ({"k", "m", "f"}) or a delta against the
+    previous scan of the same key ({"k", "m", "d", "x"}: the metadata that
+    changed, rows opened or changed, and ports gone). Services, banners,
+    states and hosts are stored once and referenced by number. Appending a
+    scan writes only its own lines, so saving no longer rewrites the whole
+    history. Writers lock the file and first read what other processes
+    appended, so the GUI and a monitor can share one store.
+
+    Entries go in and come out as the dicts the history always held
+    ({'timestamp', 'target', ..., 'results': [...]}); results come back
+    in port order. With path None the store lives in memory only.
+    """
+
+    def __init__(self, path=STORE_FILE, snapshot_every=SNAPSHOT_EVERY):
+        self.path = path
+        self.snapshot_every = snapshot_every
+        self.legacy = False
+        self._reset()
+
+    def _reset(self):
+        self.strings = []
+        self.string_ids = {}
+        # Per scan: (key, metadata, full rows or None, changed rows, gone identities)
+        self.records = []
+        # Per key: indexes of its scans, and the position of each scan's snapshot in that list
+        self.series = {}
+        self.bases = []
+        self.positions = []
+        # Per key: the latest rows by (host, port), to diff the next scan against
+        self.latest = {}
+        self._times = {}
+        # Bytes of the file read so far
+        self.size = 0
+
+    # Loading and saving
+
+    def load(self, legacy_path=None):
+        """Read the store; when it does not exist yet, import a legacy JSON history from legacy_path
+
+        A path holding a legacy JSON list is read as history without being
+        converted (legacy is set), so old files can still be searched.
+        """
+        self._reset()
+        if self.path and os.path.exists(self.path):
+            with self._locked() as f:
+                data = f.read()
+                if data.lstrip()[:1] == b'[':
+                    self._import(json.loads(data), write=False)
+                    self.legacy = True
+                    return self
+                self._parse(f, data)
+        elif legacy_path and os.path.exists(legacy_path):
+            with open(legacy_path, 'r') as f:
+                self._import(json.load(f), write=True)
+        return self
+
+    def _import(self, history, write):
+        path = self.path
+        if not write:
+            self.path = None
+        try:
+            self.extend(history)
+        finally:
+            self.path = path
+
+    @contextmanager
+    def _locked(self):
+        """The store file, positioned at its start and locked against other writers"""
+        with open(self.path, 'a+b') as f:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_EX)
+            f.seek(0)
+            yield f
+
+    def _catch_up(self, f):
+        """Read whatever other processes appended since this store last looked"""
+        f.seek(0, os.SEEK_END)
+        size = f.tell()
+        if size < self.size:
+            # Cleared elsewhere
+            self._reset()
+        if size != self.size:
+            f.seek(self.size)
+            self._parse(f, f.read(), self.size)
+
+    def _parse(self, f, data, offset=0):
+        good = 0
+        for line in data.split(b'\n'):
+            end = good + len(line) + 1
+            if end > len(data):
+                # No newline: the last write was cut short
+                break
+            try:
+                record = json.loads(line)
+            except ValueError:
+                if end < len(data):
+                    raise ValueError(f"{self.path} is damaged at byte {offset + good}")
+                break
+            if 's' in record:
+                self._intern_loaded(record['s'])
+            elif 'f' in record:
+                self._add_record(record['k'], record['m'], record['f'], (), ())
+            else:
+                # Deltas store only the metadata that changed
+                key = record['k']
+                meta = dict(self.records[self.series[key][-1]][1])
+                meta.update(record['m'])
+                self._add_record(key, meta, None, record.get('d', ()), record.get('x', ()))
+            good = end
+        self.size = offset + good
+        if good < len(data):
+            # Drop the torn tail so the next append starts on a clean line
+            f.truncate(self.size)
+
+    def _intern_loaded(self, text):
+        self.string_ids[text] = len(self.strings)
+        self.strings.append(text)
+
+    def clear(self):
+        self._reset()
+        if self.path:
+            with self._locked() as f:
+                f.truncate(0)
+
+    # Writing
+
+    def append(self, scan):
+        """Add one history entry, writing only its delta (and any strings not seen before)"""
+        self.extend([scan])
+
+    def extend(self, scans):
+        if self.legacy:
+            raise ValueError(f"{self.path} is a legacy JSON history; load it with legacy_path to convert it")
+        if not self.path:
+            self._encode_scans(scans)
+            return
+        with self._locked() as f:
+            self._catch_up(f)
+            lines = self._encode_scans(scans)
+            if lines:
+                f.write(('\n'.join(lines) + '\n').encode('utf-8'))
+                f.flush()
+            self.size = f.tell()
+
+    def _encode_scans(self, scans):
+        """Add scans to memory; returns their lines for the file"""
+        lines = []
+        for scan in scans:
+            key = scan_key(scan)
+            meta = {name: value for name, value in scan.items() if name != 'results'}
+            rows = {}
+            for result in scan.get('results', ()):
+                row = self._encode(result, lines)
+                rows[(row[4], row[0])] = row
+            previous = self.latest.get(key)
+            series = self.series.get(key, ())
+            changed = gone = None
+            if previous is not None and len(series) - self.bases[series[-1]] < self.snapshot_every \
+                    and self.records[series[-1]][1].keys() <= meta.keys():
+                changed = [row for identity, row in rows.items() if previous.get(identity) != row]
+                gone = [self._identity(identity) for identity in previous if identity not in rows]
+                if len(changed) + len(gone) >= len(rows):
+                    # A delta no smaller than the scan itself: start a new snapshot
+                    changed = gone = None
+            if changed is None:
+                full = sorted(rows.values(), key=_row_order)
+                record = {'k': key, 'm': meta, 'f': [_trim(row) for row in full]}
+                self._add_record(key, meta, record['f'], (), (), rows)
+            else:
+                changed.sort(key=_row_order)
+                last = self.records[series[-1]][1]
+                updated = {name: value for name, value in meta.items() if last.get(name, _UNSET) != value}
+                record = {'k': key, 'm': updated}
+                # Empty lists are left out: an unchanged rescan is just its key and metadata
+                if changed:
+                    record['d'] = [_trim(row) for row in changed]
+                if gone:
+                    record['x'] = gone
+                self._add_record(key, meta, None, record.get('d', ()), gone, rows)
+            lines.append(json.dumps(record, separators=(',', ':')))
+        return lines
+
+    def _intern(self, text, lines):
+        if text is None:
+            return None
+        sid = self.string_ids.get(text)
+        if sid is None:
+            sid = self.string_ids[text] = len(self.strings)
+            self.strings.append(text)
+            lines.append(json.dumps({'s': text}, separators=(',', ':')))
+        return sid
+
+    def _encode(self, result, lines):
+        return (result['port'],) + tuple(self._intern(result.get(name), lines) for name in FIELDS[1:])
+
+    @staticmethod
+    def _identity(identity):
+        host, port = identity
+        return port if host is None else [port, host]
+
+    def _add_record(self, key, meta, full, changed, gone, rows=None):
+        index = len(self.records)
+        series = self.series.setdefault(key, [])
+        if full is not None:
+            full = [_pad(row) for row in full]
+            base = len(series)
+        else:
+            base = self.bases[series[-1]]
+        changed = [_pad(row) for row in changed]
+        self.records.append((key, meta, full, changed, gone))
+        self.bases.append(base)
+        self.positions.append(len(series))
+        series.append(index)
+        self._times.pop(key, None)
+        if rows is None:
+            # Loading: only the newest state is kept, so it is updated in place
+            rows = {} if full is not None else self.latest.get(key, {})
+            _apply(rows, full or changed, gone)
+        self.latest[key] = rows
+
+    # Reading
+
+    def __len__(self):
+        return len(self.records)
+
+    def __bool__(self):
+        return bool(self.records)
+
+    def entries(self):
+        """Every entry's metadata, without results; cheap enough for listing"""
+        return [meta for _, meta, _, _, _ in self.records]
+
+    def __getitem__(self, index):
+        """One entry with its results, rebuilt from its snapshot and at most SNAPSHOT_EVERY deltas"""
+        if index < 0:
+            index += len(self.records)
+        key = self.records[index][0]
+        series = self.series[key]
+        rows = {}
+        for position in range(self.bases[index], self.positions[index] + 1):
+            _, _, full, changed, gone = self.records[series[position]]
+            _apply(rows, full if full is not None else changed, gone)
+        return self._entry(index, rows)
+
+    def __iter__(self):
+        return self.scans()
+
+    def scans(self, indexes=None, since=None):
+        """Entries in order, rebuilt in one pass; only those in indexes or from since on are built"""
+        if indexes is not None:
+            indexes = set(indexes)
+        since = _timestamp(since) if since is not None else None
+        state = {}
+        for index, (key, meta, full, changed, gone) in enumerate(self.records):
+            if full is not None:
+                rows = state[key] = {}
+            else:
+                rows = state.setdefault(key, {})
+            _apply(rows, full if full is not None else changed, gone)
+            if indexes is not None and index not in indexes:
+                continue
+            if since is not None:
+                moment = _timestamp(meta.get('timestamp'))
+                if moment is None or moment < since:
+                    continue
+            yield self._entry(index, rows)
+
+    def scan_at(self, target, when):
+        """The latest entry for a target (address or name) at or before a moment, or None"""
+        series = self.series.get(target)
+        if series is None:
+            return None
+        times = self._times.get(target)
+        if times is None:
+            times = self._times[target] = [_timestamp(self.records[index][1].get('timestamp')) or 0.0
+                                           for index in series]
+        position = bisect.bisect_right(times, _timestamp(when)) - 1
+        return self[series[position]] if position >= 0 else None
+
+    def _entry(self, index, rows):
+        entry = dict(self.records[index][1])
+        strings = self.strings
+        results = []
+        for row in sorted(rows.values(), key=_row_order):
+            result = {'port': row[0]}
+            for name, sid in zip(FIELDS[1:], row[1:]):
+                if sid is not None:
+                    result[name] = strings[sid]
+                elif name in ('service', 'banner'):
+                    result[name] = None
+            results.append(result)
+        entry['results'] = results
+        return entry
+
+
+def _row_order(row):
+    return (row[4] if len(row) > 4 and row[4] is not None else -1, row[0])
+
+
+def _trim(row):
+    """Drop the trailing None host so single-host rows stay short on disk"""
+    return list(row[:4]) if row[4] is None else list(row)
+
+
+def _pad(row):
+    return tuple(row) if len(row) == 5 else tuple(row) + (None,)
+
+
+def _apply(rows, changed, gone):
+    for row in changed:
+        row = _pad(row)
+        rows[(row[4], row[0])] = row
+    for identity in gone:
+        if isinstance(identity, list):
+            rows.pop((identity[1], identity[0]), None)
+        else:
+            rows.pop((None, identity), None)
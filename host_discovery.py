@@ -0,0 +1,34 @@
+#!/usr/bin/env python3
+"""
+Host Discovery
+ICMP echo probes through the system ping command
+"""
+
+import ipaddress
+import platform
+import subprocess
+
+
+def ping_command(host, timeout=1):
+    """Build the platform's ping command for a single echo request"""
+    address = ipaddress.ip_address(host)
+    system = platform.system().lower()
+    if system == "windows":
+        command = ['ping', '-n', '1', '-w', str(int(timeout * 1000))]
+    elif system == "darwin" and address.version == 6:
+        command = ['ping6', '-c', '1']
+    else:
+        command = ['ping', '-c', '1', '-W', str(max(1, int(timeout)))]
+    if address.version == 6 and system != "darwin":
+        command.append('-6')
+    return command + [str(address)]
+
+
+def ping_host(host, timeout=1):
+    """Ping a host once and return (host, is_alive)"""
+    try:
+        result = subprocess.run(ping_command(host, timeout),
+                                capture_output=True, text=True, timeout=timeout + 2)
+        return str(host), result.returncode == 0
+    except Exception:
+        return str(host), False
@@ -0,0 +1,329 @@
+#!/usr/bin/env python3
+"""
+HTTP Probe
+Keep-alive HTTP(S) enrichment of open web ports: status, server, title, redirects, robots.txt, favicon
+"""
+
+import base64
+import hashlib
+import html
+import http.client
+import re
+import ssl
+import threading
+import time
+from collections import defaultdict
+from urllib.parse import urljoin, urlsplit
+
+HTTP_PORTS = {80, 81, 591, 2080, 3000, 5000, 5601, 7001, 8000, 8008, 8080, 8081, 8088, 8888, 9000, 9090, 9200}
+HTTPS_PORTS = {443, 4443, 8443, 9443, 10443}
+DEFAULT_PORTS = {'http': 80, 'https': 443}
+
+USER_AGENT = 'DuckScanner/2.0'
+TITLE_RE = re.compile(rb'<title[^>]*>(.*?)</title', re.IGNORECASE | re.DOTALL)
+MAX_TITLE = 200
+
+
+def is_http_port(port):
+    return port in HTTP_PORTS or port in HTTPS_PORTS
+
+
+def default_scheme(port):
+    return 'https' if port in HTTPS_PORTS else 'http'
+
+
+def murmur3_32(data, seed=0):
+    """MurmurHash3 x86 32-bit as a signed int (the value mmh3.hash returns)"""
+    mask = 0xFFFFFFFF
+    c1, c2 = 0xcc9e2d51, 0x1b873593
+    h = seed & mask
+    length = len(data)
+    rounded = length & ~3
+    for i in range(0, rounded, 4):
+        k = int.from_bytes(data[i:i + 4], 'little')
+        k = (k * c1) & mask
+        k = ((k << 15) | (k >> 17)) & mask
+        k = (k * c2) & mask
+        h ^= k
+        h = ((h << 13) | (h >> 19)) & mask
+        h = (h * 5 + 0xe6546b64) & mask
+    k = 0
+    tail = length & 3
+    if tail >= 3:
+        k ^= data[rounded + 2] << 16
+    if tail >= 2:
+        k ^= data[rounded + 1] << 8
+    if tail >= 1:
+        k ^= data[rounded]
+        k = (k * c1) & mask
+        k = ((k << 15) | (k >> 17)) & mask
+        k = (k * c2) & mask
+        h ^= k
+    h ^= length
+    h ^= h >> 16
+    h = (h * 0x85ebca6b) & mask
+    h ^= h >> 13
+    h = (h * 0xc2b2ae35) & mask
+    h ^= h >> 16
+    return h - (1 << 32) if h & 0x80000000 else h
+
+
+def favicon_hash(data):
+    """Shodan-style favicon hash: murmur3 of the base64 (MIME line-wrapped) body"""
+    return murmur3_32(base64.encodebytes(data))
+
+
+def parse_title(body):
+    """Page title from an HTML body, whitespace-collapsed and truncated"""
+    match = TITLE_RE.search(body)
+    if not match:
+        return None
+    title = html.unescape(match.group(1).decode('utf-8', 'replace'))
+    title = ' '.join(title.split())
+    return title[:MAX_TITLE] or None
+
+
+class ConnectionPool:
+    """Idle keep-alive connections keyed by (scheme, host, port)"""
+
+    def __init__(self, timeout=3.0, max_idle_per_key=1):
+        self.timeout = timeout
+        self.max_idle_per_key = max_idle_per_key
+        self.idle = defaultdict(list)
+        self.lock = threading.Lock()
+        self.created = 0
+        self.reused = 0
+        self._tls = None
+
+    def _tls_context(self):
+        # Inventory, not trust: accept any certificate
+        if self._tls is None:
+            context = ssl.create_default_context()
+            context.check_hostname = False
+            context.verify_mode = ssl.CERT_NONE
+            self._tls = context
+        return self._tls
+
+    def get(self, scheme, host, port):
+        """An idle connection for the origin, or a new one; returns (connection, reused)"""
+        key = (scheme, host, port)
+        with self.lock:
+            if self.idle[key]:
+                self.reused += 1
+                return self.idle[key].pop(), True
+            self.created += 1
+        if scheme == 'https':
+            conn = http.client.HTTPSConnection(host, port, timeout=self.timeout, context=self._tls_context())
+        else:
+            conn = http.client.HTTPConnection(host, port, timeout=self.timeout)
+        conn.pool_key = key
+        return conn, False
+
+    def put(self, conn):
+        """Return a connection whose last response was fully read and not closed"""
+        with self.lock:
+            idle = self.idle[conn.pool_key]
+            if len(idle) < self.max_idle_per_key:
+                idle.append(conn)
+                return
+        conn.close()
+
+    def release(self, scheme, host, port):
+        """Close the origin's idle connections once its request sequence is done"""
+        with self.lock:
+            connections = self.idle.pop((scheme, host, port), [])
+        for conn in connections:
+            conn.close()
+
+    def close(self):
+        with self.lock:
+            connections = [conn for idle in self.idle.values() for conn in idle]
+            self.idle.clear()
+        for conn in connections:
+            conn.close()
+
+
+class HTTPProber:
+    """Runs a short request sequence per web port over pooled connections
+
+    Requests to one origin run back to back on a single keep-alive
+    connection, which is closed when the sequence ends so probing thousands
+    of hosts holds no idle sockets. Concurrency is bounded globally
+    (max_concurrency) and per host (per_host). Bodies are capped at max_body bytes; a response that
+    hits the cap or asks to close ends the connection, and the next
+    request opens a new one.
+    """
+
+    def __init__(self, timeout=3.0, max_body=65536, max_favicon=102400, max_redirects=3,
+                 max_concurrency=50, per_host=1, budget=15.0, head_only=False,
+                 fetch_robots=True, fetch_favicon=True):
+        self.timeout = timeout
+        self.max_body = max_body
+        self.max_favicon = max_favicon
+        self.max_redirects = max_redirects
+        self.max_concurrency = max_concurrency
+        self.per_host = per_host
+        self.budget = budget
+        self.head_only = head_only
+        self.fetch_robots = fetch_robots
+        self.fetch_favicon = fetch_favicon
+        self.pool = ConnectionPool(timeout)
+        self.requests = 0
+        self._host_slots = {}
+        self._lock = threading.Lock()
+
+    def _host_slot(self, host):
+        with self._lock:
+            slot = self._host_slots.get(host)
+            if slot is None:
+                slot = self._host_slots[host] = threading.BoundedSemaphore(self.per_host)
+            return slot
+
+    def request(self, scheme, host, port, method, path, limit, host_header):
+        """Send one request on a pooled connection; return (status, headers, body, truncated)"""
+        headers = {'Host': host_header, 'User-Agent': USER_AGENT, 'Accept': '*/*'}
+        conn, reused = self.pool.get(scheme, host, port)
+        try:
+            conn.request(method, path, headers=headers)
+            response = conn.getresponse()
+        except (OSError, http.client.HTTPException):
+            conn.close()
+            if not reused:
+                raise
+            # The server dropped the idle connection; retry once on a fresh one
+            conn, _ = self.pool.get(scheme, host, port)
+            conn.request(method, path, headers=headers)
+            response = conn.getresponse()
+        try:
+            body = response.read(limit + 1)
+        except (OSError, http.client.HTTPException):
+            conn.close()
+            raise
+        with self._lock:
+            self.requests += 1
+
+        truncated = len(body) > limit
+        if truncated or response.will_close or not response.isclosed():
+            # Unread bytes or a server-requested close make the connection unusable
+            conn.close()
+        else:
+            self.pool.put(conn)
+        return response.status, response.getheaders(), body[:limit], truncated
+
+    def probe(self, host, port, scheme=None, server_name=None):
+        """Run the request sequence against one web port and return a result dict
+
+        server_name overrides the Host header for name-based virtual hosts.
+        """
+        scheme = scheme or default_scheme(port)
+        host_header = server_name or host
+        if ':' in host_header and not host_header.startswith('['):
+            host_header = f"[{host_header}]"
+        if port != DEFAULT_PORTS[scheme]:
+            host_header = f"{host_header}:{port}"
+        result = {
+            'host': host, 'port': port, 'scheme': scheme, 'status': None, 'server': None,
+            'title': None, 'redirects': [], 'final_url': None, 'robots': None, 'favicon': None,
+            'error': None
+        }
+        deadline = time.monotonic() + self.budget
+        slot = self._host_slot(host)
+        with slot:
+            try:
+                self._fetch_root(result, scheme, host, port, host_header, deadline)
+                if not self.head_only and self.fetch_robots and time.monotonic() < deadline:
+                    self._fetch_robots(result, scheme, host, port, host_header)
+                if not self.head_only and self.fetch_favicon and time.monotonic() < deadline:
+                    self._fetch_favicon(result, scheme, host, port, host_header)
+            except (OSError, http.client.HTTPException, ValueError) as e:
+                result['error'] = str(e) or e.__class__.__name__
+                if scheme == 'http' and result['status'] is None and isinstance(e, http.client.BadStatusLine):
+                    result['error'] = 'Not HTTP (or TLS required)'
+            finally:
+                self.pool.release(scheme, host, port)
+        return result
+
+    def _fetch_root(self, result, scheme, host, port, host_header, deadline):
+        """HEAD or GET / and follow same-origin redirects"""
+        method = 'HEAD' if self.head_only else 'GET'
+        path = '/'
+        origin = f"{scheme}://{host_header}"
+        names = {host.lower().strip('[]'), urlsplit(origin).hostname}
+        for _ in range(self.max_redirects + 1):
+            status, headers, body, _ = self.request(scheme, host, port, method, path, self.max_body, host_header)
+            header_map = {name.lower(): value for name, value in headers}
+            result['status'] = status
+            result['server'] = header_map.get('server', result['server'])
+            result['final_url'] = urljoin(origin, path)
+            if body:
+                result['title'] = parse_title(body) or result['title']
+            location = header_map.get('location')
+            if status not in (301, 302, 303, 307, 308) or not location:
+                return
+            target = urljoin(result['final_url'], location)
+            result['redirects'].append({'status': status, 'location': target})
+            parts = urlsplit(target)
+            same_origin = (parts.scheme == scheme and (parts.port or DEFAULT_PORTS[scheme]) == port
+                           and parts.hostname in names)
+            if not same_origin or time.monotonic() >= deadline:
+                # Cross-origin hops are recorded, not followed: one connection per host
+                result['final_url'] = target
+                return
+            path = parts.path or '/'
+            if parts.query:
+                path += '?' + parts.query
+
+    def _fetch_robots(self, result, scheme, host, port, host_header):
+        status, _, body, truncated = self.request(scheme, host, port, 'GET', '/robots.txt', self.max_body, host_header)
+        robots = {'status': status, 'size': len(body), 'truncated': truncated, 'disallow': []}
+        if status == 200:
+            for line in body.decode('utf-8', 'replace').splitlines():
+                field, _, value = line.partition(':')
+                if field.strip().lower() == 'disallow' and value.strip():
+                    robots['disallow'].append(value.strip())
+                    if len(robots['disallow']) >= 20:
+                        break
+        result['robots'] = robots
+
+    def _fetch_favicon(self, result, scheme, host, port, host_header):
+        status, _, body, truncated = self.request(scheme, host, port, 'GET', '/favicon.ico', self.max_favicon, host_header)
+        if status == 200 and body and not truncated:
+            result['favicon'] = {
+                'size': len(body),
+                'mmh3': favicon_hash(body),
+                'md5': hashlib.md5(body).hexdigest()
+            }
+
+    def probe_many(self, targets, callback=None):
+        """Probe (host, port[, scheme]) targets concurrently; returns results in completion order"""
+        from concurrent.futures import ThreadPoolExecutor, as_completed
+        results = []
+        with ThreadPoolExecutor(max_workers=self.max_concurrency) as executor:
+            futures = [executor.submit(self.probe, *target) for target in targets]
+            for future in as_completed(futures):
+                result = future.result()
+                results.append(result)
+                if callback:
+                    callback(result)
+        return results
+
+    def close(self):
+        self.pool.close()
+
+
+def format_result(result):
+    """One-line summary of an HTTP probe result"""
+    if result['error'] and result['status'] is None:
+        return f"{result['scheme']}://{result['host']}:{result['port']} - {result['error']}"
+    parts = [f"{result['scheme']}://{result['host']}:{result['port']}", str(result['status'])]
+    if result['server']:
+        parts.append(result['server'])
+    if result['title']:
+        parts.append(f'"{result["title"]}"')
+    if result['redirects']:
+        parts.append('-> ' + result['redirects'][-1]['location'])
+    if result['favicon']:
+        parts.append(f"favicon:{result['favicon']['mmh3']}")
+    if result['robots'] and result['robots']['status'] == 200:
+        parts.append(f"robots.txt({len(result['robots']['disallow'])} disallow)")
+    return ' '.join(parts)
@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""
+IPv6 Candidate Generation
+Targeted host candidates for IPv6 prefixes that are far too large to sweep
+"""
+
+import ipaddress
+import platform
+import re
+import subprocess
+
+# Prefixes up to this many addresses are swept exhaustively
+MAX_EXHAUSTIVE_ADDRESSES = 4096
+
+# Interface identifiers that administrators like to hand out
+SERVICE_IIDS = [0x53, 0x80, 0x443, 0x25, 0x22, 0x21, 0x8080, 0x1000, 0x2000,
+                0xbeef, 0xcafe, 0xdead, 0xface, 0xfeed]
+
+MAC_PATTERN = re.compile(r'([0-9a-fA-F]{1,2}[:-]){5}[0-9a-fA-F]{1,2}')
+
+
+def _run(command):
+    """Run a command and return its stdout, or '' if it is unavailable"""
+    try:
+        result = subprocess.run(command, capture_output=True, text=True, timeout=5)
+        return result.stdout
+    except Exception:
+        return ''
+
+
+def neighbor_cache():
+    """Return (address, mac) pairs from the IPv6 neighbor cache"""
+    system = platform.system().lower()
+    if system == 'windows':
+        output = _run(['netsh', 'interface', 'ipv6', 'show', 'neighbors'])
+    elif system == 'darwin':
+        output = _run(['ndp', '-an'])
+    else:
+        output = _run(['ip', '-6', 'neigh', 'show'])
+
+    neighbors = []
+    for line in output.splitlines():
+        fields = line.split()
+        if not fields:
+            continue
+        try:
+            address = ipaddress.IPv6Address(fields[0].split('%')[0])
+        except ValueError:
+            continue
+        mac = MAC_PATTERN.search(line)
+        neighbors.append((address, normalize_mac(mac.group(0)) if mac else None))
+    return neighbors
+
+
+def normalize_mac(mac):
+    """Normalize a MAC address to lowercase colon-separated form"""
+    parts = re.split(r'[:-]', mac)
+    return ':'.join(part.zfill(2).lower() for part in parts)
+
+
+def eui64_iid(mac):
+    """Build the modified EUI-64 interface identifier for a MAC address"""
+    octets = [int(part, 16) for part in normalize_mac(mac).split(':')]
+    octets[0] ^= 0x02
+    eui = octets[:3] + [0xff, 0xfe] + octets[3:]
+    return int.from_bytes(bytes(eui), 'big')
+
+
+def low_byte_candidates(network, count=256):
+    """Yield prefix::1 .. prefix::count and common service-style identifiers"""
+    base = int(network.network_address)
+    for iid in range(1, count + 1):
+        yield ipaddress.IPv6Address(base + iid)
+    for iid in SERVICE_IIDS:
+        yield ipaddress.IPv6Address(base + iid)
+
+
+def eui64_candidates(network, macs):
+    """Yield SLAAC addresses for known MAC addresses"""
+    base = int(network.network_address)
+    for mac in macs:
+        yield ipaddress.IPv6Address(base | eui64_iid(mac))
+
+
+def seed_candidates(network, seeds, spread=2):
+    """Yield seed addresses inside the network and their close neighbours"""
+    for seed in seeds:
+        try:
+            address = ipaddress.IPv6Address(str(seed).strip())
+        except ValueError:
+            continue
+        for offset in range(-spread, spread + 1):
+            value = int(address) + offset
+            if 0 <= value < 2 ** 128:
+                yield ipaddress.IPv6Address(value)
+
+
+def load_seeds(path):
+    """Read seed addresses from a file, one per line"""
+    seeds = []
+    with open(path, 'r') as f:
+        for line in f:
+            line = line.split('#', 1)[0].strip()
+            if line:
+                seeds.append(line)
+    return seeds
+
+
+def generate_candidates(network, seeds=None, macs=None, low_byte_count=256, use_neighbors=True):
+    """Yield unique candidate hosts for an IPv6 network, most likely first"""
+    network = ipaddress.IPv6Network(network, strict=False)
+    if network.num_addresses <= MAX_EXHAUSTIVE_ADDRESSES:
+        yield from network.hosts()
+        return
+
+    known_macs = set(macs or [])
+    sources = []
+    if use_neighbors:
+        neighbors = neighbor_cache()
+        sources.append(address for address, _ in neighbors)
+        known_macs.update(mac for _, mac in neighbors if mac)
+    if seeds:
+        sources.append(seed_candidates(network, seeds))
+    sources.append(low_byte_candidates(network, low_byte_count))
+    sources.append(eui64_candidates(network, sorted(known_macs)))
+
+    seen = set()
+    for source in sources:
+        for address in source:
+            if address in network and address not in seen and address != network.network_address:
+                seen.add(address)
+                yield address
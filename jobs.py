@@ -0,0 +1,685 @@
+#!/usr/bin/env python3
+"""
+Scan Jobs
+Concurrent scans, sweeps, detections and traces sharing one in-flight and rate budget, with pause, resume and cancel
+"""
+
+import argparse
+import itertools
+import sys
+import threading
+import time
+
+from metrics import REGISTRY as METRICS
+from progress import ProgressTracker
+
+# Job states
+QUEUED = 'queued'
+RUNNING = 'running'
+PAUSED = 'paused'
+DONE = 'done'
+CANCELLED = 'cancelled'
+FAILED = 'failed'
+FINISHED = (DONE, CANCELLED, FAILED)
+
+# A job's share of the budget is its weight times its priority's share
+PRIORITIES = {'low': 1, 'normal': 2, 'high': 4}
+
+# How long a job waiting on other jobs' slots sleeps before asking again
+POLL_INTERVAL = 0.02
+# A job that has not asked for a slot for this long no longer counts towards the shares
+WANT_EXPIRY = 0.25
+
+BUDGET_IN_FLIGHT = METRICS.gauge('duckscanner_budget_in_flight', 'Probes and connections held from the job budget',
+                                 ['kind'])
+JOBS_FINISHED = METRICS.counter('duckscanner_jobs_finished_total', 'Finished jobs by outcome', ['kind', 'state'])
+
+
+class Budget:
+    """One in-flight limit and one send rate shared by every running job
+
+    Jobs that asked for a slot in the last WANT_EXPIRY seconds compete, and
+    each is entitled to its share of the in-flight limit and of the rate in
+    proportion to its weight times its priority's share. A job below its
+    share always gets a free slot. A job at or above it gets one only while
+    no job below its share is waiting, so idle capacity is never wasted and
+    no job is starved while it keeps asking. Each job is paced at its share
+    of the rate, which adds up to the budget's rate.
+    """
+
+    def __init__(self, concurrency=500, rate=None):
+        self.concurrency = max(1, concurrency)
+        self.rate = rate
+        self.in_flight = 0
+        self.leases = set()
+        self.condition = threading.Condition()
+
+    def lease(self, kind='scan', weight=1.0, priority='normal'):
+        """A handle for one job's share of the budget"""
+        lease = Lease(self, kind, weight * PRIORITIES[priority])
+        with self.condition:
+            self.leases.add(lease)
+        return lease
+
+    def _acquire(self, lease):
+        """0 when a slot was granted, else seconds to wait before asking again"""
+        now = time.monotonic()
+        lease.asked = now
+        if lease.paused or lease.closed:
+            return POLL_INTERVAL
+        competing = [other for other in self.leases
+                     if not other.paused and not other.closed and now - other.asked <= WANT_EXPIRY]
+        total = sum(other.share for other in competing)
+        fraction = lease.share / total
+        if self.rate and now < lease.next_send:
+            return lease.next_send - now
+        lease.waiting = True
+        if self.in_flight >= self.concurrency:
+            return POLL_INTERVAL
+        if lease.in_flight >= fraction * self.concurrency:
+            for other in competing:
+                starved = other.in_flight < other.share / total * self.concurrency
+                if other is not lease and other.waiting and starved:
+                    return POLL_INTERVAL
+        lease.waiting = False
+        self.in_flight += 1
+        lease.in_flight += 1
+        lease.granted += 1
+        if self.rate:
+            # Allow catching up on up to 10ms of oversleep, no more
+            lease.next_send = max(lease.next_send, now - 0.01) + 1.0 / (self.rate * fraction)
+        BUDGET_IN_FLIGHT.inc(lease.kind)
+        return 0
+
+    def _release(self, lease, count):
+        with self.condition:
+            count = min(count, lease.in_flight)
+            lease.in_flight -= count
+            self.in_flight -= count
+            BUDGET_IN_FLIGHT.dec(lease.kind, amount=count)
+            self.condition.notify_all()
+
+    def snapshot(self):
+        with self.condition:
+            return {'in_flight': self.in_flight, 'concurrency': self.concurrency, 'rate': self.rate,
+                    'jobs': len(self.leases)}
+
+
+class Lease:
+    """One job's handle on the shared budget
+
+    Event-driven code (the probe scheduler) calls acquire() before each
+    send and release() when the probe finishes. Blocking code wraps each
+    connection in `with lease.slot():`. While paused no slots are granted;
+    once cancelled, acquire() keeps refusing and slot() raises Cancelled.
+    """
+
+    def __init__(self, budget, kind, share):
+        self.budget = budget
+        self.kind = kind
+        self.share = share
+        self.asked = 0.0
+        self.waiting = False
+        self.next_send = 0.0
+        self.in_flight = 0
+        self.granted = 0
+        self.paused = False
+        self.cancelled = False
+        self.closed = False
+
+    def acquire(self):
+        with self.budget.condition:
+            return self.budget._acquire(self)
+
+    def release(self, count=1):
+        if count:
+            self.budget._release(self, count)
+
+    def wait(self, timeout):
+        """Sleep until the budget changes or timeout passes"""
+        with self.budget.condition:
+            self.budget.condition.wait(timeout)
+
+    def slot(self):
+        return _Slot(self)
+
+    def pause(self):
+        with self.budget.condition:
+            self.paused = True
+            self.waiting = False
+
+    def resume(self):
+        with self.budget.condition:
+            self.paused = False
+            self.budget.condition.notify_all()
+
+    def cancel(self):
+        with self.budget.condition:
+            self.cancelled = True
+            self.waiting = False
+            self.budget.condition.notify_all()
+
+    def close(self):
+        with self.budget.condition:
+            self.closed = True
+            self.waiting = False
+            self.budget.leases.discard(self)
+        self.release(self.in_flight)
+
+
+class Cancelled(Exception):
+    """The job was cancelled while waiting for a slot"""
+
+
+class _Slot:
+    def __init__(self, lease):
+        self.lease = lease
+
+    def __enter__(self):
+        lease = self.lease
+        while True:
+            if lease.cancelled:
+                raise Cancelled()
+            wait = lease.acquire()
+            if not wait:
+                return lease
+            lease.wait(wait)
+
+    def __exit__(self, *exc):
+        self.lease.release()
+
+
+class Job:
+    """A unit of work run on its own thread under a budget lease
+
+    Subclasses implement work(); a plain Job runs the work callable given
+    to it, which receives the job. Work reports progress through
+    self.progress (set total with set_total()) and results through
+    found(), which also calls on_found. pause(), resume() and cancel() act
+    through the lease: paused work holds no new slots, and cancelled work
+    stops at its next slot.
+    """
+
+    kind = 'job'
+
+    def __init__(self, name, work=None, priority='normal', weight=1.0, on_found=None, kind=None):
+        if priority not in PRIORITIES:
+            raise ValueError(f"Priority must be one of {', '.join(PRIORITIES)}")
+        self.id = None
+        self.name = name
+        self._work = work
+        self.priority = priority
+        self.weight = weight
+        self.on_found = on_found
+        if kind:
+            self.kind = kind
+        self.state = QUEUED
+        self.error = None
+        self.findings = []
+        self.progress = ProgressTracker(0)
+        self.lease = None
+        self.thread = None
+        self.started = None
+        self.finished = None
+
+    def set_total(self, total):
+        self.progress.total = total
+
+    def found(self, finding):
+        self.findings.append(finding)
+        if self.on_found is not None:
+            self.on_found(self, finding)
+
+    @property
+    def cancelled(self):
+        return self.lease is not None and self.lease.cancelled
+
+    def work(self):
+        if self._work is None:
+            raise NotImplementedError
+        return self._work(self)
+
+    def run(self):
+        self.started = time.time()
+        if self.state == QUEUED:
+            self.state = RUNNING
+        try:
+            self.work()
+        except Cancelled:
+            self.finish()
+        except Exception as e:
+            self.finish(str(e) or e.__class__.__name__)
+        else:
+            self.finish()
+
+    def finish(self, error=None):
+        """Record the outcome and hand the lease back; attached work calls this itself"""
+        self.error = error
+        if self.cancelled:
+            self.state = CANCELLED
+        else:
+            self.state = FAILED if error else DONE
+        self.finished = time.time()
+        self.lease.close()
+        JOBS_FINISHED.inc(self.kind, self.state)
+
+    def pause(self):
+        if self.state in (QUEUED, RUNNING):
+            self.lease.pause()
+            self.state = PAUSED
+
+    def resume(self):
+        if self.state == PAUSED:
+            self.lease.resume()
+            self.state = RUNNING
+
+    def cancel(self):
+        if self.state not in FINISHED:
+            self.lease.cancel()
+            if self.state == PAUSED:
+                self.lease.resume()
+
+    def summary(self):
+        snapshot = self.progress.snapshot()
+        end = self.finished or time.time()
+        return {'id': self.id, 'kind': self.kind, 'name': self.name, 'state': self.state,
+                'priority': self.priority, 'weight': self.weight, 'done': snapshot['done'],
+                'total': snapshot['total'], 'fraction': snapshot['fraction'], 'findings': len(self.findings),
+                'in_flight': self.lease.in_flight if self.lease else 0,
+                'elapsed': end - self.started if self.started else 0.0, 'error': self.error}
+
+
+class ScanJob(Job):
+    """TCP connect scan of targets and ports; findings are open (host, port) pairs
+
+    concurrency caps this job alone; the budget caps all jobs together.
+    """
+
+    kind = 'scan'
+
+    def __init__(self, target, ports, timeout=1.0, retries=1, concurrency=None, exclusions=None,
+                 transport=None, **options):
+        super().__init__(target, **options)
+        self.target = target
+        self.ports = ports
+        self.timeout = timeout
+        self.retries = retries
+        self.concurrency = concurrency
+        self.exclusions = exclusions
+        self.transport = transport
+
+    def work(self):
+        from scan_engine import ConnectProber, ProbeScheduler, OPEN
+        from scan_plan import compile_plan
+        from transport import default_transport
+        concurrency = self.concurrency or self.lease.budget.concurrency
+        plan = compile_plan(self.target, self.ports, self.exclusions, concurrency=concurrency,
+                            timeout=self.timeout, retries=self.retries)
+        self.set_total(plan.probes)
+        transport = self.transport or default_transport(ConnectProber(self.timeout), concurrency)
+        scheduler = ProbeScheduler(transport, concurrency, self.timeout, retries=self.retries, lease=self.lease)
+        probes = ((address, port, family) for address, family in plan.hosts for port in plan.ports)
+        try:
+            for result in scheduler.run(probes):
+                self.progress.advance()
+                if result.state == OPEN:
+                    self.found((result.host, result.port))
+        finally:
+            if self.transport is None:
+                transport.close()
+
+
+class SweepJob(Job):
+    """ICMP echo sweep; findings are the addresses that answered"""
+
+    kind = 'sweep'
+
+    def __init__(self, network, hosts=None, timeout=1.0, workers=50, exclusions=None, **options):
+        super().__init__(network, **options)
+        self.network = network
+        self.hosts = hosts
+        self.timeout = timeout
+        self.workers = workers
+        self.exclusions = exclusions
+
+    def work(self):
+        import ipaddress
+        from concurrent.futures import ThreadPoolExecutor
+        from host_discovery import ping_host
+        hosts = self.hosts
+        if hosts is None:
+            hosts = [str(host) for host in ipaddress.ip_network(self.network, strict=False).hosts()]
+        if self.exclusions:
+            hosts = list(self.exclusions.filter_hosts(hosts))
+        self.set_total(len(hosts))
+
+        def ping(host):
+            with self.lease.slot():
+                address, alive = ping_host(host, self.timeout)
+            self.progress.advance()
+            if alive:
+                self.found(address)
+
+        with ThreadPoolExecutor(max_workers=max(1, min(self.workers, len(hosts)))) as executor:
+            for future in [executor.submit(ping, host) for host in hosts]:
+                try:
+                    future.result()
+                except Cancelled:
+                    # Every other queued ping stops at its slot too
+                    pass
+
+
+class DetectJob(Job):
+    """Connect and banner grab on a host's ports; findings are (port, banner or None) for open ports"""
+
+    kind = 'detect'
+
+    COMMON_PORTS = [21, 22, 23, 25, 53, 80, 110, 135, 139, 143, 443, 993, 995, 1723, 3306, 3389, 5432, 5900,
+                    6379, 8080, 11211]
+
+    def __init__(self, target, ports=None, timeout=1.0, workers=20, **options):
+        super().__init__(target, **options)
+        self.target = target
+        self.ports = ports or self.COMMON_PORTS
+        self.timeout = timeout
+        self.workers = workers
+
+    def work(self):
+        from concurrent.futures import ThreadPoolExecutor
+        from scan_engine import ConnectProber, OPEN, grab_banner, resolve_target
+        family, address = resolve_target(self.target)
+        prober = ConnectProber(self.timeout)
+        self.set_total(len(self.ports))
+
+        def check(port):
+            with self.lease.slot():
+                state, _ = prober.probe(address, port, family)
+                banner = grab_banner(address, port, family) if state == OPEN else None
+            self.progress.advance()
+            if state == OPEN:
+                self.found((port, banner))
+
+        with ThreadPoolExecutor(max_workers=max(1, min(self.workers, len(self.ports)))) as executor:
+            for future in [executor.submit(check, port) for port in self.ports]:
+                try:
+                    future.result()
+                except Cancelled:
+                    pass
+
+
+class TraceJob(Job):
+    """Parallel traceroute to every host of a target (or to hosts, when given); findings are TracePaths
+
+    topology is the merged Topology once the job is done.
+    """
+
+    kind = 'trace'
+
+    def __init__(self, target, max_ttl=30, timeout=1.0, method='auto', cache=None, exclusions=None, hosts=None,
+                 **options):
+        super().__init__(target, **options)
+        self.target = target
+        self.hosts = hosts
+        self.max_ttl = max_ttl
+        self.timeout = timeout
+        self.method = method
+        self.cache = cache
+        self.exclusions = exclusions
+        self.topology = None
+
+    def work(self):
+        from scan_engine import expand_targets, resolve_target
+        from topology import TopologyMapper, open_trace_transport
+        hosts = []
+        for name in self.hosts or expand_targets(self.target):
+            _, address = resolve_target(name)
+            if not (self.exclusions and self.exclusions.excludes_host(address)):
+                hosts.append(address)
+        self.set_total(len(hosts))
+        transport = open_trace_transport(self.method, any(':' in host for host in hosts))
+        mapper = TopologyMapper(transport, self.max_ttl, self.timeout, concurrency=self.lease.budget.concurrency,
+                                cache=self.cache, lease=self.lease)
+        try:
+            self.topology = mapper.map(hosts)
+        finally:
+            transport.close()
+        if self.cancelled:
+            return
+        for path in self.topology.paths:
+            self.progress.advance()
+            self.found(path)
+        if self.cache is not None:
+            self.cache.save()
+
+
+class JobManager:
+    """Starts jobs at once on their own threads, all drawing on one Budget"""
+
+    def __init__(self, concurrency=500, rate=None):
+        self.budget = Budget(concurrency, rate)
+        self.jobs = {}
+        self._ids = itertools.count(1)
+        self.lock = threading.Lock()
+
+    def submit(self, job):
+        """Start a job; returns it with its id set"""
+        with self.lock:
+            job.id = next(self._ids)
+            self.jobs[job.id] = job
+        job.lease = self.budget.lease(job.kind, job.weight, job.priority)
+        job.thread = threading.Thread(target=job.run, name=f"job-{job.id}", daemon=True)
+        job.thread.start()
+        return job
+
+    def attach(self, kind, name, priority='normal', weight=1.0):
+        """Register work the caller runs itself, so it is listed and budgeted; the caller ends it with finish()"""
+        job = Job(name, priority=priority, weight=weight, kind=kind)
+        with self.lock:
+            job.id = next(self._ids)
+            self.jobs[job.id] = job
+        job.lease = self.budget.lease(job.kind, job.weight, job.priority)
+        job.state = RUNNING
+        job.started = time.time()
+        return job
+
+    def get(self, job_id):
+        job = self.jobs.get(job_id)
+        if job is None:
+            raise KeyError(f"No job {job_id}")
+        return job
+
+    def pause(self, job_id):
+        self.get(job_id).pause()
+
+    def resume(self, job_id):
+        self.get(job_id).resume()
+
+    def cancel(self, job_id):
+        self.get(job_id).cancel()
+
+    def list(self):
+        with self.lock:
+            jobs = list(self.jobs.values())
+        return [job.summary() for job in jobs]
+
+    def active(self):
+        return [job for job in list(self.jobs.values()) if job.state not in FINISHED]
+
+    def prune(self):
+        """Forget finished jobs"""
+        with self.lock:
+            for job_id in [job_id for job_id, job in self.jobs.items() if job.state in FINISHED]:
+                del self.jobs[job_id]
+
+    def wait(self, timeout=None):
+        """Wait for every submitted job to finish; False if timeout passed first"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        for job in list(self.jobs.values()):
+            if job.thread is None:
+                continue
+            job.thread.join(None if deadline is None else max(0.0, deadline - time.monotonic()))
+            if job.thread.is_alive():
+                return False
+        return True
+
+    def cancel_all(self):
+        for job in self.active():
+            job.cancel()
+
+
+def format_jobs(summaries):
+    """Job table for terminals and text widgets"""
+    lines = [f"{'ID':>3}  {'KIND':<6}  {'STATE':<9}  {'PRIORITY':<8}  {'PROGRESS':>15}  {'FOUND':>5}  "
+             f"{'SLOTS':>5}  NAME"]
+    for job in summaries:
+        progress = f"{job['done']}/{job['total']} {job['fraction']:.0%}" if job['total'] else '-'
+        lines.append(f"{job['id']:>3}  {job['kind']:<6}  {job['state']:<9}  {job['priority']:<8}  {progress:>15}  "
+                     f"{job['findings']:>5}  {job['in_flight']:>5}  {job['name']}"
+                     + (f" ({job['error']})" if job['error'] else ''))
+    return '\n'.join(lines)
+
+
+def parse_job(kind, spec, exclusions=None, timeout=1.0, retries=1, on_found=None):
+    """A job from a command-line spec: 'TARGET [ports=SPEC] [priority=high] [weight=2]'"""
+    from port_scanner import parse_ports
+    target = None
+    options = {}
+    for word in spec.split():
+        key, sep, value = word.partition('=')
+        if sep:
+            options[key.lower()] = value
+        elif target is None:
+            target = word
+        else:
+            raise ValueError(f"Two targets in job spec: {spec}")
+    if target is None:
+        raise ValueError(f"No target in job spec: {spec}")
+    unknown = set(options) - {'ports', 'priority', 'weight', 'concurrency', 'max_ttl'}
+    if unknown:
+        raise ValueError(f"Unknown job option {', '.join(sorted(unknown))} in: {spec}")
+    common = dict(priority=options.get('priority', 'normal'), weight=float(options.get('weight', 1)),
+                  on_found=on_found)
+    ports = parse_ports(options['ports']) if 'ports' in options else None
+    if kind == 'scan':
+        concurrency = int(options['concurrency']) if 'concurrency' in options else None
+        return ScanJob(target, ports or parse_ports('1-1000'), timeout, retries, concurrency, exclusions, **common)
+    if kind == 'sweep':
+        return SweepJob(target, timeout=timeout, exclusions=exclusions, **common)
+    if kind == 'trace':
+        from topology import HopCache
+        return TraceJob(target, int(options.get('max_ttl', 30)), timeout, cache=HopCache().load(),
+                        exclusions=exclusions, **common)
+    return DetectJob(target, ports, timeout, **common)
+
+
+def format_finding(job, finding):
+    if job.kind == 'scan':
+        host, port = finding
+        return f"[{job.id}] {host}:{port} open"
+    if job.kind == 'sweep':
+        return f"[{job.id}] {finding} is alive"
+    if job.kind == 'trace':
+        hops = ' '.join(hop.address or '*' for hop in finding.hops)
+        return f"[{job.id}] {finding.destination} {finding.status}: {hops}"
+    port, banner = finding
+    return f"[{job.id}] {job.name}:{port} open" + (f" - {banner}" if banner else '')
+
+
+def control(manager, line):
+    """Apply one console command; returns the reply to print"""
+    words = line.split()
+    if not words:
+        return ''
+    command = words[0].lower()
+    if command in ('list', 'ls', 'jobs'):
+        return format_jobs(manager.list())
+    if command in ('pause', 'resume', 'cancel') and len(words) == 2:
+        if words[1] == 'all':
+            for job in manager.active():
+                getattr(job, command)()
+            return f"{command}: all jobs"
+        try:
+            getattr(manager, command)(int(words[1]))
+        except (KeyError, ValueError):
+            return f"No job {words[1]}"
+        return f"{command}: job {words[1]}"
+    return "Commands: list, pause ID|all, resume ID|all, cancel ID|all"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='port_scanner.py jobs',
+                                     description='Run several scans, sweeps, detections and traces at once under one '
+                                                 'shared in-flight and rate budget')
+    parser.add_argument('--scan', action='append', default=[], metavar='SPEC',
+                       help="Port scan job: 'TARGET [ports=1-1000] [priority=low|normal|high] [weight=N] "
+                            "[concurrency=N]' (repeatable)")
+    parser.add_argument('--sweep', action='append', default=[], metavar='SPEC',
+                       help="Ping sweep job: 'NETWORK [priority=...] [weight=N]' (repeatable)")
+    parser.add_argument('--detect', action='append', default=[], metavar='SPEC',
+                       help="Service detection job: 'HOST [ports=...] [priority=...] [weight=N]' (repeatable)")
+    parser.add_argument('--trace', action='append', default=[], metavar='SPEC',
+                       help="Path mapping job: 'TARGETS [max_ttl=30] [priority=...] [weight=N]' (repeatable)")
+    parser.add_argument('-c', '--concurrency', type=int, default=500,
+                       help='Probes and connections in flight across all jobs (default: 500)')
+    parser.add_argument('--rate', type=float,
+                       help='Probes per second across all jobs (default: unlimited)')
+    parser.add_argument('--timeout', type=float, default=1.0,
+                       help='Connection timeout in seconds (default: 1.0)')
+    parser.add_argument('--retries', type=int, default=1,
+                       help='Resend unanswered scan probes up to N times (default: 1)')
+    parser.add_argument('--status-interval', type=float, default=10.0,
+                       help='Print the job table to stderr every N seconds; 0 turns it off (default: 10)')
+    parser.add_argument('--exclude',
+                       help='Addresses, CIDRs, ranges or ports to skip')
+    parser.add_argument('--exclude-file',
+                       help='File with exclusion entries, one or more per line')
+    args = parser.parse_args(argv)
+
+    from exclusions import build_exclusions
+    manager = JobManager(args.concurrency, args.rate)
+    lock = threading.Lock()
+
+    def report(job, finding):
+        with lock:
+            print(format_finding(job, finding), flush=True)
+
+    try:
+        exclusions = build_exclusions(args.exclude, args.exclude_file)
+        jobs = [parse_job(kind, spec, exclusions, args.timeout, args.retries, report)
+                for kind, specs in (('scan', args.scan), ('sweep', args.sweep), ('detect', args.detect),
+                                    ('trace', args.trace))
+                for spec in specs]
+    except (OSError, ValueError) as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+    if not jobs:
+        parser.error("no jobs given (--scan, --sweep, --detect or --trace)")
+
+    for job in jobs:
+        manager.submit(job)
+    print(format_jobs(manager.list()), file=sys.stderr)
+    if sys.stdin is not None and sys.stdin.isatty():
+        print("Commands: list, pause ID|all, resume ID|all, cancel ID|all", file=sys.stderr)
+
+        def console():
+            for line in sys.stdin:
+                reply = control(manager, line)
+                if reply:
+                    print(reply, file=sys.stderr)
+
+        threading.Thread(target=console, name='job-console', daemon=True).start()
+
+    try:
+        while not manager.wait(args.status_interval or None):
+            print(format_jobs(manager.list()), file=sys.stderr)
+    except KeyboardInterrupt:
+        manager.cancel_all()
+        manager.wait()
+        print("\nJobs cancelled", file=sys.stderr)
+    print(format_jobs(manager.list()), file=sys.stderr)
+    if any(job.state == FAILED for job in jobs):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
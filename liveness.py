@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+"""
+Host Liveness
+Gates port sweeps on early evidence that a host is up
+"""
+
+import threading
+from collections import deque
+
+from scan_engine import OPEN, CLOSED, DEFER
+
+# Most frequently open TCP ports, most common first (nmap-services order)
+TOP_PORTS = (80, 23, 443, 21, 22, 25, 3389, 110, 445, 139, 143, 53, 135, 3306, 8080,
+             1723, 111, 995, 993, 5900, 1025, 587, 8888, 199, 1720, 465, 548, 113, 81,
+             6001, 10000, 514, 5060, 179, 1026, 2000, 8443, 8000, 32768, 554, 26, 1433,
+             49152, 2001, 515, 8008, 49154, 1027, 5666, 646)
+_TOP_RANK = {port: rank for rank, port in enumerate(TOP_PORTS)}
+
+# Host verdicts
+UNKNOWN = 'unknown'
+UP = 'up'
+DOWN = 'down'
+
+
+def order_ports(ports):
+    """Ports with the most commonly open first, the rest in their original order"""
+    return sorted(ports, key=lambda port: _TOP_RANK.get(port, len(TOP_PORTS)))
+
+
+class LivenessPolicy:
+    """When to give up on a host
+
+    first_k: a host is down when none of its first first_k probes (most
+    commonly open ports first) gets an answer; 0 disables the gate.
+    ping: run an ICMP echo pass first; hosts that answer are never marked down.
+    require_ping: also drop hosts that do not answer the echo pass.
+    """
+
+    def __init__(self, first_k=5, ping=False, require_ping=False, ping_timeout=1):
+        self.first_k = max(0, first_k)
+        self.ping = ping or require_ping
+        self.require_ping = require_ping
+        self.ping_timeout = ping_timeout
+
+    def __bool__(self):
+        return bool(self.first_k or self.ping)
+
+
+class HostGate:
+    """Per-host up/down verdicts from probe results, and a probe order that uses them
+
+    probes() first yields every host's first K probes, then the rest host by
+    host in the order verdicts arrive, skipping hosts judged down. A host is up as soon as any probe is
+    answered (open or refused) and down once its first K probes all went
+    unanswered. When every remaining host is still waiting on in-flight
+    probes the source yields DEFER, so the scheduler waits for the network
+    instead of spending probes on hosts that may be dead. Feed every result
+    to observe() before pulling the next probe.
+    """
+
+    def __init__(self, policy, on_skip=None):
+        self.policy = policy
+        self.on_skip = on_skip
+        self.status = {}
+        self.first = {}
+        self.tails = {}
+        self.ready = deque()
+        self.skipped = 0
+        self.lock = threading.Lock()
+
+    def discover(self, hosts, ports_per_host=0):
+        """Run the ICMP echo pass over (address, family) hosts and return those to port-scan"""
+        if not self.policy.ping or not hosts:
+            return list(hosts)
+        from concurrent.futures import ThreadPoolExecutor
+        from host_discovery import ping_host
+        timeout = self.policy.ping_timeout
+        with ThreadPoolExecutor(max_workers=min(64, len(hosts))) as executor:
+            replies = list(executor.map(lambda host: ping_host(host[0], timeout)[1], hosts))
+        kept = []
+        for host, alive in zip(hosts, replies):
+            if alive:
+                self.status[host[0]] = UP
+                kept.append(host)
+            elif self.policy.require_ping:
+                self.status[host[0]] = DOWN
+                self.skip(host[0], ports_per_host)
+            else:
+                kept.append(host)
+        return kept
+
+    def skip(self, host, count):
+        if not count:
+            return
+        with self.lock:
+            self.skipped += count
+        if self.on_skip:
+            self.on_skip(host, count)
+
+    def observe(self, host, port, state):
+        """Feed one probe result and return the host's verdict"""
+        with self.lock:
+            before = self.status.get(host, UNKNOWN)
+            if state in (OPEN, CLOSED):
+                self.status[host] = UP
+            first = self.first.get(host)
+            if first is not None and port in first:
+                first.discard(port)
+                if not first and self.status.get(host, UNKNOWN) == UNKNOWN:
+                    self.status[host] = DOWN
+            status = self.status.get(host, UNKNOWN)
+            if before == UNKNOWN and status != UNKNOWN and host in self.tails:
+                self.ready.append(host)
+            return status
+
+    def verdict(self, host):
+        return self.status.get(host, UNKNOWN)
+
+    def down_hosts(self):
+        return sorted(host for host, status in self.status.items() if status == DOWN)
+
+    def probes(self, targets):
+        """Yield (address, port, family) probes for (address, family, ports) targets, gated on liveness"""
+        k = self.policy.first_k
+        # Hosts usually share one port list; order each distinct list once
+        ordered = {}
+        listed = []
+        for address, family, ports in targets:
+            key = tuple(ports)
+            order = ordered.get(key)
+            if order is None:
+                order = ordered[key] = order_ports(key)
+            listed.append((address, family, order))
+        targets = listed
+        if not k:
+            for address, family, ports in targets:
+                for port in ports:
+                    yield (address, port, family)
+            return
+
+        for address, family, ports in targets:
+            with self.lock:
+                if ports[:k]:
+                    self.first[address] = set(ports[:k])
+                if len(ports) > k:
+                    self.tails[address] = (family, ports[k:])
+                    if self.verdict(address) != UNKNOWN:
+                        self.ready.append(address)
+            for port in ports[:k]:
+                yield (address, port, family)
+
+        # Hosts join the ready queue once their verdict is in
+        while self.tails:
+            if not self.ready:
+                yield DEFER
+                continue
+            with self.lock:
+                address = self.ready.popleft()
+                family, tail = self.tails.pop(address)
+            if self.verdict(address) == DOWN:
+                self.skip(address, len(tail))
+                continue
+            for port in tail:
+                yield (address, port, family)
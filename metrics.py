@@ -0,0 +1,288 @@
+#!/usr/bin/env python3
+"""
+Scan Metrics
+Counters, gauges and histograms with a Prometheus text endpoint
+"""
+
+import bisect
+import sys
+import threading
+import time
+
+from progress import format_duration
+
+# Probe RTTs in seconds, from loopback to slow WAN links
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+                   0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _format_labels(labelnames, values, extra=None):
+    pairs = list(zip(labelnames, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ''
+    escaped = ['{}="{}"'.format(name, str(value).replace('\\', '\\\\').replace('"', '\\"'))
+               for name, value in pairs]
+    return '{' + ','.join(escaped) + '}'
+
+
+class Metric:
+    """Base class: a named family of label-keyed series"""
+
+    kind = 'untyped'
+
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self.series = {}
+        self.lock = threading.Lock()
+
+    def _key(self, labels):
+        if len(labels) != len(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}")
+        return tuple(str(label) for label in labels)
+
+    def values(self):
+        """Return {label values: value}"""
+        with self.lock:
+            return dict(self.series)
+
+    def reset(self):
+        with self.lock:
+            self.series.clear()
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for labels, value in sorted(self.values().items()):
+            lines.append(f"{self.name}{_format_labels(self.labelnames, labels)} {value}")
+        return lines
+
+
+class Counter(Metric):
+    """Monotonically increasing count"""
+
+    kind = 'counter'
+
+    def inc(self, *labels, amount=1):
+        key = self._key(labels)
+        with self.lock:
+            self.series[key] = self.series.get(key, 0) + amount
+
+    def get(self, *labels):
+        return self.series.get(self._key(labels), 0)
+
+    def total(self):
+        with self.lock:
+            return sum(self.series.values())
+
+
+class Gauge(Metric):
+    """Value that can go up and down"""
+
+    kind = 'gauge'
+
+    def set(self, value, *labels):
+        key = self._key(labels)
+        with self.lock:
+            self.series[key] = value
+
+    def inc(self, *labels, amount=1):
+        key = self._key(labels)
+        with self.lock:
+            self.series[key] = self.series.get(key, 0) + amount
+
+    def dec(self, *labels, amount=1):
+        self.inc(*labels, amount=-amount)
+
+    def get(self, *labels):
+        return self.series.get(self._key(labels), 0)
+
+
+class Histogram(Metric):
+    """Bucketed distribution with sum and count"""
+
+    kind = 'histogram'
+
+    def __init__(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, *labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            series = self.series.get(key)
+            if series is None:
+                series = self.series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def quantile(self, fraction, *labels):
+        """Estimate a quantile from the bucket counts (upper bucket bound)"""
+        series = self.series.get(self._key(labels))
+        if not series or not series[2]:
+            return None
+        target = fraction * series[2]
+        running = 0
+        for bound, count in zip(self.buckets + (float('inf'),), series[0]):
+            running += count
+            if running >= target:
+                return bound
+        return float('inf')
+
+    def values(self):
+        with self.lock:
+            return {labels: {'buckets': list(s[0]), 'sum': s[1], 'count': s[2]}
+                    for labels, s in self.series.items()}
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for labels, series in sorted(self.values().items()):
+            running = 0
+            for bound, count in zip(self.buckets + (float('inf'),), series['buckets']):
+                running += count
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, labels, ('le', le))} {running}")
+            label_text = _format_labels(self.labelnames, labels)
+            lines.append(f"{self.name}_sum{label_text} {series['sum']}")
+            lines.append(f"{self.name}_count{label_text} {series['count']}")
+        return lines
+
+
+class Registry:
+    """Collection of metrics exposed together"""
+
+    def __init__(self):
+        self.metrics = {}
+        self.lock = threading.Lock()
+
+    def _register(self, metric):
+        with self.lock:
+            existing = self.metrics.get(metric.name)
+            if existing is not None:
+                return existing
+            self.metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name, help_text, labelnames=()):
+        return self._register(Counter(name, help_text, labelnames))
+
+    def gauge(self, name, help_text, labelnames=()):
+        return self._register(Gauge(name, help_text, labelnames))
+
+    def histogram(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram(name, help_text, labelnames, buckets))
+
+    def get(self, name):
+        return self.metrics.get(name)
+
+    def snapshot(self):
+        """Return {metric name: {label values: value}} for every metric"""
+        return {name: metric.values() for name, metric in self.metrics.items()}
+
+    def render_prometheus(self):
+        """Render every metric in the Prometheus text exposition format"""
+        lines = []
+        for metric in list(self.metrics.values()):
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+    def reset(self):
+        for metric in self.metrics.values():
+            metric.reset()
+
+
+# Default registry used by the scan engine
+REGISTRY = Registry()
+
+
+def serve_metrics(port=9109, host='127.0.0.1', registry=REGISTRY):
+    """Serve /metrics over HTTP from a daemon thread and return the server"""
+    # http.server is slow to import and only needed when the endpoint is enabled
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split('?', 1)[0] not in ('/metrics', '/'):
+                self.send_error(404)
+                return
+            body = registry.render_prometheus().encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    server.daemon_threads = True
+    # Port scans (including our own) reset connections; that is not worth a traceback
+    server.handle_error = lambda request, client_address: None
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+class StatsReporter:
+    """Prints a one-line engine summary at a fixed interval"""
+
+    def __init__(self, interval=5.0, stream=None, registry=REGISTRY, progress=None):
+        self.interval = interval
+        self.progress = progress
+        self.stream = stream or sys.stderr
+        self.registry = registry
+        self._stop = threading.Event()
+        self._thread = None
+        self._last = (time.monotonic(), 0)
+
+    def format_line(self):
+        """Build the stats line from the current metric values"""
+        sent = self.registry.get('duckscanner_probes_sent_total')
+        results = self.registry.get('duckscanner_probe_results_total')
+        inflight = self.registry.get('duckscanner_probes_in_flight')
+        rtt = self.registry.get('duckscanner_probe_rtt_seconds')
+        errors = self.registry.get('duckscanner_probe_errors_total')
+
+        now = time.monotonic()
+        total = sent.total() if sent else 0
+        last_time, last_total = self._last
+        rate = (total - last_total) / (now - last_time) if now > last_time else 0.0
+        self._last = (now, total)
+
+        by_state = {labels[0]: value for labels, value in (results.values() if results else {}).items()}
+        p50 = rtt.quantile(0.5) if rtt else None
+        p99 = rtt.quantile(0.99) if rtt else None
+        parts = [
+            f"sent={total}",
+            f"rate={rate:.0f}/s",
+            f"in_flight={inflight.get() if inflight else 0}",
+            f"open={by_state.get('open', 0)}",
+            f"closed={by_state.get('closed', 0)}",
+            f"timeout={by_state.get('timeout', 0)}",
+            f"errors={errors.total() if errors else 0}",
+        ]
+        if p50 is not None:
+            parts.append(f"rtt_p50<={p50 * 1000:g}ms rtt_p99<={p99 * 1000:g}ms")
+        tracker = self.progress() if self.progress else None
+        if tracker is not None:
+            snapshot = tracker.tick()
+            parts.append(f"done={snapshot['fraction'] * 100:.1f}% eta={format_duration(snapshot['eta'])}")
+        return "[stats] " + " ".join(parts)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            print(self.format_line(), file=self.stream, flush=True)
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(self.interval + 1)
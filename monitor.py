@@ -0,0 +1,451 @@
+#!/usr/bin/env python3
+"""
+Scan Monitor
+Long-running scheduler that rescans targets on jittered intervals and emits change events
+"""
+
+import argparse
+import heapq
+import itertools
+import json
+import os
+import queue
+import random
+import signal
+import sys
+import threading
+import time
+from datetime import datetime
+
+from exclusions import build_exclusions
+from liveness import HostGate, LivenessPolicy
+from scan_engine import ConnectProber, ProbeScheduler, OPEN, CLOSED, expand_targets, resolve_target
+from transport import default_transport
+
+
+def event(kind, target, **fields):
+    """A change event as a plain dict"""
+    return dict(event=kind, time=datetime.now().isoformat(timespec='seconds'), target=target, **fields)
+
+
+class NDJSONSink:
+    """Writes one JSON event per line to a stream or an append-mode file"""
+
+    def __init__(self, path=None):
+        self.path = path
+        self.stream = open(path, 'a') if path else sys.stdout
+
+    def emit(self, change):
+        self.stream.write(json.dumps(change) + '\n')
+        self.stream.flush()
+
+    def close(self):
+        if self.path:
+            self.stream.close()
+
+
+class WebhookSink:
+    """POSTs each event as JSON from a background thread so a slow endpoint never stalls scanning"""
+
+    def __init__(self, url, timeout=5.0, retries=3, backlog=10000):
+        self.url = url
+        self.timeout = timeout
+        self.retries = retries
+        self.queue = queue.Queue(backlog)
+        self.dropped = 0
+        self.thread = threading.Thread(target=self._deliver, daemon=True)
+        self.thread.start()
+
+    def emit(self, change):
+        try:
+            self.queue.put_nowait(change)
+        except queue.Full:
+            self.dropped += 1
+
+    def _deliver(self):
+        import urllib.request
+        while True:
+            change = self.queue.get()
+            if change is None:
+                return
+            body = json.dumps(change).encode('utf-8')
+            for attempt in range(self.retries):
+                request = urllib.request.Request(self.url, data=body, method='POST',
+                                                 headers={'Content-Type': 'application/json'})
+                try:
+                    with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                        response.read()
+                    break
+                except Exception as e:
+                    if attempt == self.retries - 1:
+                        self.dropped += 1
+                        print(f"Webhook delivery failed: {e}", file=sys.stderr)
+                    else:
+                        time.sleep(2 ** attempt)
+
+    def close(self):
+        self.queue.put(None)
+        self.thread.join(self.timeout * self.retries)
+
+
+class MonitorJob:
+    """One target spec rescanned every interval seconds"""
+
+    def __init__(self, target, ports, interval):
+        self.target = target
+        self.ports = ports
+        self.interval = interval
+        self.targets = expand_targets(target)
+        self.hosts = []
+        self.resolved_at = 0.0
+        self.runs = 0
+
+    def __repr__(self):
+        return f"MonitorJob({self.target!r}, {len(self.ports)} ports, every {self.interval}s)"
+
+
+class Monitor:
+    """Runs monitor jobs forever, spread over time, and reports what changed
+
+    Each job's first run lands at a random point inside its interval and
+    every later run is rescheduled interval * (1 +/- jitter) after the
+    previous start, so jobs never line up into bursts. Jobs run one at a
+    time on a warm transport and prober, optionally rate limited, so the
+    network sees a steady trickle of probes. Results are compared with the
+    last known state of each target (kept in state_path across restarts);
+    differences become events. With a history store, every run's open
+    ports per answering host are appended to it as well.
+    """
+
+    def __init__(self, jobs, sinks, state_path='monitor_state.json', threads=100, timeout=1.0,
+                 rate=None, jitter=0.1, liveness=None, exclusions=None, resolve_every=3600, retries=1,
+                 history=None):
+        self.jobs = jobs
+        self.sinks = sinks
+        self.state_path = state_path
+        self.threads = threads
+        self.timeout = timeout
+        self.rate = rate
+        self.jitter = jitter
+        self.liveness = liveness or LivenessPolicy(first_k=0)
+        self.exclusions = exclusions
+        self.resolve_every = resolve_every
+        self.retries = retries
+        self.history = history
+        self.prober = ConnectProber(timeout)
+        self.transport = None
+        self.state = self.load_state()
+        self.stop_event = threading.Event()
+        self.random = random.Random()
+        self._sequence = itertools.count()
+        self.queue = []
+
+    # State
+
+    def load_state(self):
+        if not self.state_path or not os.path.exists(self.state_path):
+            return {}
+        try:
+            with open(self.state_path, 'r') as f:
+                return json.load(f)
+        except Exception as e:
+            print(f"Ignoring unreadable monitor state {self.state_path}: {e}", file=sys.stderr)
+            return {}
+
+    def save_state(self):
+        if not self.state_path:
+            return
+        # Write then rename so a crash never leaves a truncated state file
+        temporary = self.state_path + '.tmp'
+        with open(temporary, 'w') as f:
+            json.dump(self.state, f)
+        os.replace(temporary, self.state_path)
+
+    # Scheduling
+
+    def schedule(self, job, when):
+        heapq.heappush(self.queue, (when, next(self._sequence), job))
+
+    def next_delay(self, job):
+        return job.interval * (1 + self.random.uniform(-self.jitter, self.jitter))
+
+    def run(self, once=False):
+        """Run jobs until stop() (or one pass over every job when once is set)"""
+        now = time.monotonic()
+        for job in self.jobs:
+            self.schedule(job, now if once else now + self.random.uniform(0, job.interval))
+        try:
+            while self.queue and not self.stop_event.is_set():
+                when, _, job = self.queue[0]
+                wait = when - time.monotonic()
+                if wait > 0 and self.stop_event.wait(wait):
+                    break
+                heapq.heappop(self.queue)
+                started = time.monotonic()
+                self.run_job(job)
+                if not once:
+                    self.schedule(job, started + self.next_delay(job))
+        finally:
+            self.close()
+
+    def stop(self, *args):
+        self.stop_event.set()
+
+    def close(self):
+        if self.transport is not None:
+            self.transport.close()
+            self.transport = None
+        for sink in self.sinks:
+            sink.close()
+
+    # Scanning
+
+    def resolve(self, job):
+        """(address, family) hosts for a job, re-resolved at most every resolve_every seconds"""
+        if job.hosts and time.monotonic() - job.resolved_at < self.resolve_every:
+            return job.hosts
+        hosts = []
+        for target in job.targets:
+            try:
+                family, address = resolve_target(target)
+            except OSError as e:
+                self.emit(event('resolve_failed', job.target, host=target, error=str(e)))
+                continue
+            if self.exclusions and self.exclusions.excludes_host(address):
+                continue
+            hosts.append((address, family))
+        job.hosts = hosts
+        job.resolved_at = time.monotonic()
+        return hosts
+
+    def scanned_ports(self, job):
+        """The job's ports left after exclusions"""
+        return self.exclusions.filter_ports(job.ports) if self.exclusions else job.ports
+
+    def scan(self, job):
+        """Scan a job once; returns {address: {'up': bool, 'open': set}} or None if stopped"""
+        hosts = self.resolve(job)
+        ports = self.scanned_ports(job)
+        if self.transport is None:
+            self.transport = default_transport(self.prober, self.threads)
+        scheduler = ProbeScheduler(self.transport, self.threads, self.timeout, self.rate, self.retries)
+        gate = HostGate(self.liveness)
+        observed = {address: {'up': False, 'open': set()} for address, _ in hosts}
+        for result in scheduler.run(gate.probes([(address, family, ports) for address, family in hosts])):
+            if self.stop_event.is_set():
+                return None
+            gate.observe(result.host, result.port, result.state)
+            if result.state in (OPEN, CLOSED):
+                observed[result.host]['up'] = True
+            if result.state == OPEN:
+                observed[result.host]['open'].add(result.port)
+        return observed
+
+    def run_job(self, job):
+        started = time.time()
+        try:
+            observed = self.scan(job)
+        except Exception as e:
+            self.emit(event('scan_failed', job.target, error=str(e)))
+            return
+        if observed is None:
+            return
+        job.runs += 1
+        for change in self.diff(job.target, observed, self.scanned_ports(job)):
+            self.emit(change)
+        self.save_state()
+        duration = time.time() - started
+        if self.history is not None:
+            self.record_history(job, observed, duration)
+        print(f"{datetime.now().isoformat(timespec='seconds')} scanned {job.target} "
+              f"({len(observed)} hosts, {len(job.ports)} ports) in {duration:.1f}s", file=sys.stderr)
+
+    def record_history(self, job, observed, duration):
+        """Append one history entry per answering host; the store keeps only what changed"""
+        timestamp = datetime.now().isoformat()
+        ports = format_ports(job.ports)
+        entries = []
+        for address, now in observed.items():
+            if not now['up']:
+                continue
+            entries.append({'timestamp': timestamp, 'target': job.target, 'address': address, 'ports': ports,
+                            'open_ports': len(now['open']), 'duration': round(duration, 2), 'coverage': 1.0,
+                            'results': [{'port': port, 'state': OPEN, 'service': None, 'banner': None}
+                                        for port in sorted(now['open'])]})
+        try:
+            self.history.extend(entries)
+        except Exception as e:
+            print(f"Could not write scan history: {e}", file=sys.stderr)
+
+    # Changes
+
+    def diff(self, target, observed, scanned=None):
+        """Compare a scan with the stored state, update the state and return events
+
+        Only ports in scanned (all ports when None) can be reported closed;
+        stored ports outside it keep their last known state.
+        """
+        previous = self.state.get(target)
+        hosts = {}
+        changes = []
+        if previous is None:
+            up = [address for address, now in observed.items() if now['up']]
+            changes.append(event('baseline', target, hosts_up=len(up),
+                                 open_ports=sum(len(observed[address]['open']) for address in up)))
+            for address, now in observed.items():
+                hosts[address] = {'up': now['up'], 'open': sorted(now['open'])}
+        else:
+            before_hosts = previous['hosts']
+            for address, now in observed.items():
+                before = before_hosts.get(address)
+                if not now['up']:
+                    # No answers at all: keep the last known ports rather than report them closed
+                    if before and before['up']:
+                        changes.append(event('host_down', target, host=address))
+                    hosts[address] = {'up': False, 'open': before['open'] if before else []}
+                    continue
+                if not before or not before['up']:
+                    changes.append(event('host_up', target, host=address))
+                before_open = set(before['open']) if before else set()
+                # Ports this run did not probe (a narrower port list or a new exclusion) are left as they were
+                unscanned = before_open - set(scanned) if scanned is not None else set()
+                for port in sorted(now['open'] - before_open):
+                    changes.append(event('port_opened', target, host=address, port=port))
+                for port in sorted(before_open - unscanned - now['open']):
+                    changes.append(event('port_closed', target, host=address, port=port))
+                hosts[address] = {'up': True, 'open': sorted(now['open'] | unscanned)}
+        self.state[target] = {'hosts': hosts, 'last_run': datetime.now().isoformat(timespec='seconds')}
+        return changes
+
+    def emit(self, change):
+        for sink in self.sinks:
+            try:
+                sink.emit(change)
+            except Exception as e:
+                print(f"Event sink failed: {e}", file=sys.stderr)
+
+
+def parse_duration(value):
+    """Seconds from '90', '30s', '15m', '2h' or '1d'"""
+    units = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+    value = value.strip().lower()
+    if value and value[-1] in units:
+        return float(value[:-1]) * units[value[-1]]
+    return float(value)
+
+
+def format_ports(ports):
+    """Compact port spec for a port list: [1, 2, 3, 8080] -> '1-3,8080'"""
+    parts = []
+    ports = sorted(set(ports))
+    start = None
+    for index, port in enumerate(ports):
+        if start is None:
+            start = port
+        if index + 1 == len(ports) or ports[index + 1] != port + 1:
+            parts.append(str(start) if start == port else f"{start}-{port}")
+            start = None
+    return ','.join(parts)
+
+
+def load_jobs(path, default_ports, default_interval):
+    """Jobs from a JSON config: {"defaults": {...}, "targets": [{"target", "ports", "interval"}]}"""
+    from port_scanner import parse_ports
+    with open(path, 'r') as f:
+        config = json.load(f)
+    defaults = config.get('defaults', {})
+    jobs = []
+    for entry in config.get('targets', []):
+        if isinstance(entry, str):
+            entry = {'target': entry}
+        ports = entry.get('ports', defaults.get('ports', default_ports))
+        interval = entry.get('interval', defaults.get('interval', default_interval))
+        jobs.append(MonitorJob(entry['target'], parse_ports(str(ports)), parse_duration(str(interval))))
+    return jobs
+
+
+def main(argv=None):
+    from port_scanner import parse_ports
+
+    parser = argparse.ArgumentParser(prog='port_scanner.py monitor',
+                                     description='Continuously rescan targets and report changes')
+    parser.add_argument('targets', nargs='*',
+                       help='Targets as TARGET[@INTERVAL] (e.g., 10.0.0.0/28@15m)')
+    parser.add_argument('-c', '--config',
+                       help='JSON file with targets, ports and intervals')
+    parser.add_argument('-p', '--ports', default='1-1000',
+                       help='Ports to scan (default: 1-1000)')
+    parser.add_argument('-i', '--interval', default='1h',
+                       help='Default rescan interval, e.g. 900, 15m, 6h (default: 1h)')
+    parser.add_argument('--jitter', type=float, default=0.1,
+                       help='Random spread of each interval, as a fraction (default: 0.1)')
+    parser.add_argument('-t', '--threads', type=int, default=100,
+                       help='Probes in flight (default: 100)')
+    parser.add_argument('--timeout', type=float, default=1.0,
+                       help='Connection timeout in seconds (default: 1.0)')
+    parser.add_argument('--rate', type=float, default=100.0,
+                       help='Maximum probes per second (default: 100)')
+    parser.add_argument('--retries', type=int, default=1,
+                       help='Resend probes that got no answer up to N times (default: 1)')
+    parser.add_argument('--skip-dead', nargs='?', type=int, const=5, default=0, metavar='K',
+                       help='Skip hosts whose first K most common ports do not answer')
+    parser.add_argument('--events',
+                       help='Append NDJSON change events to this file (default: stdout)')
+    parser.add_argument('--webhook',
+                       help='POST each change event as JSON to this URL (e.g., http://127.0.0.1:8000/hook)')
+    parser.add_argument('--state', default='monitor_state.json',
+                       help='File keeping the last known state between runs (default: monitor_state.json)')
+    parser.add_argument('--history', nargs='?', const='scan_history.jsonl', metavar='FILE',
+                       help='Also record each run in a scan history store, stored as changes between '
+                            'runs (default: scan_history.jsonl)')
+    parser.add_argument('--metrics-port', type=int,
+                       help='Serve Prometheus metrics on 127.0.0.1:PORT')
+    parser.add_argument('--exclude',
+                       help='Addresses, CIDRs, ranges or ports to skip')
+    parser.add_argument('--exclude-file',
+                       help='File with exclusion entries, one or more per line')
+    parser.add_argument('--once', action='store_true',
+                       help='Scan every target once, report changes and exit')
+    args = parser.parse_args(argv)
+
+    try:
+        interval = parse_duration(args.interval)
+        jobs = load_jobs(args.config, args.ports, interval) if args.config else []
+        for spec in args.targets:
+            target, _, job_interval = spec.partition('@')
+            jobs.append(MonitorJob(target, parse_ports(args.ports),
+                                   parse_duration(job_interval) if job_interval else interval))
+        if not jobs:
+            parser.error("no targets given (positional or --config)")
+
+        sinks = [NDJSONSink(args.events)]
+        if args.webhook:
+            sinks.append(WebhookSink(args.webhook))
+        if args.metrics_port:
+            from metrics import serve_metrics
+            serve_metrics(args.metrics_port)
+
+        history = None
+        if args.history:
+            from history_store import HistoryStore
+            history = HistoryStore(args.history).load()
+        monitor = Monitor(jobs, sinks, args.state, args.threads, args.timeout, args.rate, args.jitter,
+                          LivenessPolicy(args.skip_dead), build_exclusions(args.exclude, args.exclude_file),
+                          retries=args.retries, history=history)
+    except (OSError, ValueError) as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+
+    signal.signal(signal.SIGTERM, monitor.stop)
+    for job in jobs:
+        print(f"Monitoring {job.target}: {len(job.targets)} hosts, {len(job.ports)} ports, "
+              f"every {job.interval:.0f}s", file=sys.stderr)
+    try:
+        monitor.run(once=args.once)
+    except KeyboardInterrupt:
+        monitor.stop()
+        print("\nMonitor stopped", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -4,38 +4,145 @@ Basic Port Scanner
 A simple Python port scanner for network reconnaissance
 """
 
+from startup import STARTUP
 import socket
 import threading
 import argparse
 import sys
 import time
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from exclusions import build_exclusions
+from scan_engine import (ConnectProber, ProbeScheduler, ResourceExhausted, OPEN, CLOSED, TIMEOUT, ERROR,
+                         expand_targets, parse_port_range)
+from transport import default_transport
+from liveness import HostGate, LivenessPolicy
+from progress import ProgressTracker, format_progress
+from profiling import Profiler, MODES as PROFILE_MODES
+# Cache, metrics endpoint and exporters are imported only when their options are used
+
+STARTUP.mark('imports')
 
 class PortScanner:
-    def __init__(self, target, ports, threads=50, timeout=1):
+    def __init__(self, target, ports, threads=50, timeout=1, exclusions=None, prober=None,
+                 family=socket.AF_UNSPEC, cache=None, transport=None, rate=None, profiler=None,
+                 writer=None, liveness=None, retries=0, plan=None, checkpoint=None, network=None):
         self.target = target
+        self.targets = expand_targets(target)
+        self.family = family
+        self.address = None
+        self.hosts = []
         self.ports = ports
         self.threads = threads
         self.timeout = timeout
+        self.exclusions = exclusions
+        self.prober = prober or ConnectProber(timeout)
+        self.cache = cache
+        self.cached = 0
+        self.transport = transport
+        self.rate = rate
+        self.profiler = profiler or Profiler()
+        self.writer = writer
+        self.liveness = liveness
+        self.retries = retries
+        self.plan = plan
+        self.checkpoint = checkpoint
+        self.network = network
+        self.gate = None
         self.open_ports = []
+        self.closed = 0
+        self.filtered = 0
+        self.errors = 0
+        self.progress = ProgressTracker(len(ports) * len(self.targets))
         self.lock = threading.Lock()
     
-    def scan_port(self, port):
+    @property
+    def multi_host(self):
+        return len(self.targets) > 1
+    
+    def cached_state(self, port, address=None):
+        """Return a cached open/closed state for a port, or None"""
+        address = address or self.address
+        cached = self.cache.get(address, port) if self.cache is not None else None
+        if cached and cached['state'] in (OPEN, CLOSED):
+            with self.lock:
+                self.cached += 1
+            return cached['state']
+        return None
+    
+    def record(self, port, state, address=None):
+        """Record a fresh probe result and return whether the port is open"""
+        address = address or self.address
+        if self.cache is not None and state in (OPEN, CLOSED):
+            self.cache.put(address, port, state, service=self.get_service_name(port))
+        with self.lock:
+            if state == OPEN:
+                self.open_ports.append((address, port))
+            elif state == CLOSED:
+                self.closed += 1
+            elif state == TIMEOUT:
+                self.filtered += 1
+            elif state == ERROR:
+                self.errors += 1
+        return state == OPEN
+    
+    def scan_port(self, port, address=None):
         """Scan a single port"""
-        try:
-            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            sock.settimeout(self.timeout)
-            result = sock.connect_ex((self.target, port))
-            sock.close()
-            
-            if result == 0:
+        address = address or self.address
+        state = self.cached_state(port, address)
+        if state is not None:
+            if state == OPEN:
                 with self.lock:
-                    self.open_ports.append(port)
-                return port, True
-            else:
-                return port, False
-        except Exception:
-            return port, False
+                    self.open_ports.append((address, port))
+            return port, state == OPEN
+        
+        try:
+            state, _ = self.prober.probe(address, port, self.family)
+        except ResourceExhausted:
+            state = ERROR
+        return port, self.record(port, state, address)
+    
+    def report_open(self, port, address=None):
+        """Print an open port and stream it to the output file"""
+        address = address or self.address
+        service = self.get_service_name(port)
+        if self.multi_host:
+            print(f"{address} port {port}/tcp open - {service}")
+        else:
+            print(f"Port {port}/tcp open - {service}")
+        if self.writer is not None:
+            from exporters import make_row
+            self.writer.write(make_row(address, port, OPEN, service, timestamp=time.time()))
+    
+    def probe_http(self, prober):
+        """Enrich open web ports with status, server, title and redirects"""
+        from http_probe import is_http_port, format_result
+        server_name = None if self.multi_host or self.address == self.target else self.target
+        targets = [(address, port, None, server_name)
+                   for address, port in sorted(self.open_ports) if is_http_port(port)]
+        if not targets:
+            return []
+        print("\nHTTP:")
+        with self.profiler.stage('http'):
+            results = prober.probe_many(targets, lambda result: print(f"  {format_result(result)}"))
+        prober.close()
+        print(f"HTTP requests: {prober.requests} over {prober.pool.created} connections")
+        return results
+    
+    def run_checks(self, runner):
+        """Run check scripts against every open port in one pass"""
+        from checks import format_result
+        targets = []
+        for address, port in sorted(self.open_ports):
+            cached = self.cache.get(address, port) if self.cache is not None else None
+            banner = cached.get('banner') if cached else None
+            targets.append((address, port, self.get_service_name(port), banner))
+        if not any(runner.select(port, service, banner) for _, port, service, banner in targets):
+            return []
+        print("\nChecks:")
+        with self.profiler.stage('checks'):
+            results = runner.run_sync(targets, lambda result: print(f"  {format_result(result)}"))
+        found = sum(1 for result in results if result.status == 'found')
+        print(f"Checks: {len(results)} run over {runner.connects} connections, {found} found")
+        return results
     
     def get_service_name(self, port):
         """Get service name for common ports"""
@@ -48,23 +155,115 @@ class PortScanner:
         }
         return services.get(port, 'Unknown')
     
+    def compile_plan(self):
+        """Resolve and filter targets and ports into the plan this scanner will run"""
+        from scan_plan import compile_plan
+        return compile_plan(self.target, self.ports, self.exclusions, self.family, self.threads, self.timeout,
+                            self.rate, self.retries, self.liveness, strict=not self.multi_host)
+    
     def scan(self):
         """Perform the port scan"""
-        print(f"Scanning {self.target}...")
-        print(f"Ports: {len(self.ports)}")
+        profiler = self.profiler
+        plan = self.plan
+        if plan is None:
+            with profiler.stage('resolve'):
+                plan = self.plan = self.compile_plan()
+        for target, error in plan.unresolved:
+            print(f"Skipping {target}: {error}")
+        for address in plan.excluded:
+            print(f"Target {address} is excluded")
+        resumed = {}
+        if self.checkpoint is not None:
+            resumed = self.checkpoint.load()
+            plan = plan.without(resumed)
+        self.hosts = [(family, address) for address, family in plan.hosts]
+        if not self.hosts and not resumed:
+            print(f"Nothing to scan: {self.target} is excluded or did not resolve")
+            return
+        ports = list(plan.ports)
+        if self.hosts:
+            self.family, self.address = self.hosts[0]
+        self.progress = ProgressTracker(len(ports) * len(self.hosts))
+        
+        if self.multi_host:
+            print(f"Scanning {len(self.hosts)} hosts from {self.target}...")
+        elif self.address and self.address != self.target:
+            print(f"Scanning {self.target} ({self.address})...")
+        else:
+            print(f"Scanning {self.target}...")
+        if plan.shard != (0, 1):
+            print(f"Shard {plan.shard[0] + 1} of {plan.shard[1]}")
+        if resumed:
+            found = sum(len(open_ports) for open_ports in resumed.values())
+            print(f"Resuming: {len(resumed)} hosts already done, {found} open ports found earlier")
+            for address, open_ports in resumed.items():
+                self.open_ports.extend((address, port) for port in open_ports)
+        print(f"Ports: {len(ports)}")
         print(f"Threads: {self.threads}")
         print("-" * 40)
         
         start_time = time.time()
         
-        with ThreadPoolExecutor(max_workers=self.threads) as executor:
-            futures = {executor.submit(self.scan_port, port): port for port in self.ports}
-            
-            for future in as_completed(futures):
-                port, is_open = future.result()
+        # Probes still owed per host; a host is finished (and checkpointed) when it reaches 0
+        remaining = {address: len(ports) for _, address in self.hosts}
+        host_open = {}
+        
+        def settle(address, count=1):
+            remaining[address] -= count
+            if remaining[address] <= 0 and self.checkpoint is not None:
+                self.checkpoint.host_done(address, host_open.get(address, ()))
+        
+        def skipped(address, count):
+            self.progress.advance(count)
+            settle(address, count)
+        
+        self.gate = HostGate(self.liveness or LivenessPolicy(first_k=0), on_skip=skipped)
+        hosts = [(address, family) for family, address in self.hosts]
+        with profiler.stage('discovery'):
+            hosts = self.gate.discover(hosts, len(ports))
+        
+        targets = []
+        with profiler.stage('cache_lookup'):
+            for address, family in hosts:
+                if self.cache is None:
+                    targets.append((address, family, ports))
+                    continue
+                uncached = []
+                for port in ports:
+                    state = self.cached_state(port, address)
+                    if state is None:
+                        uncached.append(port)
+                        continue
+                    self.progress.advance()
+                    self.gate.observe(address, port, state)
+                    if state == OPEN:
+                        self.open_ports.append((address, port))
+                        host_open.setdefault(address, []).append(port)
+                        self.report_open(port, address)
+                    settle(address)
+                targets.append((address, family, uncached))
+        
+        transport = self.transport or default_transport(self.prober, self.threads)
+        scheduler = ProbeScheduler(transport, self.threads, self.timeout, self.rate, self.retries)
+        try:
+            for result in profiler.iterate('probe', scheduler.run(self.gate.probes(targets))):
+                self.progress.advance()
+                with profiler.stage('record'):
+                    self.gate.observe(result.host, result.port, result.state)
+                    is_open = self.record(result.port, result.state, result.host)
+                    if self.network is not None:
+                        self.network.observe(result)
+                    if is_open:
+                        host_open.setdefault(result.host, []).append(result.port)
+                    settle(result.host)
                 if is_open:
-                    service = self.get_service_name(port)
-                    print(f"Port {port}/tcp open - {service}")
+                    with profiler.stage('output'):
+                        self.report_open(result.port, result.host)
+        finally:
+            if self.transport is None:
+                transport.close()
+            if self.checkpoint is not None:
+                self.checkpoint.close()
         
         end_time = time.time()
         duration = end_time - start_time
@@ -72,12 +271,29 @@ class PortScanner:
         print("-" * 40)
         print(f"Scan completed in {duration:.2f} seconds")
         print(f"Open ports found: {len(self.open_ports)}")
+        print(f"Closed (refused): {self.closed}, no answer: {self.filtered}")
+        if scheduler.retransmits:
+            print(f"Retransmitted {scheduler.retransmits} unanswered probes, {scheduler.recovered} answered "
+                  f"on retry (measured loss {scheduler.loss:.1%})")
+        if self.cached:
+            print(f"Results reused from cache: {self.cached}")
+        if self.errors:
+            print(f"Probes failed (not counted as closed): {self.errors}")
+        down = self.gate.down_hosts()
+        if down:
+            print(f"Hosts down: {len(down)} of {len(self.hosts)} ({self.gate.skipped} probes skipped)")
+        throttled = self.prober.throttle.events + scheduler.throttle.events
+        if throttled:
+            print(f"Throttled {throttled} times on local resource exhaustion")
         
         if self.open_ports:
             print("\nOpen ports:")
-            for port in sorted(self.open_ports):
+            for address, port in sorted(self.open_ports):
                 service = self.get_service_name(port)
-                print(f"  {port}/tcp - {service}")
+                if self.multi_host:
+                    print(f"  {address} {port}/tcp - {service}")
+                else:
+                    print(f"  {port}/tcp - {service}")
 
 def parse_ports(port_string):
     """Parse port string (e.g., '80,443,22' or '1-1000')"""
@@ -93,27 +309,196 @@ def parse_ports(port_string):
     return ports
 
 def main():
-    parser = argparse.ArgumentParser(description='Basic Port Scanner')
-    parser.add_argument('target', help='Target IP address or hostname')
+    if len(sys.argv) > 1 and sys.argv[1] == 'monitor':
+        from monitor import main as monitor_main
+        return monitor_main(sys.argv[2:])
+    if len(sys.argv) > 1 and sys.argv[1] == 'query':
+        from history_index import main as query_main
+        return query_main(sys.argv[2:])
+    if len(sys.argv) > 1 and sys.argv[1] == 'trends':
+        from analytics import main as trends_main
+        return trends_main(sys.argv[2:])
+    if len(sys.argv) > 1 and sys.argv[1] == 'jobs':
+        from jobs import main as jobs_main
+        return jobs_main(sys.argv[2:])
+    if len(sys.argv) > 1 and sys.argv[1] == 'trace':
+        from topology import main as trace_main
+        return trace_main(sys.argv[2:])
+    
+    parser = argparse.ArgumentParser(description='Basic Port Scanner',
+                                     epilog='Continuous monitoring: port_scanner.py monitor --help; '
+                                            'history search: port_scanner.py query --help; '
+                                            'trend reports: port_scanner.py trends --help; '
+                                            'concurrent jobs: port_scanner.py jobs --help; '
+                                            'path mapping: port_scanner.py trace --help')
+    parser.add_argument('target', help='Targets: hostnames, addresses, CIDR blocks or ranges '
+                                       '(e.g., 10.0.0.0/24,10.0.1.5-20)')
     parser.add_argument('-p', '--ports', default='1-1000', 
                        help='Ports to scan (default: 1-1000)')
     parser.add_argument('-t', '--threads', type=int, default=50,
                        help='Number of threads (default: 50)')
     parser.add_argument('--timeout', type=float, default=1.0,
                        help='Connection timeout in seconds (default: 1.0)')
+    family_group = parser.add_mutually_exclusive_group()
+    family_group.add_argument('-4', '--ipv4', dest='family', action='store_const', const=socket.AF_INET,
+                             default=socket.AF_UNSPEC, help='Resolve the target to an IPv4 address only')
+    family_group.add_argument('-6', '--ipv6', dest='family', action='store_const', const=socket.AF_INET6,
+                             help='Resolve the target to an IPv6 address only')
+    parser.add_argument('--rate', type=float,
+                       help='Maximum probes per second (default: unlimited)')
+    parser.add_argument('--retries', type=int, default=1,
+                       help='Resend probes that got no answer up to N times; refused and failed '
+                            'probes are never resent (default: 1)')
+    parser.add_argument('--stats-interval', type=float,
+                       help='Print a live stats line to stderr every N seconds')
+    parser.add_argument('--metrics-port', type=int,
+                       help='Serve Prometheus metrics on 127.0.0.1:PORT during the scan')
+    parser.add_argument('-o', '--output',
+                       help='Stream open ports to a file; the format follows the extension '
+                            '(.json, .jsonl, .csv, .xml, .gnmap, .dsr, .txt)')
+    parser.add_argument('--output-format', choices=('json', 'jsonl', 'csv', 'txt', 'xml', 'gnmap', 'dsr'),
+                       help='Output format, overriding the file extension')
+    parser.add_argument('--profile', nargs='?', const='timers', choices=PROFILE_MODES,
+                       help='Time each scan stage; cprofile/tracemalloc/all add function '
+                            'and allocation profiles (default mode: timers)')
+    parser.add_argument('--profile-output', default='scan_profile.txt',
+                       help='Profile report file (default: scan_profile.txt)')
+    parser.add_argument('--startup-report', action='store_true',
+                       help='Print import and startup timings to stderr')
+    parser.add_argument('--skip-dead', nargs='?', type=int, const=5, metavar='K',
+                       help='Mark a host down when none of its first K most common ports answer '
+                            'and skip its remaining ports (default K: 5)')
+    parser.add_argument('--ping', action='store_true',
+                       help='Ping hosts first; hosts that answer are never skipped')
+    parser.add_argument('--require-ping', action='store_true',
+                       help='Ping hosts first and skip those that do not answer')
+    parser.add_argument('--http', action='store_true',
+                       help='Probe open web ports for status, server, title, redirects, robots.txt and favicon')
+    parser.add_argument('--checks', nargs='?', const='all', metavar='NAMES',
+                       help='Run check scripts against open ports: comma-separated names (default: all)')
+    parser.add_argument('--checks-dir',
+                       help='Directory of extra check scripts to load')
+    parser.add_argument('--check-timeout', type=float,
+                       help='Seconds allowed per check script, overriding each script\'s own limit')
+    parser.add_argument('--source-address',
+                       help='Comma-separated local addresses to spread connections over')
+    parser.add_argument('--source-ports',
+                       help='Local source port range to use (e.g., 40000-49999)')
+    parser.add_argument('--graceful-close', action='store_true',
+                       help='Close probe sockets normally instead of with RST (leaves TIME_WAIT)')
+    parser.add_argument('--cache',
+                       help='Result cache file reused across runs')
+    parser.add_argument('--cache-ttl', type=int, default=300,
+                       help='Seconds a cached result stays valid (default: 300)')
+    parser.add_argument('--exclude',
+                       help='Addresses, CIDRs, ranges or ports to skip (e.g., 10.0.0.0/8,22,8000-8100)')
+    parser.add_argument('--exclude-file',
+                       help='File with exclusion entries, one or more per line')
+    parser.add_argument('--dry-run', action='store_true',
+                       help='Compile the scan plan, print its probe count and estimated duration and memory, '
+                            'and exit without probing')
+    parser.add_argument('--shard', metavar='I/N',
+                       help='Scan only shard I of N (e.g., 2/4), for splitting one scan across machines')
+    parser.add_argument('--resume', metavar='FILE',
+                       help='Record finished hosts in FILE and skip those it already holds')
+    parser.add_argument('--learn', nargs='?', const='', metavar='FILE',
+                       help='Record round-trip times and answer rates in the network profile used for '
+                            'estimates (default file: network_profile.json)')
     
     args = parser.parse_args()
+    STARTUP.mark('arguments parsed')
+    scanner = None
     
     try:
         # Parse ports
         ports = parse_ports(args.ports)
+        exclusions = build_exclusions(args.exclude, args.exclude_file)
+        prober = ConnectProber(
+            args.timeout,
+            abortive_close=not args.graceful_close,
+            source_addresses=args.source_address.split(',') if args.source_address else None,
+            source_ports=parse_port_range(args.source_ports)
+        )
+        
+        cache = None
+        if args.cache:
+            from result_cache import shared_cache
+            cache = shared_cache
+            cache.ttl = args.cache_ttl
+            cache.load(args.cache)
         
         # Create and run scanner
-        scanner = PortScanner(args.target, ports, args.threads, args.timeout)
-        scanner.scan()
+        profiler = Profiler(args.profile)
+        liveness = LivenessPolicy(args.skip_dead or 0, args.ping, args.require_ping)
+        from scan_plan import NETWORK_FILE, Checkpoint, NetworkProfile, compile_plan, format_estimate, parse_shard
+        plan = compile_plan(args.target, ports, exclusions, args.family, args.threads, args.timeout,
+                            args.rate, args.retries, liveness, strict=len(expand_targets(args.target)) == 1)
+        if args.shard:
+            plan = plan.split(*parse_shard(args.shard))
+        network = NetworkProfile(args.learn or NETWORK_FILE).load()
+        if args.dry_run:
+            checkpoint_done = Checkpoint(args.resume, plan).load() if args.resume else {}
+            remaining = plan.without(checkpoint_done)
+            print(format_estimate(remaining, remaining.estimate(network)))
+            if checkpoint_done:
+                print(f"Resume file holds {len(checkpoint_done)} finished hosts")
+            return
+        writer = None
+        if args.output:
+            from exporters import open_writer
+            writer = open_writer(args.output, args.output_format)
+        checkpoint = Checkpoint(args.resume, plan) if args.resume else None
+        scanner = PortScanner(args.target, ports, args.threads, args.timeout, exclusions, prober,
+                              args.family, cache, rate=args.rate, profiler=profiler, writer=writer,
+                              liveness=liveness, retries=args.retries, plan=plan, checkpoint=checkpoint,
+                              network=None if args.learn is None else network)
+        
+        if args.metrics_port:
+            from metrics import serve_metrics
+            serve_metrics(args.metrics_port)
+        reporter = None
+        if args.stats_interval:
+            from metrics import StatsReporter
+            reporter = StatsReporter(args.stats_interval, progress=lambda: scanner.progress).start()
+        profiler.start()
+        STARTUP.mark('scan started')
+        try:
+            scanner.scan()
+            if args.http:
+                from http_probe import HTTPProber
+                scanner.probe_http(HTTPProber(timeout=max(args.timeout, 3.0)))
+            if args.checks or args.checks_dir:
+                from checks import CheckRunner, load_plugins, select_checks
+                if args.checks_dir:
+                    load_plugins(args.checks_dir)
+                runner = CheckRunner(select_checks(args.checks), concurrency=args.threads,
+                                     connect_timeout=max(args.timeout, 3.0), timeout=args.check_timeout)
+                scanner.run_checks(runner)
+        finally:
+            if reporter:
+                reporter.stop()
+            if writer is not None:
+                writer.close()
+        
+        if cache is not None:
+            with profiler.stage('cache_save'):
+                cache.save(args.cache)
+        if args.learn is not None:
+            network.save()
+        
+        if profiler.enabled:
+            profiler.stop()
+            profiler.write_report(args.profile_output, f"Scan profile: {args.target} ports {args.ports}")
+            print(f"Profile report written to {args.profile_output}")
+        
+        if args.startup_report:
+            STARTUP.mark('scan finished')
+            STARTUP.print_report()
         
     except KeyboardInterrupt:
         print("\nScan interrupted by user")
+        if scanner is not None:
+            print(f"Covered {format_progress(scanner.progress.snapshot())}")
         sys.exit(1)
     except Exception as e:
         print(f"Error: {e}")
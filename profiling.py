@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+"""
+Scan Profiling
+Opt-in stage timers, cProfile and tracemalloc for the scan pipeline
+"""
+
+import io
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+MODES = ('timers', 'cprofile', 'tracemalloc', 'all')
+
+
+class StageStats:
+    """Call count and wall time of one pipeline stage"""
+
+    __slots__ = ('count', 'total', 'maximum')
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.maximum = 0.0
+
+    def add(self, elapsed):
+        self.count += 1
+        self.total += elapsed
+        if elapsed > self.maximum:
+            self.maximum = elapsed
+
+
+class Profiler:
+    """Per-stage timers plus optional cProfile and tracemalloc for one scan
+
+    A disabled profiler hands out no-op contexts, so instrumented code pays
+    one attribute check per stage when profiling is off. cProfile only sees
+    the thread that called start(); stage timers work from any thread.
+    """
+
+    def __init__(self, mode=None, top=25):
+        self.mode = mode
+        self.enabled = mode is not None
+        self.use_cprofile = mode in ('cprofile', 'all')
+        self.use_tracemalloc = mode in ('tracemalloc', 'all')
+        self.top = top
+        self.stages = {}
+        self.lock = threading.Lock()
+        self.profile = None
+        self.started = None
+        self.duration = None
+        self.memory = None
+        self._started_tracemalloc = False
+
+    def start(self):
+        """Begin timing; starts cProfile/tracemalloc when requested"""
+        if not self.enabled:
+            return self
+        self.started = time.perf_counter()
+        if self.use_tracemalloc:
+            import tracemalloc
+            if not tracemalloc.is_tracing():
+                tracemalloc.start(10)
+                self._started_tracemalloc = True
+        if self.use_cprofile:
+            import cProfile
+            self.profile = cProfile.Profile()
+            try:
+                self.profile.enable()
+            except ValueError:
+                # Another profiler is active in this thread
+                self.profile = None
+        return self
+
+    def stop(self):
+        """Stop collectors and freeze the measurements"""
+        if not self.enabled or self.started is None or self.duration is not None:
+            return
+        self.duration = time.perf_counter() - self.started
+        if self.profile is not None:
+            self.profile.disable()
+        if self.use_tracemalloc:
+            import tracemalloc
+            if tracemalloc.is_tracing():
+                current, peak = tracemalloc.get_traced_memory()
+                top = tracemalloc.take_snapshot().statistics('lineno')[:10]
+                self.memory = {
+                    'current_kb': current // 1024,
+                    'peak_kb': peak // 1024,
+                    'top': [(str(stat.traceback[0]), stat.size // 1024, stat.count) for stat in top]
+                }
+                if self._started_tracemalloc:
+                    tracemalloc.stop()
+
+    def record(self, name, elapsed):
+        """Add one timed occurrence of a stage"""
+        with self.lock:
+            stats = self.stages.get(name)
+            if stats is None:
+                stats = self.stages[name] = StageStats()
+            stats.add(elapsed)
+
+    @contextmanager
+    def _timed(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start)
+
+    def stage(self, name):
+        """Context manager timing a block as part of a stage"""
+        if not self.enabled:
+            return _NULL_CONTEXT
+        return self._timed(name)
+
+    def iterate(self, name, iterable):
+        """Yield from iterable, charging the time spent waiting for each item to a stage"""
+        if not self.enabled:
+            yield from iterable
+            return
+        iterator = iter(iterable)
+        while True:
+            start = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                self.record(name, time.perf_counter() - start)
+                return
+            self.record(name, time.perf_counter() - start)
+            yield item
+
+    def stage_report(self):
+        """Return [(stage, count, total s, mean ms, max ms)] sorted by total time"""
+        with self.lock:
+            rows = [(name, s.count, s.total, s.total / s.count * 1000 if s.count else 0.0, s.maximum * 1000)
+                    for name, s in self.stages.items()]
+        return sorted(rows, key=lambda row: row[2], reverse=True)
+
+    def function_report(self, sort='cumulative'):
+        """Top functions from cProfile as text, or None"""
+        if self.profile is None:
+            return None
+        import pstats
+        buffer = io.StringIO()
+        stats = pstats.Stats(self.profile, stream=buffer)
+        stats.strip_dirs().sort_stats(sort).print_stats(self.top)
+        return buffer.getvalue()
+
+    def report(self, title='Scan profile'):
+        """Render the full text report"""
+        lines = [f"{title} - {datetime.now().isoformat(timespec='seconds')}"]
+        if self.duration is not None:
+            lines.append(f"Wall time: {self.duration:.3f} s")
+        lines.append("")
+        lines.append(f"{'Stage':<20}{'Count':>10}{'Total s':>12}{'Mean ms':>12}{'Max ms':>12}")
+        for name, count, total, mean, maximum in self.stage_report():
+            lines.append(f"{name:<20}{count:>10}{total:>12.3f}{mean:>12.3f}{maximum:>12.3f}")
+
+        if self.memory:
+            lines.append("")
+            lines.append(f"Memory: current {self.memory['current_kb']} KiB, peak {self.memory['peak_kb']} KiB")
+            lines.append("Top allocation sites:")
+            for where, size_kb, count in self.memory['top']:
+                lines.append(f"  {size_kb:>8} KiB {count:>8} blocks  {where}")
+
+        functions = self.function_report()
+        if functions:
+            lines.append("")
+            lines.append("Top functions (cProfile, scan thread):")
+            lines.append(functions.strip('\n'))
+        return '\n'.join(lines) + '\n'
+
+    def write_report(self, path, title='Scan profile'):
+        """Write the text report to path and return it"""
+        with open(path, 'w') as f:
+            f.write(self.report(title))
+        return path
+
+
+class _NullContext:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_CONTEXT = _NullContext()
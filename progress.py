@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+Scan Progress
+Completed-work counters with throughput and ETA estimates
+"""
+
+import threading
+import time
+
+
+class WorkerCounter:
+    """Completed-work count owned by a single worker thread
+
+    Only the owning thread writes to it, so increments need no lock; the
+    tracker reads every counter when it ticks.
+    """
+
+    __slots__ = ('done',)
+
+    def __init__(self):
+        self.done = 0
+
+    def add(self, amount=1):
+        self.done += amount
+
+
+class ProgressTracker:
+    """Aggregates per-worker counters at a fixed tick into rate and ETA"""
+
+    def __init__(self, total, alpha=0.3, clock=time.monotonic):
+        self.total = total
+        self.alpha = alpha
+        self.clock = clock
+        self.counters = []
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.started = clock()
+        self.rate = None
+        self._last = (self.started, 0)
+
+    def counter(self):
+        """Counter for the calling thread, created on first use"""
+        counter = getattr(self.local, 'counter', None)
+        if counter is None:
+            counter = self.local.counter = WorkerCounter()
+            with self.lock:
+                self.counters.append(counter)
+        return counter
+
+    def advance(self, amount=1):
+        """Record completed work for the calling thread"""
+        self.counter().add(amount)
+
+    @property
+    def done(self):
+        with self.lock:
+            counters = list(self.counters)
+        return min(self.total, sum(counter.done for counter in counters))
+
+    @property
+    def fraction(self):
+        return self.done / self.total if self.total else 1.0
+
+    def tick(self):
+        """Fold the work done since the last tick into the EWMA rate and return a snapshot"""
+        now = self.clock()
+        done = self.done
+        last_time, last_done = self._last
+        if now > last_time:
+            instant = (done - last_done) / (now - last_time)
+            self.rate = instant if self.rate is None else self.alpha * instant + (1 - self.alpha) * self.rate
+            self._last = (now, done)
+        return self.snapshot(done)
+
+    def snapshot(self, done=None):
+        """Return {'done', 'total', 'fraction', 'rate', 'eta', 'elapsed'}"""
+        if done is None:
+            done = self.done
+        remaining = self.total - done
+        if remaining <= 0:
+            eta = 0.0
+        elif self.rate:
+            eta = remaining / self.rate
+        else:
+            eta = None
+        return {
+            'done': done,
+            'total': self.total,
+            'fraction': done / self.total if self.total else 1.0,
+            'rate': self.rate or 0.0,
+            'eta': eta,
+            'elapsed': self.clock() - self.started
+        }
+
+
+def format_duration(seconds):
+    """Render seconds as e.g. '45s', '3m12s' or '1h04m'"""
+    if seconds is None:
+        return '--'
+    seconds = int(round(seconds))
+    if seconds < 60:
+        return f"{seconds}s"
+    if seconds < 3600:
+        return f"{seconds // 60}m{seconds % 60:02d}s"
+    return f"{seconds // 3600}h{seconds // 60 % 60:02d}m"
+
+
+def format_progress(snapshot, unit='ports'):
+    """One-line progress text from a tracker snapshot"""
+    return (f"{snapshot['done']}/{snapshot['total']} {unit} ({snapshot['fraction'] * 100:.1f}%)"
+            f" - {snapshot['rate']:.0f}/s - ETA {format_duration(snapshot['eta'])}")
@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""
+Result Cache
+Process-wide (host, port, proto) results with TTL and LRU eviction
+"""
+
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+
+
+class ResultCache:
+    """Thread-safe LRU cache of probe results that expire after a TTL"""
+
+    def __init__(self, ttl=300, max_entries=100000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def _fresh(self, entry, now):
+        return now - entry['timestamp'] <= self.ttl
+
+    def get(self, host, port, proto='tcp'):
+        """Return the cached entry for host:port/proto, or None"""
+        key = (host, port, proto)
+        now = time.time()
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            if not self._fresh(entry, now):
+                del self.entries[key]
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return dict(entry)
+
+    def put(self, host, port, state, proto='tcp', service=None, banner=None, timestamp=None):
+        """Store a probe result, keeping a known banner if none is given"""
+        key = (host, port, proto)
+        with self.lock:
+            previous = self.entries.pop(key, None)
+            if previous and previous['state'] == state:
+                if banner is None:
+                    banner = previous.get('banner')
+                if service is None:
+                    service = previous.get('service')
+            self.entries[key] = {
+                'state': state,
+                'service': service,
+                'banner': banner,
+                'timestamp': timestamp if timestamp is not None else time.time()
+            }
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def set_banner(self, host, port, banner, proto='tcp'):
+        """Attach a banner to an existing entry"""
+        with self.lock:
+            entry = self.entries.get((host, port, proto))
+            if entry is not None:
+                entry['banner'] = banner
+
+    def open_ports(self, host, proto='tcp'):
+        """Return {port: entry} for fresh open entries of a host"""
+        now = time.time()
+        with self.lock:
+            return {port: dict(entry) for (h, port, p), entry in self.entries.items()
+                    if h == host and p == proto and entry['state'] == 'open' and self._fresh(entry, now)}
+
+    def clear(self):
+        """Drop every entry"""
+        with self.lock:
+            self.entries.clear()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def seed_from_history(self, history):
+        """Load open ports recorded in scan history entries that are still fresh"""
+        now = time.time()
+        for scan in history:
+            try:
+                timestamp = datetime.fromisoformat(scan['timestamp']).timestamp()
+            except (KeyError, ValueError):
+                continue
+            if now - timestamp > self.ttl:
+                continue
+            host = scan.get('address') or scan.get('target')
+            for result in scan.get('results', []):
+                self.put(host, result['port'], result.get('state', 'open'),
+                         service=result.get('service'), banner=result.get('banner'),
+                         timestamp=timestamp)
+
+    def save(self, path):
+        """Persist fresh entries to a JSON file"""
+        now = time.time()
+        with self.lock:
+            rows = [[host, port, proto, entry] for (host, port, proto), entry in self.entries.items()
+                    if self._fresh(entry, now)]
+        with open(path, 'w') as f:
+            json.dump(rows, f)
+
+    def load(self, path):
+        """Load entries saved with save(), skipping expired ones"""
+        if not os.path.exists(path):
+            return
+        with open(path, 'r') as f:
+            rows = json.load(f)
+        now = time.time()
+        for host, port, proto, entry in rows:
+            if now - entry['timestamp'] <= self.ttl:
+                self.put(host, port, entry['state'], proto, entry.get('service'),
+                         entry.get('banner'), entry['timestamp'])
+
+
+# Shared by every tab and scan in the process
+shared_cache = ResultCache()
@@ -0,0 +1,306 @@
+#!/usr/bin/env python3
+"""
+Result Set
+Columnar, array-backed storage for scan findings
+"""
+
+import sys
+from array import array
+
+from scan_engine import STATE_CODES, UNKNOWN_CODE
+
+STATE_NAMES = {code: name for name, code in STATE_CODES.items()}
+
+# typecode -> numpy dtype for zero-copy column views
+_DTYPES = {'B': 'uint8', 'H': 'uint16', 'I': 'uint32'}
+_KEY_BITS = {'host': 32, 'port': 16, 'state': 8, 'service': 16, 'banner': 32}
+
+# NumPy takes most of a cold import, so it is loaded when a column is first used
+_numpy = False
+
+
+def load_numpy():
+    """The numpy module, imported on first call; None when it is not installed"""
+    global _numpy
+    if _numpy is False:
+        try:
+            import numpy
+        except ImportError:
+            numpy = None
+        _numpy = numpy
+    return _numpy
+
+
+class StringTable:
+    """Append-only interned strings addressed by integer ids starting at 1 (0 means None)"""
+
+    def __init__(self):
+        self.strings = [None]
+        self.ids = {None: 0}
+
+    def intern(self, value):
+        string_id = self.ids.get(value)
+        if string_id is None:
+            string_id = self.ids[value] = len(self.strings)
+            self.strings.append(value)
+        return string_id
+
+    def lookup(self, value):
+        """Id of an already interned string, or None"""
+        return self.ids.get(value)
+
+    def __getitem__(self, string_id):
+        return self.strings[string_id]
+
+    def __len__(self):
+        return len(self.strings) - 1
+
+    def memory_usage(self):
+        return (sys.getsizeof(self.strings) + sys.getsizeof(self.ids)
+                + sum(sys.getsizeof(s) for s in self.strings if s is not None))
+
+
+class ResultSet:
+    """Scan findings stored as parallel typed arrays
+
+    Each row costs 4 bytes of host id, 2 of port, 1 of state, 1 (or 2 past
+    255 distinct services) of service id and 4 of banner id; hosts,
+    services and banners live once in shared string tables. Filtering and
+    sorting use NumPy views of the columns when NumPy is installed and
+    plain loops otherwise.
+    """
+
+    def __init__(self, tables=None):
+        self.hosts = array('I')
+        self.ports = array('H')
+        self.states = array('B')
+        self.services = array('B')
+        self.banners = array('I')
+        self.tables = tables or {'host': StringTable(), 'service': StringTable(), 'banner': StringTable()}
+
+    # Building
+
+    def add(self, host, port, state='open', service=None, banner=None):
+        """Append a finding and return its index"""
+        service_id = self.tables['service'].intern(service)
+        if service_id > 255 and self.services.typecode == 'B':
+            self.services = array('H', self.services)
+        self.hosts.append(self.tables['host'].intern(host))
+        self.ports.append(port)
+        self.states.append(STATE_CODES.get(state, UNKNOWN_CODE))
+        self.services.append(service_id)
+        self.banners.append(self.tables['banner'].intern(banner))
+        return len(self.ports) - 1
+
+    def extend(self, rows):
+        """Append row dicts with host, port, state, service and banner keys"""
+        for row in rows:
+            self.add(row.get('host'), row['port'], row.get('state', 'open'), row.get('service'), row.get('banner'))
+
+    def set_banner(self, index, banner):
+        self.banners[index] = self.tables['banner'].intern(banner)
+
+    def clear(self):
+        for name in ('hosts', 'ports', 'states', 'services', 'banners'):
+            column = getattr(self, name)
+            setattr(self, name, array(column.typecode))
+
+    @classmethod
+    def from_dicts(cls, results, host=None):
+        """Build from a list of result dicts such as a history entry's 'results'"""
+        result_set = cls()
+        for result in results:
+            result_set.add(result.get('host', host), result['port'], result.get('state', 'open'),
+                           result.get('service'), result.get('banner'))
+        return result_set
+
+    # Reading
+
+    def __len__(self):
+        return len(self.ports)
+
+    def row(self, index):
+        """Row dict for one index"""
+        return {
+            'host': self.tables['host'][self.hosts[index]],
+            'port': self.ports[index],
+            'state': STATE_NAMES.get(self.states[index], 'unknown'),
+            'service': self.tables['service'][self.services[index]],
+            'banner': self.tables['banner'][self.banners[index]]
+        }
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(index)
+        return self.row(index)
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self.row(index)
+
+    def rows(self, indices):
+        """Yield row dicts for the given indices"""
+        for index in indices:
+            yield self.row(int(index))
+
+    def to_dicts(self, include_host=False):
+        """Plain dicts, the shape stored in scan history"""
+        results = []
+        for row in self:
+            if not include_host:
+                del row['host']
+            results.append(row)
+        return results
+
+    def column(self, name):
+        """A column as a zero-copy NumPy array, or the raw array without NumPy
+
+        The NumPy view pins the array's buffer: drop it before adding rows.
+        """
+        numpy = load_numpy()
+        values = getattr(self, name)
+        if numpy is None:
+            return values
+        return numpy.frombuffer(values, dtype=_DTYPES[values.typecode]) if len(values) else \
+            numpy.zeros(0, dtype=_DTYPES[values.typecode])
+
+    # Querying
+
+    def where(self, host=None, state=None, port=None, service=None, has_banner=None):
+        """Indices of rows matching every given criterion
+
+        port may be a single port, a (low, high) inclusive tuple or a
+        collection of ports.
+        """
+        numpy = load_numpy()
+        criteria = []
+        if host is not None:
+            host_id = self.tables['host'].lookup(host)
+            if host_id is None:
+                return []
+            criteria.append(('hosts', '==', host_id))
+        if state is not None:
+            criteria.append(('states', '==', STATE_CODES.get(state, UNKNOWN_CODE)))
+        if service is not None:
+            service_id = self.tables['service'].lookup(service)
+            if service_id is None:
+                return []
+            criteria.append(('services', '==', service_id))
+        if port is not None:
+            if isinstance(port, tuple):
+                criteria.append(('ports', 'range', port))
+            elif isinstance(port, int):
+                criteria.append(('ports', '==', port))
+            else:
+                criteria.append(('ports', 'in', sorted(set(port))))
+        if has_banner is not None:
+            criteria.append(('banners', '!=' if has_banner else '==', 0))
+
+        if numpy is not None:
+            return self._where_numpy(criteria)
+        return self._where_python(criteria)
+
+    def _where_numpy(self, criteria):
+        numpy = load_numpy()
+        mask = numpy.ones(len(self), dtype=bool)
+        for name, op, value in criteria:
+            values = self.column(name)
+            if op == '==':
+                mask &= values == value
+            elif op == '!=':
+                mask &= values != value
+            elif op == 'range':
+                mask &= (values >= value[0]) & (values <= value[1])
+            else:
+                mask &= numpy.isin(values, value)
+        return numpy.flatnonzero(mask)
+
+    def _where_python(self, criteria):
+        indices = range(len(self))
+        for name, op, value in criteria:
+            values = getattr(self, name)
+            if op == '==':
+                indices = [i for i in indices if values[i] == value]
+            elif op == '!=':
+                indices = [i for i in indices if values[i] != value]
+            elif op == 'range':
+                low, high = value
+                indices = [i for i in indices if low <= values[i] <= high]
+            else:
+                wanted = set(value)
+                indices = [i for i in indices if values[i] in wanted]
+        return list(indices)
+
+    def count(self, **criteria):
+        return len(self.where(**criteria))
+
+    def take(self, indices):
+        """New ResultSet with the given rows, sharing this set's string tables"""
+        numpy = load_numpy()
+        subset = ResultSet(self.tables)
+        subset.services = array(self.services.typecode)
+        if numpy is not None and len(self):
+            indices = numpy.asarray(indices, dtype=numpy.intp)
+            for name in ('hosts', 'ports', 'states', 'services', 'banners'):
+                column = getattr(self, name)
+                setattr(subset, name, array(column.typecode, self.column(name)[indices].tobytes()))
+            return subset
+        for index in indices:
+            for name in ('hosts', 'ports', 'states', 'services', 'banners'):
+                getattr(subset, name).append(getattr(self, name)[index])
+        return subset
+
+    def filter(self, **criteria):
+        """New ResultSet with the rows matching where(**criteria)"""
+        return self.take(self.where(**criteria))
+
+    def sorted_indices(self, by=('host', 'port')):
+        """Row order sorted by host string and/or port"""
+        numpy = load_numpy()
+        if isinstance(by, str):
+            by = (by,)
+        if not by or not len(self):
+            return list(range(len(self)))
+        host_rank = None
+        if 'host' in by:
+            # Rank interned hosts once so rows sort by host string, not by intern order
+            names = self.tables['host'].strings
+            ordered = sorted(range(1, len(names)), key=lambda i: str(names[i]))
+            host_rank = array('I', bytes(4 * len(names)))
+            for rank, host_id in enumerate(ordered):
+                host_rank[host_id] = rank
+
+        if numpy is not None:
+            keys = []
+            for key in by:
+                if key == 'host':
+                    keys.append(numpy.frombuffer(host_rank, dtype='uint32')[self.column('hosts')])
+                else:
+                    keys.append(self.column(key + 's'))
+            # lexsort uses the last key as the primary one
+            return numpy.lexsort(tuple(reversed(keys)))
+
+        # Pack the keys into one integer per row; far cheaper to sort than tuples
+        columns = [host_rank[h] for h in self.hosts] if by[0] == 'host' else list(getattr(self, by[0] + 's'))
+        for key in by[1:]:
+            width = _KEY_BITS[key]
+            values = (host_rank[h] for h in self.hosts) if key == 'host' else getattr(self, key + 's')
+            columns = [(packed << width) | value for packed, value in zip(columns, values)]
+        return sorted(range(len(self)), key=columns.__getitem__)
+
+    def sort(self, by=('host', 'port')):
+        """New ResultSet sorted by host and/or port"""
+        return self.take(self.sorted_indices(by))
+
+    def open_ports(self, host=None):
+        """Sorted open ports, optionally for one host"""
+        indices = self.where(host=host, state='open')
+        return sorted({self.ports[int(i)] for i in indices})
+
+    def memory_usage(self):
+        """Approximate bytes used by the columns and string tables"""
+        columns = sum(sys.getsizeof(getattr(self, name))
+                      for name in ('hosts', 'ports', 'states', 'services', 'banners'))
+        return columns + sum(table.memory_usage() for table in self.tables.values())
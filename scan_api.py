@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""
+Scan API
+In-process scanning for other programs: a sync iterator and an async iterator of findings
+"""
+
+import asyncio
+import socket
+import threading
+from collections import namedtuple
+
+from exclusions import ExclusionList
+from liveness import HostGate, LivenessPolicy
+from scan_engine import (ConnectProber, ProbeScheduler, OPEN, CLOSED, TIMEOUT, ERROR,
+                         expand_targets, resolve_target)
+from transport import default_transport
+
+# target is the name the caller gave, host the address that was probed
+Finding = namedtuple('Finding', ['target', 'host', 'port', 'state', 'rtt', 'error'])
+
+ALL_STATES = (OPEN, CLOSED, TIMEOUT, ERROR)
+
+_DONE = object()
+
+
+def _targets(targets):
+    if isinstance(targets, str):
+        return expand_targets(targets)
+    expanded = []
+    for target in targets:
+        expanded.extend(expand_targets(str(target)))
+    return expanded
+
+
+def _ports(ports):
+    if isinstance(ports, str):
+        from port_scanner import parse_ports
+        return parse_ports(ports)
+    if isinstance(ports, int):
+        return [ports]
+    return list(ports)
+
+
+def scan_iter(targets, ports, concurrency=100, timeout=1.0, rate=None, retries=1, states=(OPEN,),
+              family=socket.AF_UNSPEC, liveness=None, exclusions=None, cancel=None, transport=None):
+    """Scan in the calling thread, yielding a Finding per result as it arrives
+
+    targets is a spec string ('10.0.0.0/28,db.local') or an iterable of
+    them; ports is a spec string ('1-1000,8080') or an iterable of ints.
+    Only findings whose state is in states are yielded (None for all).
+    Unanswered probes are resent up to retries times before they count as
+    timeouts. Nothing is probed ahead of the consumer beyond the concurrency
+    window, so a slow consumer slows the scan instead of buffering results.
+    Closing the iterator, or setting the cancel Event from another thread,
+    stops the scan and releases its sockets.
+    """
+    ports = _ports(ports)
+    exclusions = exclusions or ExclusionList()
+    ports = exclusions.filter_ports(ports)
+    names = {}
+    hosts = []
+    for target in _targets(targets):
+        try:
+            host_family, address = resolve_target(target, family)
+        except OSError as e:
+            if states is None or ERROR in states:
+                yield Finding(target, None, None, ERROR, 0.0, str(e))
+            continue
+        if exclusions.excludes_host(address) or address in names:
+            continue
+        names[address] = target
+        hosts.append((address, host_family, ports))
+
+    gate = HostGate(liveness or LivenessPolicy(first_k=0))
+    owned = transport is None
+    if owned:
+        transport = default_transport(ConnectProber(timeout), concurrency)
+    scheduler = ProbeScheduler(transport, concurrency, timeout, rate, retries)
+    try:
+        for result in scheduler.run(gate.probes(hosts)):
+            if cancel is not None and cancel.is_set():
+                return
+            gate.observe(result.host, result.port, result.state)
+            if states is None or result.state in states:
+                yield Finding(names.get(result.host, result.host), result.host, result.port,
+                              result.state, result.rtt, result.error)
+    finally:
+        if owned:
+            transport.close()
+
+
+def scan_all(targets, ports, **options):
+    """Run a scan to completion and return its findings as a list"""
+    return list(scan_iter(targets, ports, **options))
+
+
+async def scan(targets, ports, buffer=256, **options):
+    """Async iterator of findings: async for finding in scan('10.0.0.0/28', '1-1000')
+
+    The scan runs on its own thread with its own sockets, so concurrent
+    scans have independent concurrency limits and never block the event
+    loop. At most buffer findings wait for the consumer; beyond that the
+    scan pauses until the consumer catches up. Cancelling the consuming
+    task or leaving the loop early stops the scan. Options are those of
+    scan_iter().
+    """
+    loop = asyncio.get_running_loop()
+    results = asyncio.Queue()
+    slots = threading.Semaphore(max(1, buffer))
+    cancel = threading.Event()
+
+    def deliver(item):
+        try:
+            loop.call_soon_threadsafe(results.put_nowait, item)
+        except RuntimeError:
+            # The event loop closed under us
+            cancel.set()
+
+    def worker():
+        item = _DONE
+        try:
+            for finding in scan_iter(targets, ports, cancel=cancel, **options):
+                while not slots.acquire(timeout=0.1):
+                    if cancel.is_set():
+                        return
+                if cancel.is_set():
+                    return
+                deliver(finding)
+        except Exception as e:
+            item = e
+        if not cancel.is_set():
+            deliver(item)
+
+    thread = threading.Thread(target=worker, name='scan-api', daemon=True)
+    thread.start()
+    try:
+        while True:
+            item = await results.get()
+            if item is _DONE:
+                return
+            if isinstance(item, Exception):
+                raise item
+            slots.release()
+            yield item
+    finally:
+        cancel.set()
@@ -0,0 +1,521 @@
+#!/usr/bin/env python3
+"""
+Connect Scan Engine
+Socket setup, result classification and throttling for TCP connect probes
+"""
+
+import errno
+import heapq
+import ipaddress
+import itertools
+import socket
+import struct
+import sys
+import threading
+import time
+from collections import deque, namedtuple
+
+from metrics import REGISTRY
+
+# Probe states
+OPEN = 'open'
+CLOSED = 'closed'
+TIMEOUT = 'timeout'
+ERROR = 'error'
+# Local resources ran out; the probe never left the host and must be retried
+EXHAUSTED = 'exhausted'
+
+# Yielded by a probe source when nothing can be sent until an in-flight probe finishes
+DEFER = object()
+
+# Compact one-byte codes for stored results
+STATE_CODES = {OPEN: 0, CLOSED: 1, TIMEOUT: 2, ERROR: 3, EXHAUSTED: 4}
+UNKNOWN_CODE = 255
+
+# Windows reports WSA error codes instead of errno values
+WSAEWOULDBLOCK = 10035
+WSAEADDRINUSE = 10048
+WSAEADDRNOTAVAIL = 10049
+WSAENOBUFS = 10055
+WSAETIMEDOUT = 10060
+WSAECONNREFUSED = 10061
+WSAEMFILE = 10024
+
+REFUSED_ERRNOS = {errno.ECONNREFUSED, WSAECONNREFUSED}
+TIMEOUT_ERRNOS = {errno.EAGAIN, errno.EWOULDBLOCK, errno.ETIMEDOUT, errno.EINPROGRESS,
+                  WSAEWOULDBLOCK, WSAETIMEDOUT}
+
+# Local resource exhaustion: ephemeral ports, buffers or file descriptors ran out.
+# These say nothing about the target and must never be reported as closed.
+EXHAUSTION_ERRNOS = {errno.EADDRNOTAVAIL, errno.EADDRINUSE, errno.ENOBUFS,
+                     errno.EMFILE, errno.ENFILE,
+                     WSAEADDRINUSE, WSAEADDRNOTAVAIL, WSAENOBUFS, WSAEMFILE}
+
+# Engine metrics, readable through metrics.REGISTRY or its HTTP endpoint
+PROBES_SENT = REGISTRY.counter('duckscanner_probes_sent_total', 'Probes handed to the network')
+PROBE_RESULTS = REGISTRY.counter('duckscanner_probe_results_total', 'Finished probes by outcome', ['state'])
+PROBE_ERRORS = REGISTRY.counter('duckscanner_probe_errors_total', 'Failed probes by errno', ['errno'])
+PROBES_IN_FLIGHT = REGISTRY.gauge('duckscanner_probes_in_flight', 'Probes waiting for an answer')
+PROBE_RTT = REGISTRY.histogram('duckscanner_probe_rtt_seconds', 'Time from connect to answer')
+QUEUE_DEPTH = REGISTRY.gauge('duckscanner_queue_depth', 'Work waiting per pipeline stage', ['stage'])
+PROBE_RETRIES = REGISTRY.counter('duckscanner_probe_retries_total', 'Timed-out probes sent again')
+
+
+def record_probe(state, error, rtt):
+    """Update engine metrics for a finished probe"""
+    PROBE_RESULTS.inc(state)
+    if state in (OPEN, CLOSED):
+        PROBE_RTT.observe(rtt)
+    elif state in (ERROR, EXHAUSTED) and error:
+        PROBE_ERRORS.inc(errno.errorcode.get(error, str(error)))
+
+
+# Linux: defer source port selection to connect() so the kernel can reuse a
+# local port for different destinations
+IP_BIND_ADDRESS_NO_PORT = getattr(socket, 'IP_BIND_ADDRESS_NO_PORT', 24)
+
+# l_onoff=1, l_linger=0: close() sends RST and leaves no TIME_WAIT entry
+if sys.platform.startswith('win'):
+    LINGER_ABORT = struct.pack('HH', 1, 0)
+else:
+    LINGER_ABORT = struct.pack('ii', 1, 0)
+
+
+class ResourceExhausted(Exception):
+    """Local socket resources stayed exhausted after backing off"""
+
+
+class Throttle:
+    """Shared delay that backs off on exhaustion and relaxes on success"""
+
+    def __init__(self, min_delay=0.005, max_delay=1.0):
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.delay = 0.0
+        self.events = 0
+        self.lock = threading.Lock()
+
+    def wait(self):
+        """Sleep for the current delay, if any"""
+        delay = self.delay
+        if delay:
+            time.sleep(delay)
+
+    def backoff(self):
+        """Double the delay after an exhaustion event"""
+        with self.lock:
+            self.events += 1
+            self.delay = min(self.max_delay, max(self.min_delay, self.delay * 2))
+
+    def relax(self):
+        """Halve the delay after a successful probe"""
+        if self.delay:
+            with self.lock:
+                self.delay /= 2
+                if self.delay < self.min_delay:
+                    self.delay = 0.0
+
+
+class ConnectProber:
+    """TCP connect prober tuned for sustained high-rate scanning"""
+
+    def __init__(self, timeout=1.0, abortive_close=True, source_addresses=None,
+                 source_ports=None, max_exhaustion_retries=10, throttle=None):
+        self.timeout = timeout
+        self.abortive_close = abortive_close
+        self.source_addresses = list(source_addresses or [])
+        self.source_ports = list(source_ports or [])
+        self.max_exhaustion_retries = max_exhaustion_retries
+        self.throttle = throttle or Throttle()
+        self._address_cycles = {}
+        for family in (socket.AF_INET, socket.AF_INET6):
+            addresses = [a for a in self.source_addresses if address_family(a) == family]
+            if addresses:
+                self._address_cycles[family] = itertools.cycle(addresses)
+        self._port_cycle = itertools.cycle(self.source_ports) if self.source_ports else None
+        self._cycle_lock = threading.Lock()
+
+    def _next_source(self, family):
+        """Pick the next source address and port for a family, if configured"""
+        with self._cycle_lock:
+            cycle = self._address_cycles.get(family)
+            address = next(cycle) if cycle else ''
+            port = next(self._port_cycle) if self._port_cycle else 0
+        return address, port
+
+    def create_socket(self, family=socket.AF_INET):
+        """Create a socket set up for scanning"""
+        sock = socket.socket(family, socket.SOCK_STREAM)
+        try:
+            sock.settimeout(self.timeout)
+            if self.abortive_close and hasattr(socket, 'SO_LINGER'):
+                sock.setsockopt(socket.SOL_SOCKET, socket.SO_LINGER, LINGER_ABORT)
+            if family in self._address_cycles or self._port_cycle:
+                address, port = self._next_source(family)
+                if port:
+                    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+                elif sys.platform.startswith('linux') and family == socket.AF_INET:
+                    try:
+                        sock.setsockopt(socket.IPPROTO_IP, IP_BIND_ADDRESS_NO_PORT, 1)
+                    except OSError:
+                        pass
+                sock.bind((address, port))
+        except Exception:
+            sock.close()
+            raise
+        return sock
+
+    def probe(self, host, port, family=None):
+        """Probe host:port and return (state, errno)"""
+        if family is None:
+            family = address_family(host) or socket.AF_INET
+        for attempt in range(self.max_exhaustion_retries + 1):
+            self.throttle.wait()
+            try:
+                sock = self.create_socket(family)
+            except OSError as e:
+                if e.errno in EXHAUSTION_ERRNOS:
+                    record_probe(EXHAUSTED, e.errno, 0.0)
+                    self.throttle.backoff()
+                    continue
+                record_probe(ERROR, e.errno, 0.0)
+                return ERROR, e.errno
+            PROBES_SENT.inc()
+            PROBES_IN_FLIGHT.inc()
+            started = time.monotonic()
+            try:
+                result = sock.connect_ex((host, port))
+            except socket.timeout:
+                result = errno.ETIMEDOUT
+            except OSError as e:
+                result = e.errno
+            finally:
+                sock.close()
+                PROBES_IN_FLIGHT.dec()
+
+            state = classify(result)
+            record_probe(state, result, time.monotonic() - started)
+            if state == EXHAUSTED:
+                self.throttle.backoff()
+                continue
+
+            self.throttle.relax()
+            return state, result
+
+        raise ResourceExhausted(f"Local socket resources exhausted probing {host}:{port}")
+
+
+def classify(result):
+    """Map a connect() errno to a probe state"""
+    if result == 0:
+        return OPEN
+    if result in REFUSED_ERRNOS:
+        return CLOSED
+    if result in TIMEOUT_ERRNOS:
+        return TIMEOUT
+    if result in EXHAUSTION_ERRNOS:
+        return EXHAUSTED
+    return ERROR
+
+
+def parse_port_range(port_string):
+    """Parse a source port range such as '40000-49999'"""
+    if not port_string:
+        return []
+    start, _, end = port_string.partition('-')
+    return list(range(int(start), int(end or start) + 1))
+
+
+def address_family(host):
+    """Return the socket family of a literal IP address, or None"""
+    try:
+        return socket.AF_INET6 if ipaddress.ip_address(host).version == 6 else socket.AF_INET
+    except ValueError:
+        return None
+
+
+def resolve_target(host, family=socket.AF_UNSPEC):
+    """Resolve a hostname to (family, address), preferring the resolver's order"""
+    if family == socket.AF_UNSPEC:
+        literal = address_family(host)
+        if literal:
+            return literal, host
+    infos = socket.getaddrinfo(host, None, family, socket.SOCK_STREAM)
+    if not infos:
+        raise socket.gaierror(f"No addresses found for {host}")
+    family, _, _, _, sockaddr = infos[0]
+    return family, sockaddr[0]
+
+
+def expand_targets(spec, limit=1 << 20):
+    """Expand a comma or whitespace separated target list into individual targets
+
+    Entries may be hostnames, addresses, CIDR blocks or address ranges
+    ('10.0.0.1-10.0.0.50' or '10.0.0.1-50').
+    """
+    targets = []
+    for entry in spec.replace(',', ' ').split():
+        if '/' in entry:
+            network = ipaddress.ip_network(entry, strict=False)
+            if network.num_addresses > limit:
+                raise ValueError(f"{entry} has more than {limit} addresses")
+            targets.extend(str(address) for address in network.hosts())
+        elif '-' in entry and address_family(entry.split('-', 1)[0]):
+            first, last = entry.split('-', 1)
+            first = ipaddress.ip_address(first)
+            if last.isdigit() and first.version == 4:
+                last = first.exploded.rsplit('.', 1)[0] + '.' + last
+            last = ipaddress.ip_address(last)
+            if first.version != last.version or last < first:
+                raise ValueError(f"Invalid address range: {entry}")
+            if int(last) - int(first) >= limit:
+                raise ValueError(f"{entry} has more than {limit} addresses")
+            targets.extend(str(ipaddress.ip_address(value)) for value in range(int(first), int(last) + 1))
+        else:
+            targets.append(entry)
+        if len(targets) > limit:
+            raise ValueError(f"More than {limit} targets")
+    return targets
+
+
+def grab_banner(address, port, family=None, timeout=2, payload=b'\r\n', limit=100):
+    """Connect, send a payload and return the first line of the reply, or None"""
+    if family is None:
+        family = address_family(address) or socket.AF_INET
+    try:
+        with socket.socket(family, socket.SOCK_STREAM) as sock:
+            sock.settimeout(timeout)
+            sock.connect((address, port))
+            sock.send(payload)
+            banner = sock.recv(1024).decode('utf-8', errors='ignore').strip()
+    except OSError:
+        return None
+    return banner[:limit] if banner else None
+
+
+ProbeResult = namedtuple('ProbeResult', ['host', 'port', 'state', 'error', 'rtt', 'attempts'],
+                         defaults=(1,))
+
+
+class ProbeScheduler:
+    """Event-driven probe scheduler that runs on top of any transport
+
+    The transport owns sockets (or their simulation) and the clock; the
+    scheduler decides what to send and when, bounded by concurrency, rate
+    and timeout. Probes are (host, port) or (host, port, family) tuples; a
+    lazy probe source may also yield DEFER to hold back until the next
+    result arrives, as long as it has probes in flight.
+
+    A probe that times out is sent again up to retries more times before
+    it is reported as a timeout. Refused and failed probes are final.
+    Retransmissions go to the back of the work: they are sent once the
+    source is exhausted or deferring, each no sooner than retry_delay()
+    after the previous attempt, which grows with the measured loss.
+
+    With a lease (jobs.Lease) every probe also takes a slot from a budget
+    shared with other jobs, and the run ends once the lease is cancelled.
+    """
+
+    def __init__(self, transport, concurrency=100, timeout=1.0, rate=None, retries=0, lease=None):
+        self.transport = transport
+        self.concurrency = max(1, concurrency)
+        self.timeout = timeout
+        self.rate = rate
+        self.retries = max(0, retries)
+        self.lease = lease
+        self.throttle = Throttle()
+        self.sent = 0
+        self.retransmits = 0
+        self.answered = 0
+        self.recovered = 0
+        self._sequence = itertools.count()
+
+    @property
+    def loss(self):
+        """Share of answered probes that needed a retransmission: the observed loss rate"""
+        return self.recovered / self.answered if self.answered else 0.0
+
+    def retry_delay(self, attempt):
+        """Wait before retransmission number attempt (1-based)"""
+        return min(10.0, attempt * (1.0 + 10.0 * self.loss)) * self.timeout
+
+    def _answered(self, attempt):
+        self.answered += 1
+        if attempt:
+            self.recovered += 1
+
+    def run(self, probes):
+        """Yield a ProbeResult for every probe as results arrive"""
+        transport = self.transport
+        lease = self.lease
+        remaining = len(probes) if hasattr(probes, '__len__') else 0
+        QUEUE_DEPTH.inc('probe', amount=remaining)
+        pending = iter(probes)
+        requeued = deque()
+        retry_queue = []
+        inflight = {}
+        deadlines = []
+        interval = 1.0 / self.rate if self.rate else 0.0
+        next_send = transport.now()
+        exhausted_input = False
+
+        def unanswered(host, port, family, attempt, now):
+            """Schedule a retransmission; returns False when retries are used up"""
+            if attempt >= self.retries:
+                return False
+            heapq.heappush(retry_queue, (now + self.retry_delay(attempt + 1), next(self._sequence),
+                                         (host, port, family), attempt + 1))
+            QUEUE_DEPTH.inc('retry')
+            self.retransmits += 1
+            PROBE_RETRIES.inc()
+            return True
+
+        try:
+            while True:
+                if lease is not None and lease.cancelled:
+                    return
+                now = transport.now()
+
+                # Fill the window: resource retries, then fresh probes, then due retransmissions
+                blocked = False
+                deferred = False
+                held = 0.0
+                while len(inflight) < self.concurrency:
+                    if interval and now < next_send:
+                        break
+                    if requeued:
+                        probe, attempt = requeued.popleft()
+                        QUEUE_DEPTH.dec('retry')
+                    elif not exhausted_input and not deferred:
+                        probe = next(pending, None)
+                        if probe is None:
+                            exhausted_input = True
+                            continue
+                        if probe is DEFER:
+                            deferred = True
+                            continue
+                        attempt = 0
+                        if remaining:
+                            remaining -= 1
+                            QUEUE_DEPTH.dec('probe')
+                    elif retry_queue and retry_queue[0][0] <= now:
+                        _, _, probe, attempt = heapq.heappop(retry_queue)
+                        QUEUE_DEPTH.dec('retry')
+                    else:
+                        break
+                    if lease is not None:
+                        held = lease.acquire()
+                        if held:
+                            # Other jobs hold the shared budget: keep the probe until a slot frees up
+                            requeued.appendleft((probe, attempt))
+                            QUEUE_DEPTH.inc('retry')
+                            break
+                    host, port = probe[0], probe[1]
+                    family = probe[2] if len(probe) > 2 else None
+                    token, immediate = transport.open(host, port, family)
+                    self.sent += 1
+                    PROBES_SENT.inc()
+                    if interval:
+                        # Allow catching up on up to 10ms of oversleep, no more
+                        next_send = max(next_send, now - 0.01) + interval
+                    if token is None:
+                        state, error = immediate
+                        record_probe(state, error, 0.0)
+                        if lease is not None:
+                            lease.release()
+                        if state == EXHAUSTED:
+                            # Back off and wait for in-flight probes to free resources
+                            requeued.appendleft((probe, attempt))
+                            QUEUE_DEPTH.inc('retry')
+                            self.throttle.backoff()
+                            blocked = True
+                            break
+                        self.throttle.relax()
+                        if state == TIMEOUT and unanswered(host, port, family, attempt, now):
+                            continue
+                        if state in (OPEN, CLOSED):
+                            self._answered(attempt)
+                        yield ProbeResult(host, port, state, error, 0.0, attempt + 1)
+                        continue
+                    inflight[token] = (host, port, family, now, attempt)
+                    PROBES_IN_FLIGHT.inc()
+                    heapq.heappush(deadlines, (now + self.timeout, next(self._sequence), token))
+
+                if not inflight and exhausted_input and not requeued and not retry_queue:
+                    return
+
+                if deferred and not inflight and not requeued and not retry_queue:
+                    raise RuntimeError("Probe source deferred with no probes in flight")
+
+                if blocked and not inflight:
+                    transport.sleep(self.throttle.delay)
+                    continue
+
+                if held and not inflight:
+                    transport.sleep(held)
+                    continue
+
+                # Wait for completions, the next timeout, the next send slot or the next retransmission
+                now = transport.now()
+                waits = []
+                if deadlines:
+                    waits.append(deadlines[0][0] - now)
+                window_open = len(inflight) < self.concurrency
+                if interval and not exhausted_input and window_open:
+                    waits.append(next_send - now)
+                if retry_queue and window_open and (exhausted_input or deferred):
+                    waits.append(max(retry_queue[0][0], next_send if interval else 0.0) - now)
+                if held:
+                    waits.append(held)
+                wait = min(waits) if waits else 0.0
+
+                for token, state, error in transport.poll(max(0.0, wait)):
+                    info = inflight.pop(token, None)
+                    if info is None:
+                        continue
+                    PROBES_IN_FLIGHT.dec()
+                    if lease is not None:
+                        lease.release()
+                    host, port, family, sent_at, attempt = info
+                    rtt = transport.now() - sent_at
+                    record_probe(state, error, rtt)
+                    if state == EXHAUSTED:
+                        requeued.append(((host, port, family), attempt))
+                        QUEUE_DEPTH.inc('retry')
+                        self.throttle.backoff()
+                        continue
+                    self.throttle.relax()
+                    if state == TIMEOUT and unanswered(host, port, family, attempt, transport.now()):
+                        continue
+                    if state in (OPEN, CLOSED):
+                        self._answered(attempt)
+                    yield ProbeResult(host, port, state, error, rtt, attempt + 1)
+
+                # Expire probes that ran past the timeout
+                now = transport.now()
+                while deadlines and deadlines[0][0] <= now:
+                    _, _, token = heapq.heappop(deadlines)
+                    info = inflight.pop(token, None)
+                    if info is None:
+                        continue
+                    PROBES_IN_FLIGHT.dec()
+                    transport.cancel(token)
+                    if lease is not None:
+                        lease.release()
+                    host, port, family, sent_at, attempt = info
+                    record_probe(TIMEOUT, errno.ETIMEDOUT, now - sent_at)
+                    if unanswered(host, port, family, attempt, now):
+                        continue
+                    yield ProbeResult(host, port, TIMEOUT, errno.ETIMEDOUT, now - sent_at, attempt + 1)
+
+                # Drop deadline entries for probes that already completed
+                while deadlines and deadlines[0][2] not in inflight:
+                    heapq.heappop(deadlines)
+        finally:
+            for token in list(inflight):
+                transport.cancel(token)
+            PROBES_IN_FLIGHT.dec(amount=len(inflight))
+            if lease is not None:
+                lease.release(len(inflight))
+            QUEUE_DEPTH.dec('probe', amount=remaining)
+            QUEUE_DEPTH.dec('retry', amount=len(requeued) + len(retry_queue))
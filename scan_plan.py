@@ -0,0 +1,303 @@
+#!/usr/bin/env python3
+"""
+Scan Plan
+Scans compiled into immutable plans with probe counts, cost estimates, shards and resume checkpoints
+"""
+
+import hashlib
+import ipaddress
+import json
+import os
+import socket
+import time
+from collections import namedtuple
+
+from progress import format_duration
+from scan_engine import OPEN, CLOSED, expand_targets, resolve_target
+
+SCAN_TYPES = ('connect',)
+NETWORK_FILE = 'network_profile.json'
+
+# Used for prefixes the scanner has never probed
+DEFAULT_RTT = 0.05
+DEFAULT_ANSWER_RATIO = 0.5
+
+# Python heap per scanned host, per in-flight probe and per open port found, measured on
+# simulated scans; kernel socket buffers come on top
+BASE_BYTES = 256 * 1024
+HOST_BYTES = 200
+SLOT_BYTES = 300
+OPEN_BYTES = 120
+
+# Observations per prefix before older ones start to fade
+PROFILE_WINDOW = 10000
+
+
+def network_prefix(address):
+    """The /24 (IPv4) or /64 (IPv6) an address belongs to; hosts in one prefix tend to share a path"""
+    try:
+        ip = ipaddress.ip_address(address)
+    except ValueError:
+        return address
+    bits = 24 if ip.version == 4 else 64
+    return str(ipaddress.ip_network(f"{ip}/{bits}", strict=False))
+
+
+class NetworkProfile:
+    """Round-trip times and answer rates learned from past scans, per network prefix
+
+    Every finished probe updates its prefix: an exponentially weighted RTT
+    over answered probes, and counts of answered, unanswered and open probes
+    that fade once a prefix has PROFILE_WINDOW observations, so the profile
+    follows a network that changes.
+    """
+
+    def __init__(self, path=NETWORK_FILE):
+        self.path = path
+        self.prefixes = {}
+
+    def load(self):
+        try:
+            with open(self.path, 'r') as f:
+                self.prefixes = json.load(f)
+        except (OSError, ValueError):
+            self.prefixes = {}
+        return self
+
+    def save(self):
+        if not self.prefixes:
+            return
+        tmp = f"{self.path}.tmp"
+        with open(tmp, 'w') as f:
+            json.dump(self.prefixes, f)
+        os.replace(tmp, self.path)
+
+    def observe(self, result):
+        """Learn from one ProbeResult"""
+        prefix = network_prefix(result.host)
+        entry = self.prefixes.get(prefix)
+        if entry is None:
+            entry = self.prefixes[prefix] = {'rtt': None, 'answered': 0, 'unanswered': 0, 'open': 0}
+        if result.state in (OPEN, CLOSED):
+            entry['answered'] += 1
+            if result.state == OPEN:
+                entry['open'] += 1
+            if result.rtt:
+                entry['rtt'] = result.rtt if entry['rtt'] is None else entry['rtt'] * 0.95 + result.rtt * 0.05
+        else:
+            entry['unanswered'] += 1
+        if entry['answered'] + entry['unanswered'] > PROFILE_WINDOW:
+            for key in ('answered', 'unanswered', 'open'):
+                entry[key] //= 2
+        entry['updated'] = int(time.time())
+
+    def lookup(self, address):
+        """(rtt, answer ratio, open ratio) for an address's prefix, or None when never probed"""
+        entry = self.prefixes.get(network_prefix(address))
+        if not entry:
+            return None
+        total = entry['answered'] + entry['unanswered']
+        if not total:
+            return None
+        answered = entry['answered']
+        return (entry['rtt'] or DEFAULT_RTT, answered / total, entry['open'] / total)
+
+
+Estimate = namedtuple('Estimate', ['probes', 'expected_probes', 'duration', 'bound', 'rtt', 'answer_ratio',
+                                   'learned_hosts', 'expected_open', 'memory'])
+
+
+class ScanPlan(namedtuple('ScanPlan', ['target', 'hosts', 'ports', 'unresolved', 'excluded', 'scan_type',
+                                       'concurrency', 'timeout', 'rate', 'retries', 'liveness', 'shard'])):
+    """Everything a scan will do, fixed before it starts
+
+    hosts is a tuple of (address, family) after resolution, exclusions and
+    sharding; ports a tuple after exclusions; unresolved holds
+    (target, error) pairs and excluded the excluded addresses. shard is
+    (index, count), (0, 1) for a whole scan. The fingerprint covers what is
+    probed but not how fast, so a scan can be resumed with a different rate.
+    """
+
+    __slots__ = ()
+
+    @property
+    def probes(self):
+        return len(self.hosts) * len(self.ports)
+
+    def fingerprint(self):
+        identity = [self.target, [address for address, _ in self.hosts], list(self.ports),
+                    self.scan_type, list(self.shard)]
+        return hashlib.sha1(json.dumps(identity).encode()).hexdigest()[:16]
+
+    def split(self, index, count):
+        """Shard index of count (0-based): every count-th host, so shards see alike mixes of networks"""
+        if self.shard != (0, 1):
+            raise ValueError("Plan is already a shard")
+        if not 0 <= index < count:
+            raise ValueError(f"Shard {index + 1}/{count} is out of range")
+        return self._replace(hosts=self.hosts[index::count], shard=(index, count))
+
+    def without(self, addresses):
+        """The plan minus hosts that are already done"""
+        addresses = set(addresses)
+        return self._replace(hosts=tuple(host for host in self.hosts if host[0] not in addresses))
+
+    def estimate(self, profile=None):
+        """Expected probes, duration (seconds) and Python memory (bytes) of running the plan
+
+        Each host's prefix supplies its RTT and answer ratio when the profile
+        has seen it, else DEFAULT_RTT and DEFAULT_ANSWER_RATIO. An answered
+        probe holds a concurrency slot for one RTT, an unanswered one for the
+        timeout, once per attempt. With liveness gating, hosts in prefixes that
+        never answered cost only their first K probes. Duration is whichever
+        bound is slower: the rate limit or the concurrency window.
+        """
+        ports = len(self.ports)
+        first_k = getattr(self.liveness, 'first_k', 0) if self.liveness else 0
+        expected = 0.0
+        slot_seconds = 0.0
+        expected_open = 0.0
+        rtt_sum = answer_sum = 0.0
+        learned = 0
+        for address, _ in self.hosts:
+            known = profile.lookup(address) if profile is not None else None
+            if known is None:
+                rtt, answer_ratio, open_ratio = DEFAULT_RTT, DEFAULT_ANSWER_RATIO, 0.0
+            else:
+                rtt, answer_ratio, open_ratio = known
+                learned += 1
+            probes = ports
+            if first_k and known is not None and answer_ratio == 0:
+                probes = min(first_k, ports)
+            unanswered = probes * (1 - answer_ratio)
+            attempts = probes + unanswered * self.retries
+            expected += attempts
+            slot_seconds += probes * answer_ratio * rtt + unanswered * (1 + self.retries) * self.timeout
+            expected_open += probes * open_ratio
+            rtt_sum += rtt
+            answer_sum += answer_ratio
+        hosts = len(self.hosts) or 1
+        by_concurrency = slot_seconds / max(1, self.concurrency)
+        by_rate = expected / self.rate if self.rate else 0.0
+        duration = max(by_rate, by_concurrency) + (self.timeout if self.hosts else 0.0)
+        bound = 'rate' if by_rate > by_concurrency else 'concurrency'
+        memory = (BASE_BYTES + len(self.hosts) * HOST_BYTES + min(self.concurrency, self.probes) * SLOT_BYTES
+                  + int(expected_open) * OPEN_BYTES)
+        return Estimate(self.probes, int(round(expected)), duration, bound, rtt_sum / hosts,
+                        answer_sum / hosts, learned, int(round(expected_open)), memory)
+
+
+def compile_plan(target, ports, exclusions=None, family=socket.AF_UNSPEC, concurrency=100, timeout=1.0,
+                 rate=None, retries=0, liveness=None, scan_type='connect', strict=None):
+    """Resolve and filter a scan into a ScanPlan
+
+    Unresolvable targets are recorded in the plan; with strict (the default
+    for a single target) the resolution error is raised instead.
+    """
+    if scan_type not in SCAN_TYPES:
+        raise ValueError(f"Unsupported scan type: {scan_type}")
+    targets = expand_targets(target)
+    if strict is None:
+        strict = len(targets) == 1
+    hosts = []
+    unresolved = []
+    excluded = []
+    seen = set()
+    for name in targets:
+        try:
+            host_family, address = resolve_target(name, family)
+        except OSError as e:
+            if strict:
+                raise
+            unresolved.append((name, str(e)))
+            continue
+        if exclusions and exclusions.excludes_host(address):
+            excluded.append(address)
+            continue
+        if address not in seen:
+            seen.add(address)
+            hosts.append((address, host_family))
+    ports = tuple(exclusions.filter_ports(ports) if exclusions else ports)
+    return ScanPlan(target, tuple(hosts), ports, tuple(unresolved), tuple(excluded), scan_type,
+                    concurrency, timeout, rate, retries, liveness, (0, 1))
+
+
+def parse_shard(value):
+    """'2/4' -> (1, 4): the 1-based shard index on the command line becomes 0-based"""
+    try:
+        index, count = (int(part) for part in value.split('/'))
+    except ValueError:
+        raise ValueError(f"Shard must look like 2/4, not {value}")
+    if count < 1 or not 1 <= index <= count:
+        raise ValueError(f"Shard {value} is out of range")
+    return index - 1, count
+
+
+def format_estimate(plan, estimate):
+    """Multi-line dry-run report"""
+    shard = f" (shard {plan.shard[0] + 1}/{plan.shard[1]})" if plan.shard != (0, 1) else ''
+    lines = [f"Plan {plan.fingerprint()}{shard}: {len(plan.hosts):,} hosts x {len(plan.ports):,} ports "
+             f"= {estimate.probes:,} probes"]
+    if plan.excluded or plan.unresolved:
+        lines.append(f"Excluded hosts: {len(plan.excluded)}, unresolved targets: {len(plan.unresolved)}")
+    if estimate.learned_hosts:
+        lines.append(f"Learned from past scans for {estimate.learned_hosts:,} of {len(plan.hosts):,} hosts: "
+                     f"RTT {estimate.rtt * 1000:.0f} ms, {estimate.answer_ratio:.0%} of probes answered")
+    else:
+        lines.append(f"No scan history for these networks: assuming RTT {DEFAULT_RTT * 1000:.0f} ms "
+                     f"and {DEFAULT_ANSWER_RATIO:.0%} of probes answered")
+    rate = f"rate {plan.rate:g}/s" if plan.rate else "no rate limit"
+    lines.append(f"Expected probes with {plan.retries} retries: {estimate.expected_probes:,}")
+    lines.append(f"Estimated duration: {format_duration(estimate.duration)} "
+                 f"(bound by {estimate.bound}; {plan.concurrency} in flight, {rate}, timeout {plan.timeout:g}s)")
+    lines.append(f"Estimated memory: {estimate.memory / 1048576:.1f} MiB"
+                 + (f", about {estimate.expected_open:,} open ports" if estimate.expected_open else ''))
+    return '\n'.join(lines)
+
+
+class Checkpoint:
+    """Finished hosts of a plan, appended as they complete so an interrupted scan can resume
+
+    The first line records the plan fingerprint; resuming against a
+    different plan is refused rather than silently skipping hosts.
+    """
+
+    def __init__(self, path, plan):
+        self.path = path
+        self.fingerprint = plan.fingerprint()
+        self.done = {}
+        self.file = None
+
+    def load(self):
+        """Hosts already finished: {address: [open ports]}"""
+        if not os.path.exists(self.path):
+            return self.done
+        with open(self.path, 'r') as f:
+            lines = f.read().splitlines()
+        if lines:
+            header = json.loads(lines[0])
+            if header.get('plan') != self.fingerprint:
+                raise ValueError(f"{self.path} belongs to a different scan plan ({header.get('plan')})")
+        for line in lines[1:]:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                # A line cut short by the interruption
+                continue
+            self.done[entry['host']] = entry['open']
+        return self.done
+
+    def host_done(self, address, open_ports):
+        if self.file is None:
+            fresh = not os.path.exists(self.path) or not os.path.getsize(self.path)
+            self.file = open(self.path, 'a')
+            if fresh:
+                self.file.write(json.dumps({'plan': self.fingerprint}) + '\n')
+        self.file.write(json.dumps({'host': address, 'open': sorted(open_ports)}) + '\n')
+        self.file.flush()
+        self.done[address] = sorted(open_ports)
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
@@ -0,0 +1,453 @@
+#!/usr/bin/env python3
+"""
+Simulated Network
+Deterministic in-memory network on a virtual clock for exercising the scan engine and topology mapper
+"""
+
+import argparse
+import errno
+import heapq
+import ipaddress
+import math
+import random
+import time
+
+from scan_engine import ProbeScheduler, OPEN, CLOSED, TIMEOUT, ERROR
+from topology import HOP, REACHED, TopologyMapper, TraceTransport
+from transport import Transport
+
+MASK64 = (1 << 64) - 1
+
+# Chance that a port is open on a live host; everything else is closed
+DEFAULT_PORT_PROFILE = {
+    21: 0.05, 22: 0.40, 23: 0.03, 25: 0.08, 53: 0.10, 80: 0.50, 110: 0.03,
+    135: 0.10, 139: 0.10, 143: 0.03, 443: 0.45, 445: 0.12, 993: 0.03,
+    3306: 0.05, 3389: 0.08, 5432: 0.03, 8080: 0.10, 8443: 0.05
+}
+DEFAULT_OPEN_PROBABILITY = 0.001
+
+
+def _mix(value):
+    """splitmix64 finalizer: a fast, well-distributed 64-bit hash"""
+    value = (value + 0x9e3779b97f4a7c15) & MASK64
+    value = ((value ^ (value >> 30)) * 0xbf58476d1ce4e5b9) & MASK64
+    value = ((value ^ (value >> 27)) * 0x94d049bb133111eb) & MASK64
+    return value ^ (value >> 31)
+
+
+def _unit(*parts):
+    """Deterministic float in [0, 1) derived from integers"""
+    value = 0
+    for part in parts:
+        value = _mix(value ^ part)
+    return value / 2.0 ** 64
+
+
+class LatencyModel:
+    """Round-trip times: a lognormal per-host base plus per-probe jitter"""
+
+    def __init__(self, median=0.020, sigma=0.8, jitter=0.1, minimum=0.0002):
+        self.median = median
+        self.sigma = sigma
+        self.jitter = jitter
+        self.minimum = minimum
+
+    def host_rtt(self, u1, u2):
+        """Base RTT for a host from two uniform values in [0, 1) (Box-Muller)"""
+        z = math.sqrt(-2.0 * math.log(max(u1, 1e-12))) * math.cos(2 * math.pi * u2)
+        return max(self.minimum, self.median * math.exp(self.sigma * z))
+
+    def sample(self, host_rtt, rng):
+        """RTT of a single probe"""
+        return max(self.minimum, host_rtt * (1.0 + self.jitter * (2 * rng.random() - 1)))
+
+
+class SimulatedNetwork(Transport):
+    """Millions of virtual hosts generated on demand from a seed
+
+    Liveness, open ports and base RTT of every address are pure functions of
+    (seed, address), so nothing is stored per host except the response rate
+    limiter buckets of recently probed hosts. Time only moves when the
+    scheduler waits, so a scan that would take hours runs in seconds.
+    """
+
+    def __init__(self, seed=0, host_density=0.05, port_profile=None,
+                 default_open_probability=DEFAULT_OPEN_PROBABILITY, filtered_probability=0.02,
+                 latency=None, loss=0.0, response_rate_limit=None, burst=10):
+        self.seed = seed
+        self.host_density = host_density
+        self.port_profile = DEFAULT_PORT_PROFILE if port_profile is None else port_profile
+        self.default_open_probability = default_open_probability
+        self.filtered_probability = filtered_probability
+        self.latency = latency or LatencyModel()
+        self.loss = loss
+        self.response_rate_limit = response_rate_limit
+        self.burst = burst
+        self.rng = random.Random(seed)
+        self.clock = 0.0
+        self.events = []
+        self.buckets = {}
+        self._next_token = 0
+        self.answering = set()
+        self.cancelled = set()
+        self.probes = 0
+        self.dropped = 0
+
+    # Ground truth
+
+    def _address(self, host):
+        return int(ipaddress.ip_address(host))
+
+    def is_alive(self, host):
+        """Whether a virtual host exists at this address"""
+        return _unit(self.seed, self._address(host), 1) < self.host_density
+
+    def expected_state(self, host, port):
+        """State a perfect scanner would report"""
+        address = self._address(host)
+        if _unit(self.seed, address, 1) >= self.host_density:
+            return TIMEOUT
+        roll = _unit(self.seed, address, port, 2)
+        if roll < self.port_profile.get(port, self.default_open_probability):
+            return OPEN
+        if _unit(self.seed, address, port, 3) < self.filtered_probability:
+            return TIMEOUT
+        return CLOSED
+
+    def host_rtt(self, host):
+        address = self._address(host)
+        return self.latency.host_rtt(_unit(self.seed, address, 4), _unit(self.seed, address, 5))
+
+    # Transport interface
+
+    def now(self):
+        return self.clock
+
+    def sleep(self, seconds):
+        if seconds > 0:
+            self._advance(self.clock + seconds)
+
+    def _advance(self, when):
+        self.clock = max(self.clock, when)
+
+    def _allow_response(self, address):
+        """Token bucket limiting how fast a host answers"""
+        if not self.response_rate_limit:
+            return True
+        tokens, updated = self.buckets.get(address, (self.burst, self.clock))
+        tokens = min(self.burst, tokens + (self.clock - updated) * self.response_rate_limit)
+        if tokens < 1:
+            self.buckets[address] = (tokens, self.clock)
+            return False
+        self.buckets[address] = (tokens - 1, self.clock)
+        if len(self.buckets) > 100000:
+            # Forget idle hosts; their buckets would be full again anyway
+            horizon = self.clock - self.burst / self.response_rate_limit
+            self.buckets = {a: b for a, b in self.buckets.items() if b[1] > horizon}
+        return True
+
+    def open(self, host, port, family=None):
+        self.probes += 1
+        self._next_token += 1
+        token = self._next_token
+        try:
+            address = self._address(host)
+        except ValueError:
+            return None, (ERROR, errno.EINVAL)
+
+        state = self.expected_state(host, port)
+        if state == TIMEOUT or self.rng.random() < self.loss or not self._allow_response(address):
+            # No answer ever arrives; the scheduler's timeout ends the probe
+            self.dropped += state != TIMEOUT
+            return token, None
+
+        rtt = self.latency.sample(self.host_rtt(host), self.rng)
+        error = 0 if state == OPEN else errno.ECONNREFUSED
+        heapq.heappush(self.events, (self.clock + rtt, token, state, error))
+        self.answering.add(token)
+        return token, None
+
+    def poll(self, timeout):
+        deadline = self.clock + timeout
+        completed = []
+        while self.events and self.events[0][0] <= deadline:
+            when, token, state, error = heapq.heappop(self.events)
+            self.answering.discard(token)
+            if token in self.cancelled:
+                self.cancelled.discard(token)
+                continue
+            self._advance(when)
+            completed.append((token, state, error))
+            # Deliver everything that arrives at the same instant together
+            if self.events and self.events[0][0] > when:
+                break
+        if not completed:
+            self._advance(deadline)
+        return completed
+
+    def cancel(self, token):
+        if token in self.answering:
+            self.cancelled.add(token)
+
+
+class SimulatedRoutes(TraceTransport):
+    """Routed paths to the simulated hosts, answering TTL-limited trace probes
+
+    Every destination sits behind two shared gateway hops, a transit hop
+    picked by its /8, a chain of one to four transit hops picked by its /16
+    and an edge router for its /24, all pure functions of the seed. Routers
+    answer with time exceeded unless silent and, like real routers, can
+    limit how many they send per second; live hosts answer probes that reach
+    them.
+    """
+
+    method = 'simulated'
+
+    def __init__(self, seed=0, host_density=0.05, latency=None, silent_probability=0.05, icmp_rate_limit=None,
+                 burst=10, loss=0.0):
+        self.hosts = SimulatedNetwork(seed=seed, host_density=host_density, latency=latency)
+        self.seed = seed
+        self.silent_probability = silent_probability
+        self.icmp_rate_limit = icmp_rate_limit
+        self.burst = burst
+        self.loss = loss
+        self.rng = random.Random(seed)
+        self.clock = 0.0
+        self.events = []
+        self.buckets = {}
+        self._next_token = 0
+        self.probes = 0
+        self.limited = 0
+
+    def _router(self, key, index):
+        return str(ipaddress.ip_address(0xAC100000 + (_mix((self.seed << 40) ^ (key << 4) ^ index) & 0xFFFFF)))
+
+    def route(self, host):
+        """Routers between the scanner and a host, nearest first"""
+        address = int(ipaddress.ip_address(host))
+        path = ['100.64.0.1', '100.64.0.2', self._router(address >> 24, 1)]
+        transit = 1 + int(_unit(self.seed, address >> 16, 6) * 4)
+        path.extend(self._router(address >> 16, 2 + index) for index in range(transit))
+        path.append(self._router(address >> 8, 15))
+        return path
+
+    def is_silent(self, router):
+        return _unit(self.seed, int(ipaddress.ip_address(router)), 7) < self.silent_probability
+
+    def now(self):
+        return self.clock
+
+    def sleep(self, seconds):
+        if seconds > 0:
+            self.clock += seconds
+
+    def _allow(self, router):
+        """Token bucket on the ICMP a router sends"""
+        if not self.icmp_rate_limit:
+            return True
+        tokens, updated = self.buckets.get(router, (self.burst, self.clock))
+        tokens = min(self.burst, tokens + (self.clock - updated) * self.icmp_rate_limit)
+        if tokens < 1:
+            self.buckets[router] = (tokens, self.clock)
+            self.limited += 1
+            return False
+        self.buckets[router] = (tokens - 1, self.clock)
+        return True
+
+    def send(self, destination, ttl):
+        self.probes += 1
+        self._next_token += 1
+        token = self._next_token
+        path = self.route(destination)
+        if ttl <= len(path):
+            responder, kind = path[ttl - 1], HOP
+            if self.is_silent(responder) or not self._allow(responder):
+                return token
+        elif self.hosts.is_alive(destination):
+            responder, kind = destination, REACHED
+        else:
+            return token
+        if self.rng.random() < self.loss:
+            return token
+        hops = min(ttl, len(path) + 1)
+        rtt = self.hosts.latency.sample(self.hosts.host_rtt(destination) * hops / (len(path) + 1), self.rng)
+        heapq.heappush(self.events, (self.clock + rtt, token, responder, kind, rtt))
+        return token
+
+    def poll(self, timeout):
+        deadline = self.clock + timeout
+        answers = []
+        while self.events and self.events[0][0] <= deadline:
+            when, token, responder, kind, rtt = heapq.heappop(self.events)
+            self.clock = max(self.clock, when)
+            answers.append((token, responder, kind, rtt))
+            if self.events and self.events[0][0] > when:
+                break
+        if not answers:
+            self.clock = max(self.clock, deadline)
+        return answers
+
+
+def simulate_topology(network, max_ttl=30, timeout=1.0, concurrency=1000, rate=None, retries=0, **route_options):
+    """Map the paths to a simulated network and check them against the true routes"""
+    sim = SimulatedRoutes(**route_options)
+    mapper = TopologyMapper(sim, max_ttl, timeout, retries, concurrency, rate)
+    hosts = [str(address) for address in ipaddress.ip_network(network, strict=False).hosts()]
+    wall_start = time.perf_counter()
+    topology = mapper.map(hosts)
+    correct = wrong = missing = 0
+    for path in topology.paths:
+        truth = sim.route(path.destination)
+        for hop in path.hops:
+            if hop.ttl > len(truth):
+                continue
+            if hop.address is None:
+                missing += not sim.is_silent(truth[hop.ttl - 1])
+            elif hop.address == truth[hop.ttl - 1]:
+                correct += 1
+            else:
+                wrong += 1
+    summary = topology.summary()
+    alive = sum(1 for host in hosts if sim.hosts.is_alive(host))
+    return {
+        'hosts': len(hosts),
+        'probes_sent': mapper.sent,
+        'probes_per_host': round(mapper.sent / len(hosts), 2) if hosts else None,
+        'virtual_duration_s': round(sim.now(), 3),
+        'wall_duration_s': round(time.perf_counter() - wall_start, 3),
+        'reached': summary['reached'],
+        'alive': alive,
+        'routers': summary['routers'],
+        'links': summary['edges'],
+        'hops_correct': correct,
+        'hops_wrong': wrong,
+        'hops_missing': missing,
+        'hops_from_known_paths': mapper.cached_hops,
+        'icmp_rate_limited': sim.limited,
+    }
+
+
+def simulate_scan(network, ports, concurrency=1000, timeout=1.0, rate=None, liveness=None, retries=0,
+                  **network_options):
+    """Scan a simulated network and return accuracy and timing statistics"""
+    sim = SimulatedNetwork(**network_options)
+    scheduler = ProbeScheduler(sim, concurrency=concurrency, timeout=timeout, rate=rate, retries=retries)
+    network = ipaddress.ip_network(network, strict=False)
+    skipped_open = []
+
+    def probes():
+        for address in network.hosts():
+            host = str(address)
+            for port in ports:
+                yield host, port
+
+    gate = None
+    source = probes()
+    if liveness:
+        from liveness import HostGate, order_ports
+        ordered = order_ports(ports)
+
+        def count_skipped(host, count):
+            # Open ports on hosts wrongly judged down count as missed
+            if sim.is_alive(host):
+                skipped_open.append(sum(sim.expected_state(host, port) == OPEN for port in ordered[-count:]))
+
+        gate = HostGate(liveness, on_skip=count_skipped)
+        source = gate.probes((str(address), None, ports) for address in network.hosts())
+
+    wall_start = time.perf_counter()
+    found = 0
+    missed = 0
+    false_positives = 0
+    total = 0
+    for result in scheduler.run(source):
+        total += 1
+        if gate is not None:
+            gate.observe(result.host, result.port, result.state)
+        expected = sim.expected_state(result.host, result.port)
+        if result.state == OPEN:
+            if expected == OPEN:
+                found += 1
+            else:
+                false_positives += 1
+        elif expected == OPEN:
+            missed += 1
+
+    missed += sum(skipped_open)
+    stats = {
+        'probes': total,
+        'probes_sent': scheduler.sent,
+        'virtual_duration_s': round(sim.now(), 3),
+        'wall_duration_s': round(time.perf_counter() - wall_start, 3),
+        'virtual_probes_per_s': round(total / sim.now(), 1) if sim.now() else None,
+        'open_found': found,
+        'open_missed': missed,
+        'false_positives': false_positives,
+        'recall': round(found / (found + missed), 4) if found + missed else None
+    }
+    if retries:
+        stats['retransmits'] = scheduler.retransmits
+        stats['recovered'] = scheduler.recovered
+        stats['measured_loss'] = round(scheduler.loss, 4)
+    if gate is not None:
+        stats['hosts_down'] = len(gate.down_hosts())
+        stats['probes_skipped'] = gate.skipped
+    return stats
+
+
+def main():
+    from port_scanner import parse_ports
+    from liveness import LivenessPolicy
+
+    parser = argparse.ArgumentParser(description='Run the scan engine against a simulated network')
+    parser.add_argument('network', help='Simulated network (e.g., 10.0.0.0/16)')
+    parser.add_argument('-p', '--ports', default='22,80,443',
+                       help='Ports to scan (default: 22,80,443)')
+    parser.add_argument('-c', '--concurrency', type=int, default=1000,
+                       help='Probes in flight (default: 1000)')
+    parser.add_argument('--timeout', type=float, default=1.0,
+                       help='Probe timeout in virtual seconds (default: 1.0)')
+    parser.add_argument('--rate', type=float,
+                       help='Probe rate limit per virtual second')
+    parser.add_argument('--density', type=float, default=0.05,
+                       help='Fraction of addresses with a live host (default: 0.05)')
+    parser.add_argument('--loss', type=float, default=0.0,
+                       help='Probability that a probe or its answer is lost (default: 0)')
+    parser.add_argument('--median-rtt', type=float, default=0.020,
+                       help='Median round-trip time in seconds (default: 0.020)')
+    parser.add_argument('--response-rate', type=float,
+                       help='Per-host answer rate limit per second')
+    parser.add_argument('--seed', type=int, default=0,
+                       help='Seed for the virtual network (default: 0)')
+    parser.add_argument('--retries', type=int, default=0,
+                       help='Retransmissions of timed-out probes (default: 0)')
+    parser.add_argument('--skip-dead', type=int, metavar='K',
+                       help='Skip hosts whose first K most common ports do not answer')
+    parser.add_argument('--trace', action='store_true',
+                       help='Map the paths to the network instead of scanning it')
+    parser.add_argument('--silent', type=float, default=0.05,
+                       help='With --trace: fraction of routers that never answer (default: 0.05)')
+    parser.add_argument('--icmp-rate', type=float,
+                       help='With --trace: ICMP answers per second each router sends')
+
+    args = parser.parse_args()
+    if args.trace:
+        stats = simulate_topology(args.network, timeout=args.timeout, concurrency=args.concurrency,
+                                  rate=args.rate, retries=args.retries, seed=args.seed, host_density=args.density,
+                                  latency=LatencyModel(median=args.median_rtt), loss=args.loss,
+                                  silent_probability=args.silent, icmp_rate_limit=args.icmp_rate)
+        for key, value in stats.items():
+            print(f"{key:<22}{value}")
+        return
+    stats = simulate_scan(args.network, parse_ports(args.ports), args.concurrency, args.timeout,
+                          args.rate, seed=args.seed, host_density=args.density, loss=args.loss,
+                          latency=LatencyModel(median=args.median_rtt),
+                          response_rate_limit=args.response_rate,
+                          liveness=LivenessPolicy(args.skip_dead) if args.skip_dead else None,
+                          retries=args.retries)
+    for key, value in stats.items():
+        print(f"{key:<22}{value}")
+
+
+if __name__ == "__main__":
+    main()
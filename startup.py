@@ -0,0 +1,46 @@
+#!/usr/bin/env python3
+"""
+Startup Timing
+Milestones from the first import of an entry point to first paint
+"""
+
+import sys
+import time
+
+
+class StartupTimer:
+    """Records named milestones relative to when the entry point began importing"""
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.marks = []
+
+    def mark(self, name):
+        """Record a milestone now and return its offset in ms"""
+        now = time.perf_counter()
+        self.marks.append((name, now))
+        return (now - self.start) * 1000
+
+    def elapsed(self, name):
+        """Offset of a recorded milestone in ms, or None"""
+        for mark, when in self.marks:
+            if mark == name:
+                return (when - self.start) * 1000
+        return None
+
+    def report(self):
+        """Milestones with their offset and the time since the previous one"""
+        lines = [f"{'Milestone':<24}{'At ms':>10}{'Step ms':>10}"]
+        previous = self.start
+        for name, when in self.marks:
+            lines.append(f"{name:<24}{(when - self.start) * 1000:>10.1f}{(when - previous) * 1000:>10.1f}")
+            previous = when
+        lines.append("Per-module import costs: python -X importtime <entry point>")
+        return '\n'.join(lines)
+
+    def print_report(self, stream=None):
+        print(self.report(), file=stream or sys.stderr, flush=True)
+
+
+# Entry points import this module first so the clock starts before their other imports
+STARTUP = StartupTimer()
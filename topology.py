@@ -0,0 +1,860 @@
+#!/usr/bin/env python3
+"""
+Topology Mapping
+Parallel traceroute to many hosts with shared hops cached, per-host paths and a merged path graph
+"""
+
+import argparse
+import errno
+import json
+import os
+import select
+import socket
+import struct
+import sys
+import time
+from collections import deque, namedtuple
+
+from scan_plan import network_prefix
+
+CACHE_FILE = 'topology_cache.json'
+MAX_TTL = 30
+
+# UDP probes go to BASE_PORT and up; each destination cycles through PORT_SPAN ports so
+# the port in the quoted header tells which probe an ICMP error answers
+BASE_PORT = 33434
+PORT_SPAN = 1024
+PAYLOAD = b'DuckScanner trace'
+
+# Hosts sharing a prefix with an already traced host only probe this many TTLs below and
+# above its distance; the hops below come from the known path
+WINDOW_BELOW = 1
+WINDOW_ABOVE = 1
+
+# A leader that has answered and then gone quiet for this many of its slowest RTTs (and at
+# least QUIET_MIN seconds) releases the rest of its prefix before its silent hops time out
+QUIET_RTTS = 3
+QUIET_MIN = 0.05
+
+# Cached paths older than this are traced again from scratch
+CACHE_MAX_AGE = 24 * 3600
+
+# What an answer says about a probe
+HOP = 'hop'
+REACHED = 'reached'
+UNREACHABLE = 'unreachable'
+
+# Linux error queue (IP_RECVERR), for unprivileged probes
+SOL_IP = 0
+SOL_IPV6 = 41
+IP_RECVERR = getattr(socket, 'IP_RECVERR', 11)
+IPV6_RECVERR = getattr(socket, 'IPV6_RECVERR', 25)
+MSG_ERRQUEUE = getattr(socket, 'MSG_ERRQUEUE', 0x2000)
+SO_EE_ORIGIN_ICMP = 2
+SO_EE_ORIGIN_ICMP6 = 3
+EXTENDED_ERR = struct.Struct('=IBBBBII')    # errno, origin, type, code, pad, info, data
+
+# Errors an earlier probe's ICMP answer leaves on a UDP socket; the next send reports them
+# instead of sending
+_PENDING_ERRORS = (errno.ECONNREFUSED, errno.EHOSTUNREACH, errno.ENETUNREACH, errno.EPROTO,
+                   errno.EACCES, errno.EMSGSIZE)
+
+Hop = namedtuple('Hop', ['ttl', 'address', 'rtt', 'cached'])
+TracePath = namedtuple('TracePath', ['destination', 'status', 'hops', 'probes'])
+
+
+def _family(address):
+    return socket.AF_INET6 if ':' in address else socket.AF_INET
+
+
+class TraceTransport:
+    """Sends TTL-limited probes and reports who answered them
+
+    send() returns a token for the probe; poll() waits up to timeout
+    seconds and returns (token, responder, kind, rtt) tuples, kind being
+    HOP (a router's time exceeded), REACHED (the destination itself) or
+    UNREACHABLE. cancel() forgets a probe that timed out.
+    """
+
+    method = None
+
+    def now(self):
+        return time.monotonic()
+
+    def sleep(self, seconds):
+        if seconds > 0:
+            time.sleep(seconds)
+
+    def send(self, destination, ttl):
+        raise NotImplementedError
+
+    def poll(self, timeout):
+        raise NotImplementedError
+
+    def cancel(self, token):
+        """Forget an unanswered probe"""
+
+    def close(self):
+        """Release any resources held by the transport"""
+
+
+class UDPTraceTransport(TraceTransport):
+    """Unprivileged UDP probes; the ICMP errors they draw are read from the socket error queue
+
+    Needs Linux IP_RECVERR: the kernel queues each ICMP error with the
+    router that sent it and the header of the probe it answers, so no raw
+    socket is needed. One socket per address family carries every probe.
+    """
+
+    method = 'udp'
+
+    def __init__(self):
+        if not sys.platform.startswith('linux'):
+            raise OSError(errno.EOPNOTSUPP, "Unprivileged tracing needs Linux IP_RECVERR; run as root for ICMP")
+        self.sockets = {}
+        self.pending = {}
+        self.keys = {}
+        self.sequence = {}
+        self._next_token = 0
+
+    def _socket(self, family):
+        sock = self.sockets.get(family)
+        if sock is None:
+            sock = socket.socket(family, socket.SOCK_DGRAM)
+            if family == socket.AF_INET6:
+                sock.setsockopt(SOL_IPV6, IPV6_RECVERR, 1)
+            else:
+                sock.setsockopt(SOL_IP, IP_RECVERR, 1)
+            sock.setblocking(False)
+            self.sockets[family] = sock
+        return sock
+
+    def send(self, destination, ttl):
+        family = _family(destination)
+        sock = self._socket(family)
+        offset = (self.sequence.get(destination, -1) + 1) % PORT_SPAN
+        self.sequence[destination] = offset
+        key = (destination, BASE_PORT + offset)
+        if family == socket.AF_INET6:
+            sock.setsockopt(socket.IPPROTO_IPV6, socket.IPV6_UNICAST_HOPS, ttl)
+        else:
+            sock.setsockopt(socket.IPPROTO_IP, socket.IP_TTL, ttl)
+        for _ in range(3):
+            try:
+                sock.sendto(PAYLOAD, key)
+                break
+            except BlockingIOError:
+                select.select([], [sock], [], 0.01)
+            except OSError as e:
+                if e.errno not in _PENDING_ERRORS:
+                    raise
+        self._next_token += 1
+        token = self._next_token
+        stale = self.pending.pop(key, None)
+        if stale is not None:
+            self.keys.pop(stale[0], None)
+        self.pending[key] = (token, self.now())
+        self.keys[token] = key
+        return token
+
+    def poll(self, timeout):
+        sockets = list(self.sockets.values())
+        if not sockets:
+            self.sleep(timeout)
+            return []
+        # A queued error makes the socket readable
+        readable, _, _ = select.select(sockets, [], [], max(0.0, timeout))
+        answers = []
+        for sock in readable:
+            self._drain_errors(sock, answers)
+            self._drain_data(sock, answers)
+        return answers
+
+    def _drain_errors(self, sock, answers):
+        while True:
+            try:
+                _, ancdata, _, address = sock.recvmsg(512, 512, MSG_ERRQUEUE)
+            except (BlockingIOError, InterruptedError):
+                return
+            for level, kind, data in ancdata:
+                answer = parse_extended_error(level, kind, data)
+                if answer is not None:
+                    self._answer(address, answer[0], answer[1], answers)
+
+    def _drain_data(self, sock, answers):
+        # Something actually listens on the probe port: the destination answered
+        for _ in range(64):
+            try:
+                _, address = sock.recvfrom(512)
+            except (BlockingIOError, InterruptedError):
+                return
+            except OSError:
+                # The socket's pending ICMP error, already read from the queue
+                continue
+            self._answer(address, address[0], REACHED, answers)
+
+    def _answer(self, address, responder, kind, answers):
+        entry = self.pending.pop((address[0], address[1]), None)
+        if entry is not None:
+            token, sent = entry
+            del self.keys[token]
+            answers.append((token, responder, kind, self.now() - sent))
+
+    def cancel(self, token):
+        key = self.keys.pop(token, None)
+        if key is not None:
+            self.pending.pop(key, None)
+
+    def close(self):
+        for sock in self.sockets.values():
+            sock.close()
+        self.sockets = {}
+
+
+def parse_extended_error(level, kind, data):
+    """(responder, kind) from an IP_RECVERR control message, or None for local errors"""
+    if (level, kind) not in ((SOL_IP, IP_RECVERR), (SOL_IPV6, IPV6_RECVERR)) or len(data) < EXTENDED_ERR.size:
+        return None
+    _, origin, icmp_type, code, _, _, _ = EXTENDED_ERR.unpack_from(data)
+    offender = data[EXTENDED_ERR.size:]
+    if origin == SO_EE_ORIGIN_ICMP and len(offender) >= 8:
+        responder = socket.inet_ntop(socket.AF_INET, offender[4:8])
+        if icmp_type == 11:
+            return responder, HOP
+        return responder, REACHED if (icmp_type, code) == (3, 3) else UNREACHABLE
+    if origin == SO_EE_ORIGIN_ICMP6 and len(offender) >= 24:
+        responder = socket.inet_ntop(socket.AF_INET6, offender[8:24])
+        if icmp_type == 3:
+            return responder, HOP
+        return responder, REACHED if (icmp_type, code) == (1, 4) else UNREACHABLE
+    return None
+
+
+def icmp_checksum(data):
+    if len(data) % 2:
+        data += b'\x00'
+    total = sum(struct.unpack(f'!{len(data) // 2}H', data))
+    total = (total >> 16) + (total & 0xffff)
+    total += total >> 16
+    return ~total & 0xffff
+
+
+def echo_request(ident, sequence):
+    header = struct.pack('!BBHHH', 8, 0, 0, ident, sequence)
+    return struct.pack('!BBHHH', 8, 0, icmp_checksum(header + PAYLOAD), ident, sequence) + PAYLOAD
+
+
+def parse_icmp(packet, ident):
+    """(sequence, kind) when an IPv4 packet answers one of our echo probes, else None"""
+    if len(packet) < 20:
+        return None
+    header = (packet[0] & 0x0f) * 4
+    if len(packet) < header + 8:
+        return None
+    icmp_type = packet[header]
+    if icmp_type == 0:
+        echo_id, sequence = struct.unpack_from('!HH', packet, header + 4)
+        return (sequence, REACHED) if echo_id == ident else None
+    if icmp_type not in (3, 11):
+        return None
+    # Time exceeded and unreachable quote the probe's IP header and first 8 bytes
+    inner = header + 8
+    if len(packet) < inner + 20:
+        return None
+    quoted = inner + (packet[inner] & 0x0f) * 4
+    if len(packet) < quoted + 8 or packet[quoted] != 8:
+        return None
+    echo_id, sequence = struct.unpack_from('!HH', packet, quoted + 4)
+    if echo_id != ident:
+        return None
+    return sequence, HOP if icmp_type == 11 else UNREACHABLE
+
+
+class ICMPTraceTransport(TraceTransport):
+    """ICMP echo probes on a raw socket (root or CAP_NET_RAW); IPv4 only
+
+    The echo sequence number identifies the probe, both in echo replies and
+    in the request quoted by a router's time exceeded.
+    """
+
+    method = 'icmp'
+
+    def __init__(self):
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_RAW, socket.IPPROTO_ICMP)
+        self.sock.setblocking(False)
+        self.ident = os.getpid() & 0xffff
+        self.pending = {}
+        self._next_token = 0
+
+    def send(self, destination, ttl):
+        if _family(destination) != socket.AF_INET:
+            raise ValueError("ICMP tracing covers IPv4 only; use the UDP method for IPv6")
+        self._next_token += 1
+        token = self._next_token
+        sequence = token & 0xffff
+        self.sock.setsockopt(socket.IPPROTO_IP, socket.IP_TTL, ttl)
+        for _ in range(3):
+            try:
+                self.sock.sendto(echo_request(self.ident, sequence), (destination, 0))
+                break
+            except BlockingIOError:
+                select.select([], [self.sock], [], 0.01)
+            except OSError as e:
+                if e.errno not in _PENDING_ERRORS:
+                    raise
+                break
+        self.pending[sequence] = (token, self.now())
+        return token
+
+    def poll(self, timeout):
+        readable, _, _ = select.select([self.sock], [], [], max(0.0, timeout))
+        answers = []
+        while readable:
+            try:
+                packet, address = self.sock.recvfrom(1500)
+            except (BlockingIOError, InterruptedError):
+                break
+            answer = parse_icmp(packet, self.ident)
+            if answer is None:
+                continue
+            entry = self.pending.pop(answer[0], None)
+            if entry is not None:
+                token, sent = entry
+                answers.append((token, address[0], answer[1], self.now() - sent))
+        return answers
+
+    def cancel(self, token):
+        entry = self.pending.get(token & 0xffff)
+        if entry is not None and entry[0] == token:
+            del self.pending[token & 0xffff]
+
+    def close(self):
+        self.sock.close()
+
+
+def open_trace_transport(method='auto', ipv6=False):
+    """Raw ICMP when privileged (IPv4 only), else unprivileged UDP with IP_RECVERR"""
+    if method not in ('auto', 'icmp', 'udp'):
+        raise ValueError(f"Unknown trace method: {method}")
+    if method == 'icmp' and ipv6:
+        raise ValueError("ICMP tracing covers IPv4 only; use the UDP method for IPv6")
+    if method in ('auto', 'icmp') and not ipv6:
+        try:
+            return ICMPTraceTransport()
+        except PermissionError:
+            if method == 'icmp':
+                raise
+    return UDPTraceTransport()
+
+
+class HopCache:
+    """Known paths per destination prefix, kept between runs
+
+    Each /24 (or /64) maps to the hops last seen on the way to it and the
+    distance of its hosts, so a later map of the same networks probes only
+    a few TTLs per host.
+    """
+
+    def __init__(self, path=CACHE_FILE, max_age=CACHE_MAX_AGE):
+        self.path = path
+        self.max_age = max_age
+        self.prefixes = {}
+
+    def load(self):
+        try:
+            with open(self.path, 'r') as f:
+                self.prefixes = json.load(f)
+        except (OSError, ValueError):
+            self.prefixes = {}
+        return self
+
+    def save(self):
+        if not self.path or not self.prefixes:
+            return
+        tmp = f"{self.path}.tmp"
+        with open(tmp, 'w') as f:
+            json.dump(self.prefixes, f)
+        os.replace(tmp, self.path)
+
+    def lookup(self, prefix):
+        """(hops by TTL, distance) for a prefix, or None when unknown or stale"""
+        entry = self.prefixes.get(prefix)
+        if not entry or time.time() - entry.get('updated', 0) > self.max_age:
+            return None
+        return {int(ttl): address for ttl, address in entry['hops'].items()}, entry['distance']
+
+    def store(self, prefix, hops, distance):
+        self.prefixes[prefix] = {'hops': {str(ttl): address for ttl, address in hops.items()},
+                                 'distance': distance, 'updated': int(time.time())}
+
+
+class _Trace:
+    """One destination's probing state"""
+
+    __slots__ = ('destination', 'prefix', 'answers', 'distance', 'blocked', 'attempts', 'outstanding',
+                 'low', 'high', 'base', 'extended', 'settled', 'probes', 'last_answer', 'slowest')
+
+    def __init__(self, destination, prefix):
+        self.destination = destination
+        self.prefix = prefix
+        # ttl -> (responder, kind, rtt)
+        self.answers = {}
+        self.distance = None
+        self.blocked = None
+        self.attempts = {}
+        self.outstanding = 0
+        self.low = self.high = None
+        # Known hops below the window: a dict, or the leader _Trace they come from
+        self.base = None
+        self.extended = False
+        self.settled = False
+        self.probes = 0
+        self.last_answer = None
+        self.slowest = 0.0
+
+    def base_hops(self):
+        base = self.base
+        if isinstance(base, _Trace):
+            return {ttl: answer[0] for ttl, answer in base.answers.items() if answer[1] == HOP}
+        return base or {}
+
+    def top(self):
+        """Highest TTL the path needs: the destination's distance, else the last hop heard or known"""
+        if self.distance is not None:
+            return self.distance
+        if self.blocked is not None:
+            return self.blocked
+        return max(max(self.answers, default=0), max(self.base_hops(), default=0))
+
+
+class TopologyMapper:
+    """Traces many destinations at once, probing every TTL in parallel
+
+    Destinations are grouped by prefix (/24 or /64). Without a cached path,
+    one leader per prefix gets all TTLs 1..max_ttl at once; the others wait
+    until the leader reaches its destination or goes quiet, then probe only
+    WINDOW_BELOW/WINDOW_ABOVE TTLs around its distance and take the hops
+    below from it. With a cached path every host starts with the window.
+    A window that disagrees with the known hops, or that ends short of the
+    destination, is widened. Silent hops cost one timeout, all of them
+    together; retries re-send only holes below the path's end.
+    """
+
+    def __init__(self, transport, max_ttl=MAX_TTL, timeout=1.0, retries=0, concurrency=1000, rate=None,
+                 cache=None, lease=None):
+        self.transport = transport
+        self.max_ttl = max_ttl
+        self.timeout = timeout
+        self.retries = retries
+        self.concurrency = max(1, concurrency)
+        self.rate = rate
+        self.cache = cache
+        self.lease = lease
+        self.sent = 0
+        self.answered = 0
+        self.cached_hops = 0
+
+    def map(self, destinations):
+        """Trace every destination; returns a Topology"""
+        traces = {}
+        groups = {}
+        for destination in destinations:
+            if destination in traces:
+                continue
+            trace = traces[destination] = _Trace(destination, network_prefix(destination))
+            groups.setdefault(trace.prefix, []).append(trace)
+
+        self.queue = deque()
+        self.followers = {}
+        for prefix, members in groups.items():
+            known = self.cache.lookup(prefix) if self.cache is not None else None
+            if known is not None:
+                for trace in members:
+                    self._open_window(trace, known[0], known[1])
+            else:
+                leader = members[0]
+                self._enqueue(leader, range(1, self.max_ttl + 1))
+                if len(members) > 1:
+                    self.followers[leader] = members[1:]
+
+        self._run()
+        if self.cache is not None:
+            self._remember(groups)
+        return Topology([self._path(trace) for trace in traces.values()])
+
+    def _enqueue(self, trace, ttls):
+        for ttl in ttls:
+            self.queue.append((trace, ttl))
+            trace.outstanding += 1
+
+    def _open_window(self, trace, base, distance):
+        trace.base = base
+        trace.low = max(1, distance - WINDOW_BELOW)
+        trace.high = min(self.max_ttl, distance + WINDOW_ABOVE)
+        self._enqueue(trace, range(trace.low, trace.high + 1))
+
+    def _release(self, leader):
+        """Start the leader's prefix mates once its path is known well enough"""
+        members = self.followers.pop(leader, None)
+        if not members:
+            return
+        if not leader.answers:
+            # Nothing came back at all: trace each host in full
+            for trace in members:
+                self._enqueue(trace, range(1, self.max_ttl + 1))
+            return
+        distance = leader.distance or leader.blocked or max(leader.answers) + 1
+        for trace in members:
+            self._open_window(trace, leader, distance)
+
+    def _run(self):
+        transport = self.transport
+        lease = self.lease
+        inflight = {}
+        deadlines = deque()
+        next_send = transport.now()
+        try:
+            while self.queue or inflight:
+                if lease is not None and lease.cancelled:
+                    return
+                now = transport.now()
+                while deadlines and deadlines[0][0] <= now:
+                    _, token = deadlines.popleft()
+                    entry = inflight.pop(token, None)
+                    if entry is None:
+                        continue
+                    transport.cancel(token)
+                    if lease is not None:
+                        lease.release()
+                    self._finished(entry[0])
+                quiet = self._quiet_leaders(now)
+
+                held = 0
+                while self.queue and len(inflight) < self.concurrency:
+                    if self.rate and now < next_send:
+                        break
+                    if lease is not None:
+                        held = lease.acquire()
+                        if held:
+                            break
+                    trace, ttl = self.queue.popleft()
+                    token = transport.send(trace.destination, ttl)
+                    inflight[token] = (trace, ttl)
+                    deadlines.append((now + self.timeout, token))
+                    trace.attempts[ttl] = trace.attempts.get(ttl, 0) + 1
+                    trace.probes += 1
+                    self.sent += 1
+                    if self.rate:
+                        next_send = max(next_send, now) + 1.0 / self.rate
+                        now = transport.now()
+
+                waits = [deadlines[0][0] - now] if deadlines else []
+                if self.queue and self.rate and len(inflight) < self.concurrency:
+                    waits.append(next_send - now)
+                if held:
+                    waits.append(held)
+                if quiet is not None:
+                    waits.append(quiet)
+                if not waits:
+                    continue
+                for token, responder, kind, rtt in transport.poll(max(0.0, min(waits))):
+                    entry = inflight.pop(token, None)
+                    if entry is None:
+                        continue
+                    if lease is not None:
+                        lease.release()
+                    self._answered(entry[0], entry[1], responder, kind, rtt)
+                    self._finished(entry[0])
+        finally:
+            if lease is not None:
+                lease.release(len(inflight))
+            for token in inflight:
+                transport.cancel(token)
+
+    def _quiet_leaders(self, now):
+        """Release leaders that answered and then went quiet; seconds until the next check, or None"""
+        soonest = None
+        for leader in list(self.followers):
+            if leader.last_answer is None:
+                continue
+            release_at = leader.last_answer + max(QUIET_MIN, QUIET_RTTS * leader.slowest)
+            if release_at <= now:
+                self._release(leader)
+            elif soonest is None or release_at - now < soonest:
+                soonest = release_at - now
+        return soonest
+
+    def _answered(self, trace, ttl, responder, kind, rtt):
+        self.answered += 1
+        trace.last_answer = self.transport.now()
+        trace.slowest = max(trace.slowest, rtt)
+        if ttl not in trace.answers or kind != HOP:
+            trace.answers[ttl] = (responder, kind, rtt)
+        if kind == REACHED:
+            if trace.distance is None or ttl < trace.distance:
+                trace.distance = ttl
+            # Answers from every TTL past the destination race each other; the distance is
+            # certain once each lower TTL has answered, else the quiet rule releases the prefix
+            if all(lower in trace.answers for lower in range(1, trace.distance)):
+                self._release(trace)
+        elif kind == UNREACHABLE:
+            if trace.blocked is None or ttl < trace.blocked:
+                trace.blocked = ttl
+
+    def _finished(self, trace):
+        """One probe of trace answered or timed out"""
+        trace.outstanding -= 1
+        if trace.outstanding:
+            return
+        if trace.base is not None and not trace.extended:
+            base = trace.base_hops()
+            diverged = any(answer[1] == HOP and ttl in base and base[ttl] != answer[0]
+                           for ttl, answer in trace.answers.items())
+            short = trace.distance is not None and trace.distance <= trace.low
+            if (diverged or short) and trace.low > 1:
+                # Not the known path after all: trace below the window too
+                trace.extended = True
+                trace.base = None
+                self._enqueue(trace, range(1, trace.low))
+                return
+            if trace.distance is None and trace.blocked is None and trace.high in trace.answers \
+                    and trace.high < self.max_ttl:
+                # Still routers at the top of the window: the destination is further away
+                trace.extended = True
+                self._enqueue(trace, range(trace.high + 1, self.max_ttl + 1))
+                return
+        top = trace.top()
+        start = trace.low if trace.base is not None else 1
+        holes = [ttl for ttl in range(start, top) if ttl not in trace.answers
+                 and ttl in trace.attempts and trace.attempts[ttl] <= self.retries]
+        if holes:
+            self._enqueue(trace, holes)
+            return
+        trace.settled = True
+        self._release(trace)
+
+    def _remember(self, groups):
+        """Store each prefix's path from a trace that reached its destination"""
+        for prefix, members in groups.items():
+            for trace in members:
+                if trace.distance is None:
+                    continue
+                hops = {ttl: address for ttl, address in trace.base_hops().items() if ttl < trace.distance}
+                hops.update((ttl, answer[0]) for ttl, answer in trace.answers.items()
+                            if answer[1] == HOP and ttl < trace.distance)
+                self.cache.store(prefix, hops, trace.distance)
+                break
+
+    def _path(self, trace):
+        base = trace.base_hops() if trace.base is not None else {}
+        hops = []
+        for ttl in range(1, trace.top() + 1):
+            answer = trace.answers.get(ttl)
+            if answer is not None and (trace.distance is None or ttl <= trace.distance):
+                hops.append(Hop(ttl, answer[0], answer[2], False))
+            elif ttl in base:
+                # Below the window, or silent in it (often ICMP rate limiting) with nothing contradicting
+                self.cached_hops += 1
+                hops.append(Hop(ttl, base[ttl], None, True))
+            else:
+                hops.append(Hop(ttl, None, None, False))
+        if trace.distance is not None:
+            status = REACHED
+        elif trace.blocked is not None:
+            status = UNREACHABLE
+        else:
+            status = 'unreached'
+        return TracePath(trace.destination, status, tuple(hops), trace.probes)
+
+
+class Topology:
+    """Traced paths and the graph they merge into
+
+    Nodes are addresses; an edge joins consecutive answering hops of a
+    path, with gap counting the silent hops between them and paths the
+    destinations whose path uses it. The source is the node 'source'.
+    """
+
+    SOURCE = 'source'
+
+    def __init__(self, paths):
+        self.paths = sorted(paths, key=lambda path: _address_order(path.destination))
+
+    def graph(self):
+        """({address: {'kind', 'ttl', 'paths'}}, {(a, b): {'gap', 'paths'}})"""
+        nodes = {self.SOURCE: {'kind': 'source', 'ttl': 0, 'paths': len(self.paths)}}
+        edges = {}
+        for path in self.paths:
+            previous, previous_ttl = self.SOURCE, 0
+            for hop in path.hops:
+                if hop.address is None:
+                    continue
+                kind = 'destination' if hop.address == path.destination else 'router'
+                node = nodes.setdefault(hop.address, {'kind': kind, 'ttl': hop.ttl, 'paths': 0})
+                node['paths'] += 1
+                node['ttl'] = min(node['ttl'], hop.ttl)
+                edge = edges.setdefault((previous, hop.address), {'gap': hop.ttl - previous_ttl - 1, 'paths': 0})
+                edge['paths'] += 1
+                edge['gap'] = min(edge['gap'], hop.ttl - previous_ttl - 1)
+                previous, previous_ttl = hop.address, hop.ttl
+        return nodes, edges
+
+    def summary(self):
+        nodes, edges = self.graph()
+        reached = sum(1 for path in self.paths if path.status == REACHED)
+        return {'destinations': len(self.paths), 'reached': reached,
+                'routers': sum(1 for node in nodes.values() if node['kind'] == 'router'),
+                'edges': len(edges), 'probes': sum(path.probes for path in self.paths)}
+
+    def to_dict(self):
+        nodes, edges = self.graph()
+        return {
+            'paths': [{'destination': path.destination, 'status': path.status, 'probes': path.probes,
+                       'hops': [{'ttl': hop.ttl, 'address': hop.address,
+                                 'rtt_ms': round(hop.rtt * 1000, 2) if hop.rtt is not None else None,
+                                 'cached': hop.cached} for hop in path.hops]}
+                      for path in self.paths],
+            'nodes': [dict(address=address, **node) for address, node in nodes.items()],
+            'edges': [{'from': a, 'to': b, **edge} for (a, b), edge in edges.items()],
+        }
+
+
+def _address_order(address):
+    try:
+        return (0, socket.inet_pton(_family(address), address))
+    except OSError:
+        return (1, address.encode())
+
+
+def format_path(path):
+    """Traceroute-style lines for one path"""
+    lines = [f"{path.destination}: {path.status} ({path.probes} probes)"]
+    for hop in path.hops:
+        if hop.address is None:
+            lines.append(f"  {hop.ttl:>2}  *")
+            continue
+        detail = 'cached' if hop.cached else f"{hop.rtt * 1000:.1f} ms"
+        lines.append(f"  {hop.ttl:>2}  {hop.address:<39} {detail}")
+    return '\n'.join(lines)
+
+
+def _dot_id(value):
+    return '"' + str(value).replace('"', '\\"') + '"'
+
+
+def write_dot(topology, f):
+    """The merged graph for Graphviz; dashed edges skip silent hops"""
+    nodes, edges = topology.graph()
+    f.write('digraph topology {\n  rankdir=LR;\n  node [shape=box, fontsize=10];\n')
+    shapes = {'source': 'doublecircle', 'router': 'box', 'destination': 'ellipse'}
+    for address, node in nodes.items():
+        f.write(f"  {_dot_id(address)} [shape={shapes[node['kind']]}];\n")
+    for (a, b), edge in edges.items():
+        style = f', style=dashed, label="{edge["gap"]} silent"' if edge['gap'] else ''
+        f.write(f"  {_dot_id(a)} -> {_dot_id(b)} [penwidth={1 + min(edge['paths'], 50) / 10:.1f}{style}];\n")
+    f.write('}\n')
+
+
+def export_topology(topology, path):
+    """Write paths and graph as .json, the graph as .dot (Graphviz) or the paths as text"""
+    extension = os.path.splitext(path)[1].lower()
+    with open(path, 'w') as f:
+        if extension == '.json':
+            json.dump(topology.to_dict(), f, indent=2)
+        elif extension in ('.dot', '.gv'):
+            write_dot(topology, f)
+        else:
+            f.write('\n\n'.join(format_path(p) for p in topology.paths) + '\n')
+
+
+def alive_hosts(targets, workers=50, timeout=1):
+    """The targets that answer an ICMP echo"""
+    from concurrent.futures import ThreadPoolExecutor
+    from host_discovery import ping_host
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return [host for host, alive in executor.map(lambda host: ping_host(host, timeout), targets) if alive]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='port_scanner.py trace',
+                                     description='Map the paths to many hosts at once (parallel traceroute)')
+    parser.add_argument('targets', nargs='+',
+                       help='Hosts, ranges or CIDRs to trace (e.g. 192.168.1.0/24)')
+    parser.add_argument('--alive', action='store_true',
+                       help='Ping sweep the targets first and trace only hosts that answer')
+    parser.add_argument('-m', '--max-ttl', type=int, default=MAX_TTL,
+                       help=f'Longest path probed (default: {MAX_TTL})')
+    parser.add_argument('--timeout', type=float, default=1.0,
+                       help='Seconds to wait for each probe (default: 1.0)')
+    parser.add_argument('--retries', type=int, default=0,
+                       help='Resend probes for silent hops below the end of a path up to N times (default: 0)')
+    parser.add_argument('-c', '--concurrency', type=int, default=1000,
+                       help='Probes in flight (default: 1000)')
+    parser.add_argument('--rate', type=float,
+                       help='Probes per second (default: unlimited)')
+    parser.add_argument('--method', choices=('auto', 'icmp', 'udp'), default='auto',
+                       help='icmp needs root; udp uses Linux IP_RECVERR (default: icmp when permitted)')
+    parser.add_argument('--cache', default=CACHE_FILE,
+                       help=f'Known paths per network, reused between runs (default: {CACHE_FILE})')
+    parser.add_argument('--no-cache', action='store_true',
+                       help='Trace every network from scratch and leave the cache alone')
+    parser.add_argument('-o', '--output', action='append', default=[],
+                       help='Write paths and graph to .json, the graph to .dot or paths as text (repeatable)')
+    parser.add_argument('-q', '--quiet', action='store_true',
+                       help='Print only the summary')
+    parser.add_argument('--exclude',
+                       help='Addresses, CIDRs or ranges to skip')
+    parser.add_argument('--exclude-file',
+                       help='File with exclusion entries, one or more per line')
+    args = parser.parse_args(argv)
+
+    from exclusions import build_exclusions
+    from scan_engine import expand_targets, resolve_target
+    try:
+        exclusions = build_exclusions(args.exclude, args.exclude_file)
+        destinations = []
+        for target in args.targets:
+            for name in expand_targets(target):
+                _, address = resolve_target(name)
+                if not exclusions.excludes_host(address):
+                    destinations.append(address)
+        if args.alive:
+            print(f"Ping sweeping {len(destinations)} hosts...", file=sys.stderr)
+            destinations = alive_hosts(destinations)
+        transport = open_trace_transport(args.method, any(':' in address for address in destinations))
+    except (OSError, ValueError) as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+    if not destinations:
+        print("Nothing to trace")
+        return
+
+    cache = None if args.no_cache else HopCache(args.cache).load()
+    mapper = TopologyMapper(transport, args.max_ttl, args.timeout, args.retries, args.concurrency, args.rate,
+                            cache)
+    start = time.time()
+    try:
+        topology = mapper.map(destinations)
+    except KeyboardInterrupt:
+        print("\nTrace interrupted")
+        sys.exit(1)
+    finally:
+        transport.close()
+    duration = time.time() - start
+    if cache is not None:
+        cache.save()
+
+    if not args.quiet:
+        for path in topology.paths:
+            print(format_path(path))
+    summary = topology.summary()
+    print(f"Traced {summary['destinations']} hosts in {duration:.2f}s with {mapper.sent} {transport.method} "
+          f"probes ({mapper.cached_hops} hops from known paths): {summary['reached']} reached, "
+          f"{summary['routers']} routers, {summary['edges']} links")
+    for output in args.output:
+        export_topology(topology, output)
+        print(f"Topology written to {output}")
+
+
+if __name__ == "__main__":
+    main()
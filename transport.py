@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+"""
+Probe Transports
+Pluggable network layers used by the probe scheduler
+"""
+
+import errno
+import queue
+import selectors
+import socket
+import sys
+import time
+
+from scan_engine import ConnectProber, ResourceExhausted, classify, address_family, ERROR, EXHAUSTED
+
+
+class Transport:
+    """Interface between the scheduler and the network (real or simulated)
+
+    open() starts a probe and returns (token, None) while it is in flight,
+    or (None, (state, errno)) when the outcome is known immediately.
+    poll() waits up to timeout seconds and returns completed
+    (token, state, errno) tuples. cancel() abandons an in-flight probe.
+    """
+
+    def now(self):
+        """Current time on the transport's clock"""
+        return time.monotonic()
+
+    def sleep(self, seconds):
+        """Wait on the transport's clock"""
+        if seconds > 0:
+            time.sleep(seconds)
+
+    def open(self, host, port, family=None):
+        raise NotImplementedError
+
+    def poll(self, timeout):
+        raise NotImplementedError
+
+    def cancel(self, token):
+        raise NotImplementedError
+
+    def close(self):
+        """Release any resources held by the transport"""
+
+
+class SocketTransport(Transport):
+    """Non-blocking connect() probes multiplexed with a selector"""
+
+    def __init__(self, prober=None):
+        self.prober = prober or ConnectProber()
+        self.selector = selectors.DefaultSelector()
+
+    def open(self, host, port, family=None):
+        if family is None:
+            family = address_family(host) or socket.AF_INET
+        try:
+            sock = self.prober.create_socket(family)
+        except OSError as e:
+            return None, (classify(e.errno) if e.errno else ERROR, e.errno)
+
+        sock.setblocking(False)
+        try:
+            result = sock.connect_ex((host, port))
+        except OSError as e:
+            result = e.errno
+        if result in (errno.EINPROGRESS, errno.EWOULDBLOCK, errno.EALREADY, 10035):
+            self.selector.register(sock, selectors.EVENT_WRITE)
+            return sock, None
+
+        sock.close()
+        return None, (classify(result), result)
+
+    def poll(self, timeout):
+        completed = []
+        for key, _ in self.selector.select(timeout):
+            sock = key.fileobj
+            result = sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+            self.selector.unregister(sock)
+            sock.close()
+            completed.append((sock, classify(result), result))
+        return completed
+
+    def cancel(self, token):
+        try:
+            self.selector.unregister(token)
+        except (KeyError, ValueError):
+            pass
+        token.close()
+
+    def close(self):
+        for key in list(self.selector.get_map().values()):
+            self.cancel(key.fileobj)
+        self.selector.close()
+
+
+class ThreadedTransport(Transport):
+    """Blocking ConnectProber probes on a thread pool
+
+    Used where non-blocking connect results cannot be read reliably from a
+    selector (Windows reports refused connects only through select's
+    exception set).
+    """
+
+    def __init__(self, prober=None, workers=100):
+        from concurrent.futures import ThreadPoolExecutor
+        self.prober = prober or ConnectProber()
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        self.completed = queue.Queue()
+        self.cancelled = set()
+        self._next_token = 0
+
+    def _probe(self, token, host, port, family):
+        try:
+            state, error = self.prober.probe(host, port, family)
+        except ResourceExhausted:
+            state, error = EXHAUSTED, errno.EADDRNOTAVAIL
+        self.completed.put((token, state, error))
+
+    def open(self, host, port, family=None):
+        self._next_token += 1
+        token = self._next_token
+        self.executor.submit(self._probe, token, host, port, family)
+        return token, None
+
+    def poll(self, timeout):
+        completed = []
+        try:
+            item = self.completed.get(timeout=timeout) if timeout > 0 else self.completed.get_nowait()
+        except queue.Empty:
+            return completed
+        while True:
+            if item[0] not in self.cancelled:
+                completed.append(item)
+            else:
+                self.cancelled.discard(item[0])
+            try:
+                item = self.completed.get_nowait()
+            except queue.Empty:
+                return completed
+
+    def cancel(self, token):
+        # The worker's own timeout ends the connect; its result is discarded
+        self.cancelled.add(token)
+
+    def close(self):
+        try:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+        except TypeError:
+            self.executor.shutdown(wait=False)
+
+
+def default_transport(prober=None, workers=100):
+    """Best real-network transport for this platform"""
+    if sys.platform.startswith('win'):
+        return ThreadedTransport(prober, workers)
+    return SocketTransport(prober)